@@ -5,16 +5,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from .config import Config
+from .metrics import init_metrics
+from .mongo_mirror import MongoMirror
+from .sqlite_profile import init_sqlite_profile
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+mirror = MongoMirror()
 
 # Project root folder (stroke-risk-app)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-def create_app():
+def create_app(config_overrides=None):
     # Explicitly tell Flask where templates and static are located
     app = Flask(
         __name__,
@@ -24,11 +28,21 @@ def create_app():
     )
 
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
+    mirror.init_app(app)
+
+    # SQLite performance profile (WAL, cache size, busy timeout...)
+    # on both binds, applied to each new connection
+    with app.app_context():
+        init_sqlite_profile(app, db)
+        # Request latency, SQL per request, slow-request log (/metrics)
+        init_metrics(app, db)
 
     login_manager.login_view = "main.login"
     login_manager.login_message_category = "warning"
@@ -37,17 +51,33 @@ def create_app():
     from .routes import main_bp
     app.register_blueprint(main_bp)
 
-    # Create database and default admin
-    from .models import User
+    # JSON API (bulk patient writes); authenticated by token or
+    # session and JSON-only, so the form CSRF check does not apply
+    from .api import api_bp
+    csrf.exempt(api_bp)
+    app.register_blueprint(api_bp)
 
-    with app.app_context():
-        db.create_all()
-
-        # Default admin user
-        if not User.query.first():
-            admin = User(username="admin")
-            admin.set_password("admin123")
-            db.session.add(admin)
-            db.session.commit()
+    from .models import configure_user_cache
+    configure_user_cache(app.config["USER_CACHE_TTL"], app.config["USER_CACHE_SIZE"])
+
+    # Size the in-process prediction cache and load the model
+    from .ml import configure_model, configure_prediction_cache, warm_up_model
+    configure_prediction_cache(app.config["PREDICTION_CACHE_SIZE"])
+    configure_model(
+        app.config["MODEL_PATH"],
+        app.config["MODEL_PREFER_COMPACT"],
+        app.config["MODEL_RELOAD_INTERVAL"],
+    )
+    if app.config["MODEL_PRELOAD"]:
+        try:
+            warm_up_model()
+        except Exception:
+            # Predictions will retry (and report) the load lazily
+            app.logger.exception("Model warm-up failed")
+
+    # Tables and the default admin are created by the CLI
+    # (flask init-db / flask seed-admin, see cli.py), not on startup
+    from .cli import init_cli
+    init_cli(app)
 
     return app
@@ -0,0 +1,278 @@
+#===========================================================================
+#JSON API for upstream systems: bulk create, update and delete patients.
+
+#  POST   /api/v1/patients/bulk   [{patient}, ...]            create
+#  PUT    /api/v1/patients/bulk   [{"id": 1, patient}, ...]   update
+#  DELETE /api/v1/patients/bulk   {"ids": [1, 2, ...]}        delete
+
+#Items are validated with the same rules as PatientForm. Each request is
+#committed in one transaction, together with its dashboard statistics
+#and risk scores (scored in one batch), and mirrored to MongoDB as one
+#bulk operation. The response reports every item by its index: its id,
+#or its validation errors. Invalid items are skipped unless ?atomic=1,
+#in which case nothing is written if any item fails.
+
+#Authentication: "Authorization: Bearer <token>" with a token from
+#API_TOKENS, or a logged-in session. The blueprint is exempt from the
+#form CSRF check, so writes must be sent as application/json, which a
+#cross-site HTML form cannot do.
+#===========================================================================
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from werkzeug.datastructures import MultiDict
+
+from . import db, mirror, stats
+from .forms import PatientForm
+from .ml import invalidate_prediction, score_patients
+from .models import Patient
+from .mongo_db import patient_document, tombstone_document
+from .mongo_mirror import DELETE, UPSERT
+
+api_bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+PATIENT_FIELDS = (
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+)
+
+
+def _error(message, status):
+    return jsonify(error=message), status
+
+
+@api_bp.before_request
+def _authenticate():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        token = header[len("Bearer "):].encode()
+        if any(hmac.compare_digest(token, t.encode()) for t in current_app.config["API_TOKENS"]):
+            return None
+        return _error("Invalid API token.", 401)
+    if current_user.is_authenticated:
+        return None
+    return _error("Authentication required.", 401)
+
+
+# ---------------------------
+# Request parsing and validation
+# ---------------------------
+def _items(key):
+    """
+    The JSON array from the body (bare, or under key). Returns
+    (items, None) or (None, error response).
+    """
+    if not request.is_json:
+        return None, _error("Expected a JSON body (Content-Type: application/json).", 415)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get(key)
+    if not isinstance(body, list):
+        return None, _error(f"Expected a JSON array or an object with a '{key}' array.", 400)
+    max_items = current_app.config["API_MAX_BATCH_SIZE"]
+    if len(body) > max_items:
+        return None, _error(f"At most {max_items} items per request.", 413)
+    return body, None
+
+
+def _form_value(value):
+    # PatientForm parses form strings: booleans become the "0"/"1" choices
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+def validate_patient(item, allowed_extra=()):
+    """
+    Validate one JSON object with PatientForm's rules. Returns
+    (column values, None) or (None, {field: [messages]}).
+    """
+    if not isinstance(item, dict):
+        return None, {"item": ["Expected a JSON object."]}
+    unknown = set(item) - set(PATIENT_FIELDS) - set(allowed_extra)
+    formdata = MultiDict({
+        name: _form_value(item[name]) for name in PATIENT_FIELDS if name in item
+    })
+    form = PatientForm(formdata=formdata, meta={"csrf": False})
+    errors = {} if form.validate() else dict(form.errors)
+    for name in sorted(unknown):
+        errors[name] = ["Unknown field."]
+    if errors:
+        return None, errors
+    return form.patient_values(), None
+
+
+def _respond(results, written, atomic):
+    """
+    200 if every item succeeded, 207 if some were written and some
+    failed, 422 if nothing was written because of errors.
+    """
+    failed = sum(1 for r in results if "errors" in r)
+    if failed and (atomic or not written):
+        status = 422
+    else:
+        status = 207 if failed else 200
+    return jsonify(written=written, failed=failed, results=results), status
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _atomic():
+    return request.args.get("atomic") in ("1", "true")
+
+
+def _commit(patients, deltas, mirror_ops):
+    """
+    Score, flush, build the Mongo documents, then commit once.
+    The documents and ids are read before the commit expires the
+    rows, so no row is loaded again. Returns the patients' ids.
+    """
+    if patients:
+        try:
+            score_patients(patients)
+        except Exception:
+            # A failing model must never block saving the records
+            current_app.logger.exception("Could not score %d patients", len(patients))
+    stats.apply_deltas(db.session, deltas)
+    db.session.flush()
+    ids = [p.id for p in patients]
+    ops = [(UPSERT, p.id, patient_document(p)) for p in patients] + mirror_ops
+    db.session.commit()
+    mirror.enqueue_many(ops)
+    return ids
+
+
+# ---------------------------
+# Bulk create
+# ---------------------------
+@api_bp.route("/patients/bulk", methods=["POST"])
+def bulk_create():
+    items, error = _items("patients")
+    if error:
+        return error
+
+    results, created = [], []
+    deltas = stats.new_deltas()
+    for index, item in enumerate(items):
+        values, errors = validate_patient(item)
+        if errors:
+            results.append({"index": index, "errors": errors})
+            continue
+        patient = Patient(**values)
+        stats.add_patient(deltas, stats.snapshot(patient))
+        created.append(patient)
+        results.append({"index": index, "patient": patient})
+
+    if _atomic() and len(created) < len(items):
+        created = []
+    ids = iter(())
+    if created:
+        db.session.add_all(created)
+        ids = iter(_commit(created, deltas, []))
+    for result in results:
+        # Valid items get their new id, in order (none if rolled back)
+        if result.pop("patient", None) is not None and created:
+            result["id"] = next(ids)
+    return _respond(results, len(created), _atomic())
+
+
+# ---------------------------
+# Bulk update
+# ---------------------------
+@api_bp.route("/patients/bulk", methods=["PUT"])
+def bulk_update():
+    """Replace all fields of existing patients (like the edit form)."""
+    items, error = _items("patients")
+    if error:
+        return error
+
+    # Read the rows inside the write transaction (see stats.lock_for_write)
+    stats.lock_for_write(db.session)
+    ids = [item.get("id") for item in items if isinstance(item, dict)]
+    existing = {p.id: p for p in Patient.query.filter(Patient.id.in_([i for i in ids if _is_id(i)]))}
+
+    results, updated, seen = [], [], set()
+    deltas = stats.new_deltas()
+    for index, item in enumerate(items):
+        values, errors = validate_patient(item, allowed_extra=("id",))
+        patient_id = item.get("id") if isinstance(item, dict) else None
+        patient = existing.get(patient_id) if _is_id(patient_id) else None
+        if errors is None and patient is None:
+            errors = {"id": ["No patient with this id."]}
+        elif errors is None and patient_id in seen:
+            errors = {"id": ["Duplicate id in this request."]}
+        if errors:
+            results.append({"index": index, "errors": errors})
+            continue
+        seen.add(patient_id)
+        results.append({"index": index, "id": patient_id})
+        updated.append((patient, values))
+
+    if _atomic() and len(updated) < len(items):
+        updated = []
+    patients = []
+    for patient, values in updated:
+        stats.remove_patient(deltas, stats.snapshot(patient))
+        for name, value in values.items():
+            setattr(patient, name, value)
+        # Set explicitly so the row is not expired by the column's
+        # onupdate expression (the Mongo documents read it)
+        patient.version = (patient.version or 0) + 1
+        stats.add_patient(deltas, stats.snapshot(patient))
+        invalidate_prediction(patient.id)
+        patients.append(patient)
+    if patients:
+        _commit(patients, deltas, [])
+    return _respond(results, len(patients), _atomic())
+
+
+# ---------------------------
+# Bulk delete
+# ---------------------------
+@api_bp.route("/patients/bulk", methods=["DELETE"])
+def bulk_delete():
+    ids, error = _items("ids")
+    if error:
+        return error
+
+    stats.lock_for_write(db.session)
+    existing = {p.id: p for p in Patient.query.filter(Patient.id.in_([i for i in ids if _is_id(i)]))}
+
+    results, deleted, seen = [], [], set()
+    for index, patient_id in enumerate(ids):
+        if not _is_id(patient_id) or patient_id not in existing:
+            results.append({"index": index, "errors": {"id": ["No patient with this id."]}})
+        elif patient_id in seen:
+            results.append({"index": index, "errors": {"id": ["Duplicate id in this request."]}})
+        else:
+            seen.add(patient_id)
+            deleted.append(existing[patient_id])
+            results.append({"index": index, "id": patient_id})
+
+    if _atomic() and len(deleted) < len(ids):
+        deleted = []
+    if deleted:
+        deltas = stats.new_deltas()
+        for patient in deleted:
+            stats.remove_patient(deltas, stats.snapshot(patient))
+            db.session.delete(patient)
+        deleted_ids = [patient.id for patient in deleted]
+        tombstones = [(DELETE, patient.id, tombstone_document(patient)) for patient in deleted]
+        _commit([], deltas, tombstones)
+        for patient_id in deleted_ids:
+            invalidate_prediction(patient_id)
+    return _respond(results, len(deleted), _atomic())
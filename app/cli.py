@@ -0,0 +1,74 @@
+#===========================================================================
+#Flask CLI commands for one-off database setup.
+
+#create_app() does no schema work, so every worker, test and script
+#starts without touching the databases. Run these once per install
+#(and init-db again after model changes):
+
+#  flask --app run init-db      create missing tables, columns, indexes
+#  flask --app run seed-admin   create the default admin user
+#===========================================================================
+import click
+from flask.cli import with_appcontext
+
+from . import db
+
+
+def init_db():
+    """
+    Create missing tables on both binds and bring existing ones up to
+    date (see schema.py), then fill the dashboard statistics if their
+    table is empty. Returns the list of changes made.
+    """
+    from .schema import ensure_sql_schema
+    from .stats import ensure_stats
+
+    changes = ensure_sql_schema()
+    if ensure_stats():
+        changes.append("computed patient_stats from the patients table")
+    return changes
+
+
+def seed_admin(username="admin", password="admin123"):
+    """
+    Create the admin user unless a user with that name exists.
+    Returns True if a user was created.
+    """
+    from .models import User
+
+    if User.query.filter_by(username=username).first() is not None:
+        return False
+    admin = User(username=username)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the SQLite tables and indexes."""
+    changes = init_db()
+    for change in changes:
+        click.echo(f"SQLite: {change}")
+    if not changes:
+        click.echo("SQLite: schema and indexes are up to date.")
+
+
+@click.command("seed-admin")
+@with_appcontext
+@click.option("--username", default="admin", show_default=True)
+@click.option("--password", default="admin123", envvar="ADMIN_PASSWORD",
+              help="Password for a new user (default admin123, or $ADMIN_PASSWORD).")
+def seed_admin_command(username, password):
+    """Create the admin user if it does not exist."""
+    if seed_admin(username, password):
+        click.echo(f"Created user '{username}'.")
+    else:
+        click.echo(f"User '{username}' already exists.")
+
+
+def init_cli(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_admin_command)
@@ -14,12 +14,99 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # MongoDB connection URI for secondary patient document storage
     MONGO_URI = os.environ.get("MONGO_URI") or "mongodb://localhost:27017/stroke_app"
+    # One pooled MongoClient is shared per process (see mongo_db.py)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 2000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 2000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 5000))
+    # Seconds between real pings for the /health endpoint
+    MONGO_HEALTH_CHECK_INTERVAL = float(os.environ.get("MONGO_HEALTH_CHECK_INTERVAL", 10))
+
+    # Write-behind SQL -> Mongo mirroring (see mongo_mirror.py).
+    # With MONGO_MIRROR_ASYNC off, each write is flushed in the request.
+    MONGO_MIRROR_ASYNC = os.environ.get("MONGO_MIRROR_ASYNC", "1") == "1"
+    MONGO_MIRROR_QUEUE_SIZE = int(os.environ.get("MONGO_MIRROR_QUEUE_SIZE", 10000))
+    MONGO_MIRROR_BATCH_SIZE = int(os.environ.get("MONGO_MIRROR_BATCH_SIZE", 500))
+    MONGO_MIRROR_FLUSH_INTERVAL = float(os.environ.get("MONGO_MIRROR_FLUSH_INTERVAL", 1.0))
+    MONGO_MIRROR_MAX_RETRIES = int(os.environ.get("MONGO_MIRROR_MAX_RETRIES", 3))
+    MONGO_MIRROR_RETRY_BACKOFF = float(os.environ.get("MONGO_MIRROR_RETRY_BACKOFF", 0.5))
+    MONGO_MIRROR_SPILL_PATH = os.environ.get("MONGO_MIRROR_SPILL_PATH") or str(
+        BASE_DIR / "instance" / "mongo_mirror_spill.jsonl"
+    )
 
     # Second database (used for patient records)
     SQLALCHEMY_BINDS = {
         "patients": "sqlite:///" + str(BASE_DIR / "instance" / "patients.db"),
     }
 
+    # SQLite engine profile applied to every new connection
+    # (see sqlite_profile.py). Set SQLITE_PROFILE=0 to use SQLite defaults.
+    SQLITE_PROFILE_ENABLED = os.environ.get("SQLITE_PROFILE", "1") == "1"
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # KiB, about 16 MB per connection
+        "mmap_size": 134217728,  # 128 MB
+        "busy_timeout": 5000,  # ms
+        "temp_store": "MEMORY",
+    }
+    # Per-bind overrides, keyed by bind key (None = auth.db)
+    SQLITE_BIND_PRAGMAS = {
+        "patients": {"cache_size": -64000, "mmap_size": 268435456},
+    }
+
+    # Patient list: keyset page size and risk band cut-offs
+    # (low < first <= medium < second <= high) on risk_probability
+    PATIENTS_PAGE_SIZE = int(os.environ.get("PATIENTS_PAGE_SIZE", 50))
+    PATIENTS_MAX_PAGE_SIZE = 500
+    RISK_BAND_THRESHOLDS = (0.2, 0.5)
+    # ETag / Last-Modified and 304 answers on the patient pages
+    # (see http_cache.py)
+    CONDITIONAL_GET_ENABLED = os.environ.get("CONDITIONAL_GET", "1") == "1"
+    # Rows fetched per database round trip by the streaming exports
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+    # Trained model bundle; relative paths are resolved against BASE_DIR
+    MODEL_PATH = os.environ.get("MODEL_PATH") or str(BASE_DIR / "models" / "stroke_model.joblib")
+    # Use the compact .json/.npy artifact next to MODEL_PATH when it is
+    # present and up to date (no unpickling, no sklearn import)
+    MODEL_PREFER_COMPACT = os.environ.get("MODEL_PREFER_COMPACT", "1") == "1"
+    # Load and warm up the model in create_app() instead of on the first
+    # prediction (so a preloading gunicorn master shares it with workers)
+    MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "1") == "1"
+    # Seconds between checks of the model file for a new version, which
+    # is then loaded in the background and swapped in (0 = never)
+    MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", 30))
+    # JSON API (see api.py): bearer tokens for upstream systems
+    # (comma-separated; a logged-in session also works) and the
+    # maximum number of patients per bulk request
+    API_TOKENS = tuple(
+        token.strip() for token in os.environ.get("API_TOKENS", "").split(",") if token.strip()
+    )
+    API_MAX_BATCH_SIZE = int(os.environ.get("API_MAX_BATCH_SIZE", 1000))
+    # Users allowed to use the admin endpoints (e.g. model reload)
+    ADMIN_USERNAMES = tuple(
+        name.strip() for name in os.environ.get("ADMIN_USERNAMES", "admin").split(",") if name.strip()
+    )
+
+    # Request/SQL/Mongo/model instrumentation exposed on /metrics
+    # (see metrics.py). Scrapes must send "Authorization: Bearer
+    # <METRICS_TOKEN>"; without a token /metrics is only served in
+    # debug and testing.
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+    # Log requests slower than this many seconds (0 = off)
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_THRESHOLD", 1.0))
+
+    # Flask-Login user loader cache (see models.py): seconds a loaded
+    # user is reused without querying auth.db (0 disables the cache)
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+
+    # Maximum number of cached stroke predictions (0 disables the cache)
+    PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 1024))
+
     # ----------------------------
     # Secure Session Configuration
     # ----------------------------
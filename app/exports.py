@@ -0,0 +1,90 @@
+#===========================================================================
+#Streaming exports of patient records (CSV and NDJSON).
+
+#Rows are selected as plain column tuples (no ORM objects) and read from
+#SQLite in batches with yield_per, and output is produced in chunks by a
+#generator. Memory stays flat whatever the size of the table.
+#===========================================================================
+import csv
+import io
+import json
+from datetime import datetime
+
+from .models import Patient
+
+EXPORT_COLUMNS = [
+    "id",
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+    "created_at",
+]
+PREDICTION_COLUMNS = [
+    "risk_probability",
+    "risk_label",
+    "scored_model_version",
+    "scored_at",
+]
+
+
+def export_columns(include_predictions=False):
+    return EXPORT_COLUMNS + (PREDICTION_COLUMNS if include_predictions else [])
+
+
+def iter_export_rows(query, columns, batch_size=1000):
+    """
+    Yield one dict per patient, ordered by id, fetching batch_size
+    rows at a time from the database.
+    """
+    query = (
+        query.with_entities(*[getattr(Patient, name) for name in columns])
+        .order_by(Patient.id.asc())
+        .yield_per(batch_size)
+    )
+    for row in query:
+        yield {name: _plain(value) for name, value in zip(columns, row)}
+
+
+def _plain(value):
+    # Booleans as 0/1 like the source dataset, datetimes as ISO 8601
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(rows, columns, rows_per_chunk=500):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, rows_per_chunk=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row))
+        if len(lines) >= rows_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
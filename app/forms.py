@@ -117,3 +117,22 @@ class PatientForm(FlaskForm):
 
     submit = SubmitField("Save")
 
+    def patient_values(self):
+        """
+        Validated data as Patient column values (0/1 flags as ints,
+        an empty stroke label as None).
+        """
+        stroke = self.stroke.data
+        return {
+            "gender": self.gender.data,
+            "age": self.age.data,
+            "hypertension": int(self.hypertension.data),
+            "heart_disease": int(self.heart_disease.data),
+            "ever_married": self.ever_married.data,
+            "work_type": self.work_type.data,
+            "residence_type": self.residence_type.data,
+            "avg_glucose_level": self.avg_glucose_level.data,
+            "bmi": self.bmi.data,
+            "smoking_status": self.smoking_status.data,
+            "stroke": None if stroke in (None, "", "None") else int(stroke),
+        }
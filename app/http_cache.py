@@ -0,0 +1,75 @@
+#===========================================================================
+#Conditional GET support (ETag / Last-Modified) for the patient pages.
+
+#A page's ETag is a hash of everything its HTML depends on: the row ids
+#and versions shown, the model version, the query string, the logged-in
+#user and the session's CSRF secret (forms embed a CSRF token). Views
+#compute it from a cheap query and call not_modified() before doing any
+#rendering or prediction work; a matching If-None-Match (or, for pages
+#with a Last-Modified date, If-Modified-Since) gets an empty 304.
+
+#Responses are marked "Cache-Control: private, no-cache": browsers keep
+#them but revalidate on every use, so a change is never served stale.
+#Pages with pending flash messages are never answered with 304.
+#===========================================================================
+import hashlib
+import time
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+
+def make_etag(*parts):
+    """Weak ETag value (without quotes) for the given parts."""
+    digest = hashlib.sha1()
+    for part in _request_parts() + parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _request_parts():
+    # Re-render at least every half CSRF lifetime so a revalidated page
+    # never carries an expired token
+    time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    csrf_window = int(time.time() // (time_limit / 2)) if time_limit else None
+    return (
+        request.full_path,
+        current_user.get_id(),
+        getattr(current_user, "username", None),
+        session.get("csrf_token"),
+        csrf_window,
+    )
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Return a 304 response if the client's copy is current, else None.
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110).
+    """
+    if not current_app.config.get("CONDITIONAL_GET_ENABLED", True):
+        return None
+    if session.get("_flashes"):
+        return None
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+
+    response = current_app.response_class(status=304)
+    return add_validators(response, etag, last_modified)
+
+
+def add_validators(response, etag, last_modified=None):
+    if not current_app.config.get("CONDITIONAL_GET_ENABLED", True):
+        return response
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
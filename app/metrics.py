@@ -0,0 +1,444 @@
+#===========================================================================
+#Request-level instrumentation, exposed as Prometheus text on /metrics.
+
+#Recorded per process:
+# http_request_duration_seconds   latency per endpoint, method and status
+# db_statements_per_request       SQL statements run by each request
+# db_time_per_request_seconds     time spent in SQL by each request
+# db_statement_duration_seconds   every SQL statement, per bind
+# mongo_command_duration_seconds  pymongo command monitoring
+# model_load_seconds              model loads (startup and hot reloads)
+# prediction_duration_seconds     predict_for_patient / predict_for_patients
+# user_cache_lookups_total        Flask-Login user cache hits and misses
+# prediction_cache_lookups_total  prediction cache hits and misses
+# prediction_cache_entries        predictions held in the cache
+
+#SQL is timed with SQLAlchemy cursor events on every engine, Mongo with
+#a pymongo CommandListener registered on the shared MongoClient.
+#Requests slower than SLOW_REQUEST_THRESHOLD seconds are logged with
+#their SQL count and time.
+
+#The metrics live in memory in each process, so with several gunicorn
+#workers every scrape sees the worker that answered it. The prometheus
+#"instance"/"pid" labels of a scrape config tell them apart.
+#===========================================================================
+import bisect
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from pymongo import monitoring
+from sqlalchemy import event
+
+# Default latency buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -------------------------
+# Metric types
+# -------------------------
+# Minimal thread-safe counter, gauge and histogram with labels,
+# rendered in the Prometheus text exposition format (0.0.4).
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._inc(self._key(labels), amount)
+
+    def labels(self, **labels):
+        """Bound child for a fixed label set (skips label checks on hot paths)."""
+        return _BoundCounter(self, self._key(labels))
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._observe(self._key(labels), value)
+
+    def labels(self, **labels):
+        """Bound child for a fixed label set (skips label checks on hot paths)."""
+        return _BoundHistogram(self, self._key(labels))
+
+    def _observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def total(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0.0
+
+    def _render_samples(self, items):
+        lines = []
+        bounds = self.buckets + (float("inf"),)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _BoundHistogram:
+    __slots__ = ("_histogram", "_key")
+
+    def __init__(self, histogram, key):
+        self._histogram = histogram
+        self._key = key
+
+    def observe(self, value):
+        self._histogram._observe(self._key, value)
+
+
+class _BoundCounter:
+    __slots__ = ("_counter", "_key")
+
+    def __init__(self, counter, key):
+        self._counter = counter
+        self._key = key
+
+    def inc(self, amount=1):
+        self._counter._inc(self._key, amount)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request (until the response object is returned).",
+    ("endpoint", "method", "status"),
+))
+REQUEST_SQL_STATEMENTS = REGISTRY.register(Histogram(
+    "db_statements_per_request",
+    "SQL statements executed per request.",
+    ("endpoint",),
+    buckets=COUNT_BUCKETS,
+))
+REQUEST_SQL_SECONDS = REGISTRY.register(Histogram(
+    "db_time_per_request_seconds",
+    "Time spent executing SQL per request.",
+    ("endpoint",),
+))
+SQL_STATEMENT_SECONDS = REGISTRY.register(Histogram(
+    "db_statement_duration_seconds",
+    "Duration of individual SQL statements.",
+    ("bind",),
+    buckets=FAST_BUCKETS + (0.1, 0.5, 1.0),
+))
+MONGO_COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "mongo_command_duration_seconds",
+    "Duration of MongoDB commands (pymongo command monitoring).",
+    ("command", "outcome"),
+))
+MODEL_LOAD_SECONDS = REGISTRY.register(Histogram(
+    "model_load_seconds",
+    "Time to read and validate a model (startup and reloads).",
+    ("format", "outcome"),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+))
+MODEL_INFO = REGISTRY.register(Gauge(
+    "model_info",
+    "Active model version (value is always 1).",
+    ("version", "format"),
+))
+PREDICTION_SECONDS = REGISTRY.register(Histogram(
+    "prediction_duration_seconds",
+    "predict_for_patient (single) and predict_for_patients (batch) latency.",
+    ("kind",),
+    buckets=FAST_BUCKETS + (0.1, 0.5, 1.0),
+))
+USER_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "user_cache_lookups_total",
+    "Flask-Login user loader cache lookups by result (hit/miss).",
+    ("result",),
+))
+PREDICTION_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "prediction_cache_lookups_total",
+    "Prediction cache lookups by result (hit/miss).",
+    ("result",),
+))
+PREDICTION_CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "prediction_cache_entries",
+    "Predictions held in the in-process cache (set on each scrape).",
+))
+PREDICTION_ROWS = REGISTRY.register(Counter(
+    "predictions_total",
+    "Patients scored, including prediction cache hits.",
+    ("kind",),
+))
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+# -------------------------
+# Model and prediction hooks
+# -------------------------
+# Called from ml.py, which must not depend on Flask being set up.
+
+def record_model_load(seconds, model_format, ok=True):
+    MODEL_LOAD_SECONDS.observe(seconds, format=model_format, outcome="ok" if ok else "error")
+
+
+def record_active_model(version, model_format):
+    MODEL_INFO.clear()
+    MODEL_INFO.set(1, version=version or "unknown", format=model_format)
+
+
+_PREDICTION_KINDS = {
+    kind: (PREDICTION_SECONDS.labels(kind=kind), PREDICTION_ROWS.labels(kind=kind))
+    for kind in ("single", "batch")
+}
+
+
+def record_prediction(kind, seconds, rows=1):
+    histogram, counter = _PREDICTION_KINDS[kind]
+    histogram.observe(seconds)
+    counter.inc(rows)
+
+
+_USER_CACHE_RESULTS = {
+    True: USER_CACHE_LOOKUPS.labels(result="hit"),
+    False: USER_CACHE_LOOKUPS.labels(result="miss"),
+}
+
+
+def record_user_cache_lookup(hit):
+    _USER_CACHE_RESULTS[hit].inc()
+
+
+_PREDICTION_CACHE_RESULTS = {
+    True: PREDICTION_CACHE_LOOKUPS.labels(result="hit"),
+    False: PREDICTION_CACHE_LOOKUPS.labels(result="miss"),
+}
+
+
+def record_prediction_cache_lookup(hit):
+    _PREDICTION_CACHE_RESULTS[hit].inc()
+
+
+def record_prediction_cache_size(size):
+    PREDICTION_CACHE_ENTRIES.set(size)
+
+
+# -------------------------
+# SQL (SQLAlchemy engine events)
+# -------------------------
+def instrument_engine(engine, bind_key):
+    """
+    Time every statement on the engine and add it to the current
+    request's totals. Start times are kept on the connection, so
+    nested or concurrent connections do not mix up their timings.
+    """
+    statement_seconds = SQL_STATEMENT_SECONDS.labels(bind=bind_key or "default")
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        statement_seconds.observe(elapsed)
+        if has_request_context() and "metrics_sql_count" in g:
+            g.metrics_sql_count += 1
+            g.metrics_sql_seconds += elapsed
+
+    def handle_error(exception_context):
+        # after_cursor_execute does not fire for a failed statement
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_query_start"):
+            conn.info["metrics_query_start"].pop()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+# -------------------------
+# MongoDB (pymongo command monitoring)
+# -------------------------
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Passed to MongoClient(event_listeners=...). Heartbeats and the
+    handshake are not commands, so only real round trips are counted.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name, outcome="ok"
+        )
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name, outcome="error"
+        )
+
+
+# -------------------------
+# Flask request hooks
+# -------------------------
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _after_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # The endpoint name, not the path, keeps label cardinality bounded
+    endpoint = request.endpoint or "unmatched"
+    sql_count = g.pop("metrics_sql_count", 0)
+    sql_seconds = g.pop("metrics_sql_seconds", 0.0)
+
+    REQUEST_LATENCY.observe(
+        elapsed, endpoint=endpoint, method=request.method, status=response.status_code
+    )
+    REQUEST_SQL_STATEMENTS.observe(sql_count, endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(sql_seconds, endpoint=endpoint)
+
+    threshold = current_app.config.get("SLOW_REQUEST_THRESHOLD") or 0
+    if threshold and elapsed >= threshold:
+        current_app.logger.warning(
+            "Slow request: %s %s -> %s in %.3fs (%d SQL statements, %.3fs in SQL)",
+            request.method, request.full_path.rstrip("?"), response.status_code,
+            elapsed, sql_count, sql_seconds,
+        )
+    return response
+
+
+def init_metrics(app, db):
+    """
+    Register the request hooks and the SQL listeners.
+    Must run inside an app context (db.engines needs one).
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    for bind_key, engine in db.engines.items():
+        instrument_engine(engine, bind_key)
@@ -3,73 +3,795 @@
 
 #This module provides:
 #load_model(): loads the trained Logistic Regression model from disk
+#  (the compact .json/.npy artifact if present, else the joblib pickle)
+# ModelRegistry: active model version, hot reload with an atomic swap
 # predict_stroke(): applies the ML model to patient feature data
+# predict_for_patients(): scores a batch of patients in one model call
+# CompiledScorer: pandas-free scorer compiled from the loaded pipeline,
+#  saved to / loaded from the compact artifact without sklearn
+# PredictionCache: versioned LRU cache of recent predictions
+# score_patients(): stores predictions on Patient rows before commit
 
-#The trained model is saved in: models/stroke_model.joblib
-#and is loaded once when predictions are needed.
+#The trained model is saved in: models/stroke_model.joblib (MODEL_PATH
+#in config.py). It is loaded once per process, either when predictions
+#are first needed or at startup by warm_up_model() (MODEL_PRELOAD), and
+#reloaded when the file changes (MODEL_RELOAD_INTERVAL) or on request.
 
 #This file intentionally contains only lightweight ML logic
 #because the full training pipeline is handled separately
-#in scripts/train_model.py.
+#in scripts/train_model.py. pandas, sklearn and joblib are imported
+#only when a joblib bundle is loaded or scored, so importing this
+#module (and app.routes) does not pay for them.
 #=======================================================================
 
+import logging
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import joblib
-import pandas as pd
+import numpy as np
 
+from .metrics import (
+    record_active_model,
+    record_model_load,
+    record_prediction,
+    record_prediction_cache_lookup,
+)
 from .models import Patient
 
-_model = None
-_model_version: Optional[str] = None
+logger = logging.getLogger(__name__)
+
+# Project root folder (stroke-risk-app); relative model paths are
+# resolved against it, not against the current working directory
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODEL_PATH = BASE_DIR / "models" / "stroke_model.joblib"
+
+
+# -------------------------
+# Prediction cache
+# -------------------------
+# Bounded LRU cache of (probability, label) results.
+# The key is the feature tuple plus the model version, so a
+# prediction is reused only while neither the patient's features
+# nor the model have changed. A reverse index (patient id -> key)
+# lets routes evict a patient's entry explicitly after an edit or
+# delete, and a version change drops the whole cache.
+
+class PredictionCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, Tuple[Tuple[float, int], set]]" = OrderedDict()
+        self._patient_keys: Dict[int, tuple] = {}
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(features: dict, version: Optional[str]) -> tuple:
+        return tuple(features[col] for col in FEATURE_COLS) + (version,)
+
+    def get(self, key: tuple) -> Optional[Tuple[float, int]]:
+        with self._lock:
+            if key[-1] != self._version:
+                self._clear_locked()
+                self._version = key[-1]
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        record_prediction_cache_lookup(entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: tuple, result: Tuple[float, int], patient_id: Optional[int] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if key[-1] != self._version:
+                return
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = (result, set())
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+            if patient_id is not None:
+                self._patient_keys[patient_id] = key
+                entry[1].add(patient_id)
+            while len(self._entries) > self.maxsize:
+                self._evict_locked(*self._entries.popitem(last=False))
+                self.evictions += 1
+
+    def invalidate_patient(self, patient_id: int) -> None:
+        with self._lock:
+            key = self._patient_keys.pop(patient_id, None)
+            entry = self._entries.pop(key, None) if key is not None else None
+            if entry is not None:
+                self._evict_locked(key, entry)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_locked()
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > max(maxsize, 0):
+                self._evict_locked(*self._entries.popitem(last=False))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "model_version": self._version,
+            }
+
+    def _evict_locked(self, key: tuple, entry) -> None:
+        for patient_id in entry[1]:
+            if self._patient_keys.get(patient_id) == key:
+                del self._patient_keys[patient_id]
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._patient_keys.clear()
+
+
+_prediction_cache = PredictionCache()
 
 # -------------------------
 # Load the trained ML model
 # -------------------------
-# Returns a loaded Logistic Regression model from joblib.
-# If loading fails, it returns None (handled gracefully in routes).
+# The model is read either from the joblib bundle (sklearn pipeline)
+# or from the compact artifact (stroke_model.json + stroke_model.npy,
+# written by train_model.py), which is read without unpickling
+# anything or importing sklearn, with memory-mapped weights.
+# If no file is found a RuntimeError is raised; routes score
+# inside try blocks and create_app logs a failed warm-up.
 
-def _load_model():
-    global _model, _model_version
-    if _model is not None:
-        return _model
+class LoadedModel:
+    """
+    One loaded model version. Never modified after loading: a reload
+    builds a new LoadedModel and swaps the registry's reference, so a
+    request that already holds the old one finishes with it.
+    """
+
+    def __init__(self, model, scorer, version, source, fingerprint):
+        self.model = model  # pipeline, or the scorer for compact artifacts
+        self.scorer: Optional[CompiledScorer] = scorer
+        self.version: Optional[str] = version
+        self.source: Path = source
+        self.fingerprint = fingerprint
+        self.format = "compact" if model is scorer else "joblib"
+        self.loaded_at = datetime.utcnow()
+        self.load_seconds = 0.0
+        self.warm_up_seconds = 0.0
 
-    model_path = Path("models/stroke_model.joblib")
-    if not model_path.exists():
+    @property
+    def modified_at(self) -> datetime:
+        """Newest mtime of the model file(s), in UTC."""
+        newest_ns = max(mtime_ns for _, mtime_ns in self.fingerprint[1:])
+        return datetime.utcfromtimestamp(newest_ns / 1e9)
+
+
+def _resolve_model_path(path) -> Path:
+    path = Path(path) if path else DEFAULT_MODEL_PATH
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+def _model_source(model_path: Path, prefer_compact: bool) -> Path:
+    """The file to load for model_path: compact header or joblib bundle."""
+    if model_path.suffix == ".json" or not prefer_compact:
+        return model_path
+    header_path, _ = artifact_paths(model_path)
+    if not header_path.exists():
+        return model_path
+    # A bundle retrained without re-exporting must win over an old
+    # artifact. Compare contents, not mtimes: a checkout or a copy can
+    # leave the files in any order.
+    if model_path.exists() and _exported_from(header_path) != _bundle_sha256(model_path):
+        return model_path
+    return header_path
+
+
+def _exported_from(header_path: Path) -> Optional[str]:
+    """sha256 of the bundle the compact artifact was exported from."""
+    try:
+        return json.loads(header_path.read_text()).get("bundle_sha256")
+    except ValueError:
+        return None
+
+
+_bundle_digests: Dict[str, tuple] = {}
+
+
+def _bundle_sha256(path: Path) -> str:
+    """_file_sha256 of a bundle, cached until its size or mtime change."""
+    st = path.stat()
+    key = (st.st_size, st.st_mtime_ns)
+    cached = _bundle_digests.get(str(path))
+    if cached is None or cached[0] != key:
+        cached = _bundle_digests[str(path)] = (key, _file_sha256(path))
+    return cached[1]
+
+
+def _fingerprint(source: Path) -> tuple:
+    """Cheap change detector: path, size and mtime of the source file(s)."""
+    files = [source]
+    if source.suffix == ".json":
+        files.append(artifact_paths(source)[1])
+    stats = [f.stat() for f in files]
+    return (str(source),) + tuple((s.st_size, s.st_mtime_ns) for s in stats)
+
+
+def _read_model(source: Path) -> LoadedModel:
+    if not source.exists():
         raise RuntimeError(
-            f"Model file not found at {model_path}. "
+            f"Model file not found at {source}. "
             "Run scripts/train_model.py first."
         )
-
-    bundle = joblib.load(model_path)
-    if isinstance(bundle, dict) and "pipeline" in bundle:
-        _model = bundle["pipeline"]
-        _model_version = bundle.get("version")
+    fingerprint = _fingerprint(source)
+    started = time.perf_counter()
+    if source.suffix == ".json":
+        scorer, version = CompiledScorer.load(source)
+        model = scorer
     else:
-        _model = bundle
-        _model_version = None
-    return _model
+        import joblib
+
+        bundle = joblib.load(source)
+        if isinstance(bundle, dict) and "pipeline" in bundle:
+            model, version = bundle["pipeline"], bundle.get("version")
+        else:
+            model, version = bundle, None
+        scorer = CompiledScorer.from_pipeline(model)
+    version = _model_version(version, scorer, source)
+    loaded = LoadedModel(model, scorer, version, source, fingerprint)
+    loaded.load_seconds = time.perf_counter() - started
+    return loaded
+
+
+def _model_version(tag: Optional[str], scorer, source: Path) -> str:
+    """
+    The version stored with every prediction: the tag given at training
+    time plus a digest of the weights, e.g. "logreg_v1+3f2a9c1b4d5e".
+    A retrain that keeps the tag still gets a new version, so stored
+    scores and ETags from the old weights are seen as stale. The digest
+    is the same for the compact and joblib forms of one model.
+    """
+    digest = scorer.digest() if scorer is not None else _file_sha256(source)
+    return f"{tag}+{digest[:12]}" if tag else digest[:12]
+
+
+def _validate(loaded: LoadedModel) -> None:
+    """
+    Run a dummy prediction through every scoring path of a freshly
+    loaded model. This rejects broken artifacts before they are
+    swapped in, and warms up the sklearn pipeline's lazy imports.
+    """
+    started = time.perf_counter()
+    features = dict(_WARM_UP_FEATURES)
+    probas = []
+    if loaded.scorer is not None:
+        probas.append(loaded.scorer.predict_proba(features))
+        probas.extend(loaded.scorer.predict_proba_many([features]))
+    if loaded.model is not loaded.scorer:
+        import pandas as pd
+
+        X = pd.DataFrame([features], columns=FEATURE_COLS)
+        probas.extend(loaded.model.predict_proba(X)[:, 1])
+    for proba in probas:
+        if not 0.0 <= float(proba) <= 1.0:
+            raise ValueError(f"Model returned an invalid probability: {proba}")
+    loaded.warm_up_seconds = time.perf_counter() - started
+
+# -------------------------
+# Model registry (hot reload)
+# -------------------------
+# Holds the active LoadedModel. Callers take one reference with
+# current_model() and use it for the whole request, so the swap on
+# reload is a single atomic assignment and in-flight requests are
+# never scored half by the old and half by the new model.
+#
+# With MODEL_RELOAD_INTERVAL set, current_model() stats the model
+# file(s) at most that often; when they changed, the new version is
+# loaded and validated in a background thread while requests keep
+# using the old one. reload_model() (the admin endpoint) does the same
+# synchronously. Each worker process reloads on its own, so the file
+# check is what brings every gunicorn worker to the new version.
+# A swap clears the prediction cache, whose keys carry the version.
+
+class ModelRegistry:
+    def __init__(self):
+        self.path: Path = DEFAULT_MODEL_PATH
+        self.prefer_compact = True
+        self.check_interval: Optional[float] = None
+        self._active: Optional[LoadedModel] = None
+        self._lock = threading.Lock()  # one load at a time
+        self._last_check = 0.0
+        self._reloading = False
+        self._failed_fingerprint = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def configure(self, path, prefer_compact=True, check_interval=None) -> None:
+        path = _resolve_model_path(path)
+        with self._lock:
+            if path != self.path or prefer_compact != self.prefer_compact:
+                self.path = path
+                self.prefer_compact = prefer_compact
+                self._active = None
+            self.check_interval = check_interval or None
+
+    def current(self) -> LoadedModel:
+        active = self._active
+        if active is None:
+            with self._lock:
+                if self._active is None:
+                    self._swap(self._load())
+                active = self._active
+        elif self.check_interval is not None:
+            self._maybe_check(active)
+        return active
+
+    def reload(self) -> LoadedModel:
+        """
+        Load, validate and swap in the model file now. Raises if the
+        new model cannot be loaded; the old one then stays active.
+        """
+        with self._lock:
+            try:
+                loaded = self._load()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            self._swap(loaded)
+            return loaded
+
+    def status(self) -> dict:
+        active = self._active
+        return {
+            "loaded": active is not None,
+            "version": active.version if active else None,
+            "format": active.format if active else None,
+            "source": str(active.source) if active else None,
+            "loaded_at": active.loaded_at.isoformat() if active else None,
+            "reloads": self.reloads,
+            "reload_check_interval": self.check_interval,
+            "last_error": self.last_error,
+        }
+
+    def _load(self) -> LoadedModel:
+        source = _model_source(self.path, self.prefer_compact)
+        started = time.perf_counter()
+        try:
+            loaded = _read_model(source)
+            _validate(loaded)
+        except Exception:
+            model_format = "compact" if source.suffix == ".json" else "joblib"
+            record_model_load(time.perf_counter() - started, model_format, ok=False)
+            raise
+        record_model_load(time.perf_counter() - started, loaded.format)
+        return loaded
+
+    def _swap(self, loaded: LoadedModel) -> None:
+        previous = self._active
+        self._active = loaded
+        record_active_model(loaded.version, loaded.format)
+        self._failed_fingerprint = None
+        self.last_error = None
+        _prediction_cache.clear()
+        if previous is not None:
+            self.reloads += 1
+            logger.info(
+                "Model reloaded: %s -> %s (%s)",
+                previous.version, loaded.version, loaded.source,
+            )
+
+    def _maybe_check(self, active: LoadedModel) -> None:
+        now = time.monotonic()
+        if self._reloading or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            fingerprint = _fingerprint(_model_source(self.path, self.prefer_compact))
+        except OSError:
+            return  # mid-deploy, look again next time
+        if fingerprint in (active.fingerprint, self._failed_fingerprint):
+            return
+        self._reloading = True
+        threading.Thread(
+            target=self._background_reload, args=(fingerprint,),
+            name="model-reload", daemon=True,
+        ).start()
+
+    def _background_reload(self, fingerprint) -> None:
+        try:
+            self.reload()
+        except Exception:
+            # Keep serving the old model; do not retry this same file
+            self._failed_fingerprint = fingerprint
+            logger.exception("Model reload failed, keeping version %s",
+                             self._active.version if self._active else None)
+        finally:
+            self._reloading = False
+
+
+_registry = ModelRegistry()
+
+
+def configure_model(path, prefer_compact: bool = True, reload_interval: Optional[float] = None) -> None:
+    """
+    Set the model file (relative paths are resolved against the project
+    root; a .joblib bundle or the .json header of a compact artifact)
+    and how often to check it for changes (None: never).
+    """
+    _registry.configure(path, prefer_compact, reload_interval)
+
+
+def current_model() -> LoadedModel:
+    return _registry.current()
+
+
+def reload_model() -> LoadedModel:
+    return _registry.reload()
+
+
+def model_status() -> dict:
+    return _registry.status()
+
+
+def _load_model():
+    return _registry.current().model
+
+
+# -------------------------
+# Startup warm-up
+# -------------------------
+# Loading the joblib bundle imports sklearn and unpickles the pipeline,
+# which is what made the first prediction of every worker slow (the
+# compact artifact avoids most of that cost). With
+# MODEL_PRELOAD, create_app() calls this once: under a preloading
+# gunicorn master (see gunicorn.conf.py) the workers are forked after
+# it, so they inherit the loaded model and share its memory pages
+# copy-on-write instead of each loading a private copy.
+
+def warm_up_model() -> dict:
+    """
+    Load the model; loading runs one dummy prediction through the
+    scoring path (and the sklearn pipeline if one was loaded, so its
+    lazy imports are done too).
+    Returns and logs the load time and memory used.
+    """
+    rss_before = _rss_bytes()
+    loaded = current_model()
+    rss_after = _rss_bytes()
+    info = {
+        "path": str(loaded.source),
+        "version": loaded.version,
+        "format": loaded.format,
+        "compiled": loaded.scorer is not None,
+        "load_seconds": loaded.load_seconds,
+        "warm_up_seconds": loaded.warm_up_seconds,
+        "rss_bytes": rss_after,
+        "rss_delta_bytes": (
+            rss_after - rss_before
+            if rss_after is not None and rss_before is not None
+            else None
+        ),
+    }
+    logger.info(
+        "Model %s loaded from %s in %.3fs (warm-up %.3fs), RSS %s (+%s)",
+        info["version"], info["path"], info["load_seconds"],
+        info["warm_up_seconds"], _format_bytes(info["rss_bytes"]),
+        _format_bytes(info["rss_delta_bytes"]),
+    )
+    return info
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident memory of this process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Peak rather than current RSS; KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return "n/a"
+    return f"{value / (1024 * 1024):.1f} MB"
 
 
 def get_model_version() -> Optional[str]:
-    _load_model()
-    return _model_version
+    return current_model().version
 
 # -------------------------
-# Generate Stroke Prediction
+# Compiled (pandas-free) scorer
 # -------------------------
-# Takes a dictionary of patient features and returns:
-#probability of stroke (0 to 1)
-#predicted class (0 or 1)
-# Features are processed into the correct order expected by the model.
-# Missing values (e.g., BMI) are replaced with 0 or defaults
+# The fitted pipeline is only a one-hot encoding followed by a
+# linear model, so it can be "compiled" into plain lookups:
+#  - numeric features -> one weight each
+#  - categorical features -> {category: weight} dicts
+#    (unknown categories contribute 0, like handle_unknown="ignore")
+# A prediction is then a weighted sum plus a sigmoid, which skips
+# the DataFrame and ColumnTransformer overhead entirely.
+
+class CompiledScorer:
+    def __init__(
+        self,
+        numeric_features: List[str],
+        categorical_features: List[str],
+        categories: List[List[str]],
+        coef,
+        intercept: float,
+    ):
+        self.numeric_features = list(numeric_features)
+        self.categorical_features = list(categorical_features)
+        self.categories = [[str(cat) for cat in cats] for cats in categories]
+        self.coef = np.asarray(coef, dtype=float).ravel()
+        self.intercept = float(intercept)
+
+        n_numeric = len(self.numeric_features)
+        n_encoded = sum(len(cats) for cats in categories)
+        if self.coef.shape[0] != n_numeric + n_encoded:
+            raise ValueError(
+                f"Expected {n_numeric + n_encoded} coefficients, "
+                f"got {self.coef.shape[0]}"
+            )
+
+        weights = self.coef.tolist()
+        self._numeric_weights = weights[:n_numeric]
+        self._category_weights: Dict[str, Dict[str, float]] = {}
+        offset = n_numeric
+        for name, cats in zip(self.categorical_features, self.categories):
+            self._category_weights[name] = {
+                cat: weights[offset + i] for i, cat in enumerate(cats)
+            }
+            offset += len(cats)
 
-def predict_for_patient(patient: Patient) -> Tuple[float, int]:
+    @classmethod
+    def from_pipeline(cls, pipeline) -> Optional["CompiledScorer"]:
+        """
+        Build a scorer from a fitted Pipeline(preprocess, clf).
+        Returns None if the pipeline has a shape we cannot compile,
+        in which case callers keep using the sklearn path.
+        """
+        try:
+            from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
 
-    model = _load_model()
+            preprocess = pipeline.named_steps["preprocess"]
+            clf = pipeline.named_steps["clf"]
+            if len(clf.classes_) != 2 or clf.coef_.shape[0] != 1:
+                return None
+
+            numeric, categorical, categories = [], [], []
+            for name, transformer, columns in preprocess.transformers_:
+                if transformer == "drop" or len(columns) == 0:
+                    continue
+                if transformer == "passthrough" or (
+                    isinstance(transformer, FunctionTransformer)
+                    and transformer.func is None
+                ):
+                    if categorical:
+                        # Numeric block must come first in the output
+                        return None
+                    numeric.extend(columns)
+                elif (
+                    isinstance(transformer, OneHotEncoder)
+                    and transformer.drop is None
+                    and transformer.handle_unknown == "ignore"
+                    and getattr(transformer, "infrequent_categories_", None) is None
+                ):
+                    categorical.extend(columns)
+                    categories.extend(list(c) for c in transformer.categories_)
+                else:
+                    return None
+
+            return cls(
+                numeric,
+                categorical,
+                categories,
+                clf.coef_[0],
+                clf.intercept_[0],
+            )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    def digest(self) -> str:
+        """sha256 of the features, categories and weights."""
+        layout = [self.numeric_features, self.categorical_features, self.categories]
+        h = hashlib.sha256(json.dumps(layout).encode())
+        h.update(np.append(self.coef, self.intercept).astype("<f8").tobytes())
+        return h.hexdigest()
+
+    def save(self, path, version: Optional[str] = None) -> Tuple[Path, Path]:
+        """
+        Write the compact artifact next to path (e.g. the .joblib
+        bundle): a .npy file with the coefficients followed by the
+        intercept, and a .json header describing them. The header is
+        written last, so a reader never sees it before its weights.
+        If the bundle exists its sha256 goes into the header, and the
+        artifact is only preferred to that very bundle (_model_source).
+        """
+        header_path, weights_path = artifact_paths(path)
+        bundle_path = Path(path)
+        bundle_sha256 = None
+        if bundle_path not in (header_path, weights_path) and bundle_path.exists():
+            bundle_sha256 = _file_sha256(bundle_path)
+        weights = np.append(self.coef, self.intercept).astype("<f8")
+        np.save(weights_path, weights, allow_pickle=False)
+
+        header = {
+            "format": ARTIFACT_FORMAT,
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "version": version,
+            "feature_cols": FEATURE_COLS,
+            "numeric_features": self.numeric_features,
+            "categorical_features": self.categorical_features,
+            "categories": self.categories,
+            "weights_file": weights_path.name,
+            "n_weights": int(weights.shape[0]),
+            "weights_sha256": _file_sha256(weights_path),
+            "bundle_sha256": bundle_sha256,
+        }
+        tmp_path = header_path.with_name(header_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(header, indent=2))
+        os.replace(tmp_path, header_path)
+        return header_path, weights_path
+
+    @classmethod
+    def load(cls, header_path) -> Tuple["CompiledScorer", Optional[str]]:
+        """
+        Read a compact artifact written by save(). Returns
+        (scorer, model version). Raises ValueError if the header or
+        the weights do not check out.
+        """
+        header_path = Path(header_path)
+        header = json.loads(header_path.read_text())
+        if header.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"{header_path} is not a {ARTIFACT_FORMAT} artifact")
+        if header.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported artifact format version {header.get('format_version')}"
+            )
+        if header.get("feature_cols") != FEATURE_COLS:
+            raise ValueError("Artifact feature order does not match FEATURE_COLS")
+
+        weights_path = header_path.with_name(header["weights_file"])
+        if _file_sha256(weights_path) != header["weights_sha256"]:
+            raise ValueError(f"Checksum mismatch for {weights_path}")
+        weights = np.load(weights_path, mmap_mode="r", allow_pickle=False)
+        if weights.shape != (header["n_weights"],):
+            raise ValueError(f"Unexpected weights shape {weights.shape}")
+
+        scorer = cls(
+            header["numeric_features"],
+            header["categorical_features"],
+            header["categories"],
+            weights[:-1],
+            weights[-1],
+        )
+        return scorer, header.get("version")
 
-    features = {
+    def _decision(self, features: dict) -> float:
+        z = self.intercept
+        for name, weight in zip(self.numeric_features, self._numeric_weights):
+            z += weight * _numeric_value(features, name)
+        for name, lookup in self._category_weights.items():
+            z += lookup.get(features.get(name), 0.0)
+        return z
+
+    def predict_proba(self, features: dict) -> float:
+        """Probability of stroke (class 1) for one feature dict."""
+        z = self._decision(features)
+        if z >= 0:
+            return 1.0 / (1.0 + math.exp(-z))
+        e = math.exp(z)
+        return e / (1.0 + e)
+
+    def predict_proba_many(self, rows: List[dict]) -> np.ndarray:
+        """Vectorized probabilities for a list of feature dicts."""
+        n_numeric = len(self.numeric_features)
+        numeric = np.array(
+            [[_numeric_value(row, name) for name in self.numeric_features] for row in rows],
+            dtype=float,
+        ).reshape(len(rows), n_numeric)
+        categorical = np.array(
+            [
+                sum(
+                    lookup.get(row.get(name), 0.0)
+                    for name, lookup in self._category_weights.items()
+                )
+                for row in rows
+            ],
+            dtype=float,
+        )
+        z = numeric @ self.coef[:n_numeric] + categorical + self.intercept
+        # Numerically stable sigmoid: 1 / (1 + exp(-z))
+        return np.exp(-np.logaddexp(0.0, -z))
+
+
+ARTIFACT_FORMAT = "stroke-linear"
+ARTIFACT_FORMAT_VERSION = 1
+
+
+def artifact_paths(path) -> Tuple[Path, Path]:
+    """(header .json, weights .npy) of the compact artifact for path."""
+    path = Path(path)
+    return path.with_suffix(".json"), path.with_suffix(".npy")
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _numeric_value(features: dict, name: str) -> float:
+    value = features.get(name)
+    if value is None:
+        raise ValueError(f"Missing value for feature '{name}'")
+    value = float(value)
+    if math.isnan(value):
+        raise ValueError(f"Missing value for feature '{name}'")
+    return value
+
+
+FEATURE_COLS = [
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+]
+
+# A typical adult record, only used to exercise the scoring code
+_WARM_UP_FEATURES = {
+    "gender": "Female",
+    "age": 50.0,
+    "hypertension": 0,
+    "heart_disease": 0,
+    "ever_married": "Yes",
+    "work_type": "Private",
+    "residence_type": "Urban",
+    "avg_glucose_level": 100.0,
+    "bmi": 28.0,
+    "smoking_status": "never smoked",
+}
+
+
+def patient_features(patient: Patient) -> dict:
+    return {
         "gender": patient.gender,
         "age": patient.age,
         "hypertension": int(bool(patient.hypertension)),
@@ -82,7 +804,154 @@ def predict_for_patient(patient: Patient) -> Tuple[float, int]:
         "smoking_status": patient.smoking_status,
     }
 
-    X = pd.DataFrame([features])
-    proba = model.predict_proba(X)[0][1]
-    label = int(model.predict(X)[0])
-    return float(proba), label
+# -------------------------
+# Generate Stroke Prediction
+# -------------------------
+# Takes a dictionary of patient features and returns:
+#probability of stroke (0 to 1)
+#predicted class (0 or 1)
+# Features are processed into the correct order expected by the model.
+# Missing values (e.g., BMI) are replaced with 0 or defaults
+
+def predict_for_patient(patient: Patient, loaded: Optional[LoadedModel] = None) -> Tuple[float, int]:
+    loaded = loaded or current_model()
+    started = time.perf_counter()
+    features = patient_features(patient)
+    key = _prediction_cache.make_key(features, loaded.version)
+    cached = _prediction_cache.get(key)
+    if cached is not None:
+        record_prediction("single", time.perf_counter() - started)
+        return cached
+
+    if loaded.scorer is not None:
+        proba = loaded.scorer.predict_proba(features)
+        result = (proba, int(proba > 0.5))
+    else:
+        result = _score_rows(loaded, [features])[0]
+    _prediction_cache.put(key, result, patient.id)
+    record_prediction("single", time.perf_counter() - started)
+    return result
+
+# -------------------------
+# Batch Stroke Prediction
+# -------------------------
+# Scores many patients with one feature frame and a single
+# predict_proba call, so the pandas/sklearn overhead is paid
+# once per batch instead of once per row.
+# Labels are derived from the probabilities (threshold 0.5),
+# which is what LogisticRegression.predict does internally.
+# Cached patients are served from the prediction cache and only
+# the misses are sent to the model.
+
+def predict_for_patients(
+    patients: Iterable[Patient], loaded: Optional[LoadedModel] = None
+) -> List[Tuple[float, int]]:
+    patients = list(patients)
+    if not patients:
+        return []
+
+    loaded = loaded or current_model()
+    started = time.perf_counter()
+    results: List[Optional[Tuple[float, int]]] = [None] * len(patients)
+    misses = []
+    for i, patient in enumerate(patients):
+        features = patient_features(patient)
+        key = _prediction_cache.make_key(features, loaded.version)
+        cached = _prediction_cache.get(key)
+        if cached is None:
+            misses.append((i, key, features))
+        else:
+            results[i] = cached
+
+    if misses:
+        scored = _score_rows(loaded, [features for _, _, features in misses])
+        for (i, key, _), result in zip(misses, scored):
+            results[i] = result
+            _prediction_cache.put(key, result, patients[i].id)
+    record_prediction("batch", time.perf_counter() - started, len(patients))
+    return results
+
+
+def _score_rows(loaded: LoadedModel, rows: List[dict]) -> List[Tuple[float, int]]:
+    if loaded.scorer is not None:
+        probas = loaded.scorer.predict_proba_many(rows)
+    else:
+        import pandas as pd
+
+        X = pd.DataFrame(rows, columns=FEATURE_COLS)
+        probas = loaded.model.predict_proba(X)[:, 1]
+    return [(float(p), int(p > 0.5)) for p in probas]
+
+# -------------------------
+# Stored risk scores
+# -------------------------
+# Writes the prediction onto the Patient rows so list/detail pages
+# can read it without running the model. The caller commits.
+# Rows that cannot be scored (e.g. missing BMI) are still stamped
+# with the model version so backfills do not retry them forever.
+
+def score_patients(patients: Iterable[Patient]) -> int:
+    patients = list(patients)
+    if not patients:
+        return 0
+
+    # One model for the whole batch, even if a reload swaps it meanwhile
+    loaded = current_model()
+    version = loaded.version
+    try:
+        results = predict_for_patients(patients, loaded)
+    except ValueError:
+        # One bad row fails the whole batch, so score row by row
+        results = []
+        for patient in patients:
+            try:
+                results.append(predict_for_patient(patient, loaded))
+            except ValueError:
+                results.append(None)
+
+    now = datetime.utcnow()
+    scored = 0
+    for patient, result in zip(patients, results):
+        if result is None:
+            patient.risk_probability, patient.risk_label = None, None
+        else:
+            patient.risk_probability, patient.risk_label = result
+            scored += 1
+        patient.scored_model_version = version
+        patient.scored_at = now
+    return scored
+
+
+def score_patient(patient: Patient) -> bool:
+    return score_patients([patient]) == 1
+
+
+def stored_prediction(
+    patient: Patient, loaded: Optional[LoadedModel] = None
+) -> Optional[Tuple[float, int]]:
+    """
+    Return the stored (probability, label) if it was produced by the
+    currently loaded model, otherwise None.
+    """
+    if patient.risk_probability is None or patient.scored_at is None:
+        return None
+    loaded = loaded or current_model()
+    if patient.scored_model_version != loaded.version:
+        return None
+    return patient.risk_probability, patient.risk_label
+
+# -------------------------
+# Prediction cache helpers
+# -------------------------
+
+def invalidate_prediction(patient_id: int) -> None:
+    """Drop the cached prediction of a patient that was edited or deleted."""
+    _prediction_cache.invalidate_patient(patient_id)
+
+
+def prediction_cache_stats() -> dict:
+    return _prediction_cache.stats()
+
+
+def configure_prediction_cache(maxsize: int) -> None:
+    _prediction_cache.resize(maxsize)
@@ -1,9 +1,15 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 from flask_login import UserMixin
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.orm import Session, make_transient_to_detached
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from . import db, login_manager
+from .metrics import record_user_cache_lookup
 
 
 class User(UserMixin, db.Model):
@@ -21,14 +27,163 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 
+# -------------------------
+# User loader cache
+# -------------------------
+# Flask-Login loads the user on every authenticated request. The
+# cache keeps a detached copy of each User row for USER_CACHE_TTL
+# seconds; a hit is merged into the request's session without a
+# query (merge(load=False)), so every request works on its own
+# instance and the cached copy is never attached to any session.
+# Entries are dropped when a User row is updated (e.g. a password
+# change) or deleted, both at flush and again after the commit, so
+# a concurrent reload cannot re-cache the old row. Other worker
+# processes see the change when their entry expires.
+
+class UserCache:
+    def __init__(self, ttl: float = 60, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # user id -> (expires_at, detached User)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                record_user_cache_lookup(True)
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+        record_user_cache_lookup(False)
+        return None
+
+    def put(self, user: "User") -> None:
+        if not self.enabled:
+            return
+        # Plain detached copy of the loaded row (column values only)
+        copy = User(**{c.key: getattr(user, c.key) for c in User.__table__.columns})
+        make_transient_to_detached(copy)
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, copy)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def configure(self, ttl: float, maxsize: int) -> None:
+        with self._lock:
+            self.ttl = ttl
+            self.maxsize = maxsize
+            self._entries.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_user_cache = UserCache()
+
+
+def configure_user_cache(ttl: float, maxsize: int) -> None:
+    _user_cache.configure(ttl, maxsize)
+
+
+def user_cache_stats() -> dict:
+    return _user_cache.stats()
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    if _user_cache.enabled:
+        cached = _user_cache.get(user_id)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        _user_cache.put(user)
+    return user
+
+
+def _invalidate_user(mapper, connection, target):
+    _user_cache.invalidate(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("invalidated_user_ids", set()).add(target.id)
+
+
+event.listen(User, "after_update", _invalidate_user)
+event.listen(User, "after_delete", _invalidate_user)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop("invalidated_user_ids", ()):
+        _user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop("invalidated_user_ids", None)
 
 
 class Patient(db.Model):
     __bind_key__ = "patients"  # <-- This model uses patients.db
     __tablename__ = "patients"
+    # Indexes for the list view: (sort column, id) for keyset
+    # pagination, (filter column, id) so an equality filter can still
+    # page on id, and (filter column, sort column, id) for every other
+    # sort under an equality filter. Existing databases get them from
+    # scripts/manage_schema.py (see schema.py).
+    __table_args__ = (
+        db.Index("ix_patients_age_id", "age", "id"),
+        db.Index("ix_patients_created_at_id", "created_at", "id"),
+        db.Index("ix_patients_risk_probability_id", "risk_probability", "id"),
+        db.Index("ix_patients_stroke_id", "stroke", "id"),
+        db.Index("ix_patients_gender_id", "gender", "id"),
+        db.Index("ix_patients_smoking_status_id", "smoking_status", "id"),
+        db.Index("ix_patients_stroke_age_id", "stroke", "age", "id"),
+        db.Index("ix_patients_stroke_created_at_id", "stroke", "created_at", "id"),
+        db.Index("ix_patients_stroke_risk_probability_id", "stroke", "risk_probability", "id"),
+        db.Index("ix_patients_gender_age_id", "gender", "age", "id"),
+        db.Index("ix_patients_gender_created_at_id", "gender", "created_at", "id"),
+        db.Index("ix_patients_gender_risk_probability_id", "gender", "risk_probability", "id"),
+        db.Index("ix_patients_smoking_status_age_id", "smoking_status", "age", "id"),
+        db.Index("ix_patients_smoking_status_created_at_id", "smoking_status", "created_at", "id"),
+        db.Index(
+            "ix_patients_smoking_status_risk_probability_id",
+            "smoking_status", "risk_probability", "id",
+        ),
+        db.Index("ix_patients_scored_model_version", "scored_model_version"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     gender = db.Column(db.String(20))
@@ -43,4 +198,53 @@ class Patient(db.Model):
     smoking_status = db.Column(db.String(50))
     stroke = db.Column(db.Boolean, default=False)  # label in dataset
 
+    # Stored model prediction, filled in when the record is written
+    # (see ml.score_patients and scripts/backfill_risk_scores.py)
+    risk_probability = db.Column(db.Float)
+    risk_label = db.Column(db.Integer)
+    scored_model_version = db.Column(db.String(50))
+    scored_at = db.Column(db.DateTime)
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Row version for conditional GETs (ETag / Last-Modified, see
+    # http_cache.py): 1 on insert, bumped by every UPDATE issued through
+    # the ORM or update(). Bulk upserts must set both explicitly (see
+    # scripts/import_patients.py). NULL on rows older than the columns.
+    version = db.Column(
+        db.Integer, default=1, onupdate=func.coalesce(literal_column("version"), 0) + 1
+    )
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PatientStat(db.Model):
+    """
+    Materialized dashboard counters, one row per (dimension, bucket).
+    Maintained incrementally by app/stats.py.
+    """
+    __bind_key__ = "patients"
+    __tablename__ = "patient_stats"
+
+    dimension = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    strokes = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ImportCheckpoint(db.Model):
+    """
+    Progress of scripts/import_patients.py for one CSV file, written in
+    the same transaction as each chunk, so a resumed import never
+    inserts a committed row twice.
+    """
+    __bind_key__ = "patients"
+    __tablename__ = "import_checkpoints"
+
+    source = db.Column(db.String(500), primary_key=True)  # resolved CSV path
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime = db.Column(db.Float, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    # With --mongo: updated_at of the oldest chunk not yet confirmed
+    # in MongoDB (NULL when the mirror has everything)
+    mongo_pending_since = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,23 +1,84 @@
+import os
+import threading
+import time
+from datetime import datetime
+
 from flask import current_app
-from pymongo import MongoClient, errors
+from pymongo import DeleteOne, MongoClient, UpdateOne, errors
+
+from .metrics import MongoCommandListener
+
+# One MongoClient per process. MongoClient is thread-safe and keeps
+# its own connection pool, so it must be shared rather than rebuilt
+# for every request. It is NOT fork-safe, so a forked worker (e.g.
+# gunicorn with preload) drops the inherited client and builds its own.
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+# Last health check result, reused until it is older than
+# MONGO_HEALTH_CHECK_INTERVAL seconds.
+_health = {"checked_at": None, "ok": None, "error": None}
+_health_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Never close the parent's client here: its sockets are shared
+    # with the parent process. Just forget it.
+    global _client, _client_key
+    _client = None
+    _client_key = None
+    _health.update(checked_at=None, ok=None, error=None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def get_mongo_client():
     """
-    Create and return a MongoClient.
-    MongoDB must be available. If not, the app raises an error immediately.
+    Return the process-wide MongoClient, creating it lazily.
+    No round trip is made here: connection problems surface on the
+    first operation (after MONGO_SERVER_SELECTION_TIMEOUT_MS), and
+    explicit checks go through check_mongo_health().
     """
-    uri = current_app.config["MONGO_URI"]
+    global _client, _client_key
 
-    try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=2000)
-        # Test connection
-        client.admin.command("ping")
+    config = current_app.config
+    key = (os.getpid(), config["MONGO_URI"])
+    client = _client
+    if client is not None and _client_key == key:
         return client
-    except errors.PyMongoError as e:
-        # Hard fail: MongoDB MUST be running
-        current_app.logger.error(f"Cannot connect to MongoDB at {uri}: {e}")
-        raise RuntimeError("MongoDB is required but not available.") from e
+
+    with _client_lock:
+        if _client is None or _client_key != key:
+            if _client is not None and _client_key[0] == key[0]:
+                # Same process, different URI (e.g. tests): replace it
+                _client.close()
+            _client = MongoClient(
+                config["MONGO_URI"],
+                maxPoolSize=config["MONGO_MAX_POOL_SIZE"],
+                minPoolSize=config["MONGO_MIN_POOL_SIZE"],
+                serverSelectionTimeoutMS=config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+                connectTimeoutMS=config["MONGO_CONNECT_TIMEOUT_MS"],
+                socketTimeoutMS=config["MONGO_SOCKET_TIMEOUT_MS"],
+                connect=False,
+                event_listeners=[MongoCommandListener()] if config.get("METRICS_ENABLED", True) else [],
+            )
+            _client_key = key
+        return _client
+
+
+def close_mongo_client():
+    """
+    Close the process-wide client (e.g. on shutdown).
+    """
+    global _client, _client_key
+    with _client_lock:
+        if _client is not None and _client_key[0] == os.getpid():
+            _client.close()
+        _client = None
+        _client_key = None
 
 
 def get_patients_collection():
@@ -27,3 +88,131 @@ def get_patients_collection():
     client = get_mongo_client()
     db = client.get_default_database()
     return db["patients"]
+
+
+# Patient fields copied into each MongoDB document (keyed by sql_id)
+MIRRORED_FIELDS = (
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+    # Row identity and change markers (see http_cache.py, mongo_mirror.py)
+    "version",
+    "created_at",
+    "updated_at",
+)
+
+
+# Stored as Boolean columns in SQL, so mirrored as true/false
+BOOLEAN_FIELDS = ("hypertension", "heart_disease", "stroke")
+
+
+def patient_document(patient):
+    """
+    Build the MongoDB document for a SQL Patient row.
+    """
+    doc = {"sql_id": patient.id}
+    for field in MIRRORED_FIELDS:
+        doc[field] = getattr(patient, field)
+    return doc
+
+
+def document_from_values(sql_id, values):
+    """
+    Build the same document from plain column values (e.g. a parsed
+    CSV row), converting 0/1 flags to booleans like the ORM does.
+    """
+    doc = {"sql_id": sql_id}
+    for field in MIRRORED_FIELDS:
+        value = values.get(field)
+        if field in BOOLEAN_FIELDS and value is not None:
+            value = bool(value)
+        doc[field] = value
+    return doc
+
+
+def tombstone_document(patient):
+    """
+    Document left in place of a deleted patient, so that an older
+    upsert of the same row arriving later cannot bring it back.
+    """
+    now = datetime.utcnow()
+    return {
+        "sql_id": patient.id,
+        "created_at": patient.created_at,
+        "version": patient.version,
+        "deleted": True,
+        "deleted_at": now,  # tombstones expire through a TTL index (schema.py)
+        "updated_at": now,
+    }
+
+
+# Live (not deleted) patient documents
+LIVE_FILTER = {"deleted": {"$ne": True}}
+
+
+# ---------------------------
+# Ordered writes
+# ---------------------------
+# Each worker process mirrors through its own queue, so two writes of
+# the same patient can reach MongoDB in either order. A write only
+# replaces the stored document if it is newer: a later row with the
+# same (reused) id, or a higher version of the same row (created_at
+# tells rows apart). A tombstone beats every version of its row.
+# Implemented as pipeline updates (MongoDB 4.2+), so a stale upsert is
+# a no-op instead of a duplicate key error.
+
+def _replace_if(condition, doc):
+    return [{"$replaceWith": {"$cond": [condition, {"$literal": doc}, "$$ROOT"]}}]
+
+
+def upsert_request(doc):
+    """UpdateOne that stores doc unless MongoDB already has a newer one."""
+    newer = {"$or": [
+        # A missing document or field compares lower than any date
+        {"$lt": ["$created_at", doc.get("created_at")]},
+        {"$and": [
+            {"$eq": ["$created_at", doc.get("created_at")]},
+            {"$ne": ["$deleted", True]},
+            {"$lt": [{"$ifNull": ["$version", 0]}, doc.get("version") or 0]},
+        ]},
+    ]}
+    return UpdateOne({"sql_id": doc["sql_id"]}, _replace_if(newer, doc), upsert=True)
+
+
+def tombstone_request(sql_id, doc):
+    """Write a tombstone over the row and anything older (doc None: plain delete)."""
+    if doc is None or doc.get("created_at") is None:
+        return DeleteOne({"sql_id": sql_id})
+    newer = {"$lte": ["$created_at", doc["created_at"]]}
+    return UpdateOne({"sql_id": sql_id}, _replace_if(newer, doc), upsert=True)
+
+
+def check_mongo_health(force=False):
+    """
+    Ping MongoDB, at most once every MONGO_HEALTH_CHECK_INTERVAL
+    seconds per process. Returns a dict with ok / error / checked_at.
+    """
+    interval = current_app.config["MONGO_HEALTH_CHECK_INTERVAL"]
+
+    with _health_lock:
+        now = time.monotonic()
+        checked_at = _health["checked_at"]
+        if not force and checked_at is not None and now - checked_at < interval:
+            return dict(_health)
+
+        try:
+            get_mongo_client().admin.command("ping")
+            _health.update(ok=True, error=None)
+        except errors.PyMongoError as e:
+            current_app.logger.error(f"MongoDB health check failed: {e}")
+            _health.update(ok=False, error=str(e))
+        _health["checked_at"] = time.monotonic()
+        return dict(_health)
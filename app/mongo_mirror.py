@@ -0,0 +1,427 @@
+#===========================================================================
+#Write-behind mirroring of SQL patient records into MongoDB.
+
+#SQLite stays the source of truth. Routes only enqueue a small
+#operation after their commit; a background thread drains the queue,
+#keeps the last operation per sql_id, and sends each batch to MongoDB
+#with one bulk_write(ordered=False).
+
+#Writes are conditional on the row version and deletes leave a
+#tombstone (see "Ordered writes" in mongo_db.py), so operations from
+#different worker processes may arrive in any order.
+
+#If MongoDB is down, a batch is retried with backoff and then appended
+#to a JSON-lines spill file, which is replayed (ahead of newer
+#operations) on the next flush. Request latency no longer depends
+#on MongoDB. Operations MongoDB rejects for good (e.g. a document
+#failing validation) are logged and dropped instead.
+
+#The spill file is shared by every worker process. Appends and claims
+#hold an exclusive lock on "<spill>.lock" (fcntl.flock, where
+#available). A flush claims the file by renaming it to
+#"<spill>.replaying-<pid>-<n>", keeps a lock on that file while it
+#replays, and only deletes it once every operation was written or
+#spilled again. A replay file whose owner died (its lock is free) is
+#picked up by the next flush in any process.
+#===========================================================================
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process, the thread lock is enough
+    fcntl = None
+
+import bson
+from pymongo import errors
+
+from .mongo_db import (
+    get_patients_collection,
+    patient_document,
+    tombstone_document,
+    tombstone_request,
+    upsert_request,
+)
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+_STOP = object()
+
+# Write error codes worth retrying (interrupted, not primary, write
+# conflicts, timeouts...). Any other write error is permanent.
+TRANSIENT_WRITE_ERRORS = frozenset({
+    6, 7, 50, 89, 91, 112, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436,
+})
+
+
+class MongoMirror:
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._replay_ids = count(1)
+        self._atexit_registered = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushed_ops": 0,
+            "flushed_batches": 0,
+            "retries": 0,
+            "failed_ops": 0,
+            "rejected_ops": 0,
+            "spilled_ops": 0,
+            "replayed_ops": 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # A running worker drains through the app it was started with
+        # before the mirror is bound to another one (tests, benchmarks)
+        self.shutdown()
+        if self._worker_alive():
+            raise RuntimeError("Mongo mirror worker is still flushing, cannot re-initialize")
+        self.app = app
+        config = app.config
+        self.async_enabled = config["MONGO_MIRROR_ASYNC"]
+        self.queue_size = config["MONGO_MIRROR_QUEUE_SIZE"]
+        self.batch_size = config["MONGO_MIRROR_BATCH_SIZE"]
+        self.flush_interval = config["MONGO_MIRROR_FLUSH_INTERVAL"]
+        self.max_retries = config["MONGO_MIRROR_MAX_RETRIES"]
+        self.retry_backoff = config["MONGO_MIRROR_RETRY_BACKOFF"]
+        self.spill_path = Path(config["MONGO_MIRROR_SPILL_PATH"])
+        app.extensions["mongo_mirror"] = self
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    # ---------------------------
+    # Producer side (request threads)
+    # ---------------------------
+    def upsert(self, patient):
+        self.enqueue((UPSERT, patient.id, patient_document(patient)))
+
+    def delete(self, patient):
+        self.enqueue((DELETE, patient.id, tombstone_document(patient)))
+
+    def enqueue(self, op):
+        self.enqueue_many([op])
+
+    def enqueue_many(self, ops):
+        """
+        Queue several operations at once (e.g. a bulk API write). In
+        synchronous mode they are sent as one bulk_write.
+        """
+        if not ops:
+            return
+        self._count("enqueued", len(ops))
+        if not self.async_enabled:
+            self._flush(ops)
+            return
+
+        self._ensure_worker()
+        for i, op in enumerate(ops):
+            try:
+                self._queue.put_nowait(op)
+            except queue.Full:
+                # Never block a request on MongoDB: go straight to disk
+                self.app.logger.warning("Mongo mirror queue full, spilling operations to disk")
+                self._spill(ops[i:])
+                return
+
+    def flush(self, timeout=None):
+        """
+        Block until everything enqueued so far has been flushed
+        (or spilled). Mainly for scripts and tests.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["queue_capacity"] = self.queue_size
+        stats["spill_pending"] = self.spill_path.exists() or any(
+            self.spill_path.parent.glob(self.spill_path.name + ".replaying-*")
+        )
+        return stats
+
+    def shutdown(self, timeout=5.0):
+        if not self._worker_alive():
+            return
+        thread = self._thread
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if not thread.is_alive():
+            # The next operation starts a new worker
+            self._thread = None
+
+    def _worker_alive(self):
+        thread = self._thread
+        return thread is not None and self._pid == os.getpid() and thread.is_alive()
+
+    # ---------------------------
+    # Worker side
+    # ---------------------------
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="mongo-mirror", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        # Replay what this or a dead process left on disk
+        self._flush([])
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            try:
+                op = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                if op is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                else:
+                    batch.append(op)
+            except queue.Empty:
+                pass
+
+            due = time.monotonic() >= deadline
+            if batch and (len(batch) >= self.batch_size or due or stopping):
+                try:
+                    self._flush(batch)
+                except Exception:
+                    self.app.logger.exception("Mongo mirror flush crashed, spilling batch")
+                    self._spill(batch)
+                for _ in batch:
+                    self._queue.task_done()
+                batch = []
+            if due or not batch:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, ops):
+        # Spilled operations are older than anything in this batch, so
+        # they go first and newer operations for the same id win
+        claimed, spilled = self._claim_spill()
+        try:
+            self._write(spilled + list(ops))
+        except BaseException:
+            # The replayed files stay on disk for the next flush
+            self._release_spill(claimed, written=False)
+            raise
+        # Every operation was written or spilled again
+        self._release_spill(claimed, written=True)
+
+    def _write(self, ops):
+        # Keep only the last operation per sql_id, in arrival order
+        latest = OrderedDict()
+        for op in ops:
+            latest.pop(op[1], None)
+            latest[op[1]] = op
+        self._count("coalesced", len(ops) - len(latest))
+
+        pending = list(latest.values())
+        attempt = 0
+        while pending:
+            try:
+                with self.app.app_context():
+                    coll = get_patients_collection()
+                    coll.bulk_write([_to_request(op) for op in pending], ordered=False)
+                self._count("flushed_ops", len(pending))
+                self._count("flushed_batches")
+                pending = []
+            except errors.BulkWriteError as e:
+                # ordered=False: everything except the reported indexes was applied
+                retry, rejected = set(), []
+                for err in e.details.get("writeErrors", []):
+                    if err.get("code") in TRANSIENT_WRITE_ERRORS:
+                        retry.add(err["index"])
+                    else:
+                        rejected.append((pending[err["index"]], err.get("errmsg")))
+                self._reject(rejected)
+                self._count("flushed_ops", len(pending) - len(retry) - len(rejected))
+                pending = [op for i, op in enumerate(pending) if i in retry]
+            except bson.errors.InvalidDocument:
+                # Raised while encoding, before anything was sent: drop
+                # the documents BSON cannot hold and send the rest
+                checked = [(op, _encoding_error(op)) for op in pending]
+                rejected = [(op, str(err)) for op, err in checked if err is not None]
+                if not rejected:
+                    raise
+                self._reject(rejected)
+                pending = [op for op, err in checked if err is None]
+                continue
+            except errors.PyMongoError as e:
+                self.app.logger.warning(f"Mongo mirror flush failed: {e}")
+
+            if not pending:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                self._count("failed_ops", len(pending))
+                self._spill(pending)
+                return
+            self._count("retries")
+            time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    def _reject(self, rejected):
+        """Log and drop operations MongoDB will never accept."""
+        if not rejected:
+            return
+        self._count("rejected_ops", len(rejected))
+        for (action, sql_id, _), reason in rejected:
+            self.app.logger.error(f"Mongo mirror dropped {action} of sql_id {sql_id}: {reason}")
+
+    # ---------------------------
+    # Durable spill file
+    # ---------------------------
+    @contextmanager
+    def _spill_locked(self):
+        """Exclusive access to the spill file, across threads and processes."""
+        with self._spill_lock:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.spill_path.with_name(self.spill_path.name + ".lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, ops):
+        with self._spill_locked():
+            with self.spill_path.open("a", encoding="utf-8") as f:
+                for action, sql_id, doc in ops:
+                    line = json.dumps({"op": action, "sql_id": sql_id, "doc": doc}, default=_encode)
+                    f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._count("spilled_ops", len(ops))
+
+    def _claim_spill(self):
+        """
+        Take the spill file and any orphaned replay files. Returns the
+        claimed (path, open file) pairs, each locked until released,
+        and their operations, oldest first.
+        """
+        pattern = self.spill_path.name + ".replaying-*"
+        if not self.spill_path.exists() and not any(self.spill_path.parent.glob(pattern)):
+            return [], []
+
+        claimed = []
+        with self._spill_locked():
+            # Orphans first: they were claimed before the current file
+            candidates = sorted(self.spill_path.parent.glob(pattern), key=_mtime)
+            if self.spill_path.exists():
+                replay_path = self.spill_path.with_name(
+                    f"{self.spill_path.name}.replaying-{os.getpid()}-{next(self._replay_ids)}"
+                )
+                os.replace(self.spill_path, replay_path)
+                candidates.append(replay_path)
+            for path in candidates:
+                try:
+                    f = path.open("r", encoding="utf-8")
+                except FileNotFoundError:
+                    continue  # replayed and deleted by another process
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        f.close()  # another live flush is replaying it
+                        continue
+                claimed.append((path, f))
+
+        ops = []
+        for path, f in claimed:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line, object_hook=_decode)
+                except ValueError:
+                    # A line cut short by a crash while it was appended
+                    self.app.logger.warning(f"Skipping unreadable line in {path}")
+                    continue
+                ops.append((item["op"], item["sql_id"], item["doc"]))
+
+        if ops:
+            self.app.logger.info(f"Replaying {len(ops)} spilled Mongo mirror operations")
+            self._count("replayed_ops", len(ops))
+        return claimed, ops
+
+    def _release_spill(self, claimed, written):
+        for path, f in claimed:
+            if written:
+                path.unlink(missing_ok=True)
+            f.close()  # also releases the flock
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+
+# Documents carry datetimes (created_at, updated_at), spilled as
+# {"$date": "<ISO 8601>"} like MongoDB extended JSON
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _encoding_error(op):
+    try:
+        bson.encode(op[2] or {})
+    except bson.errors.InvalidDocument as e:
+        return e
+    return None
+
+
+def _to_request(op):
+    action, sql_id, doc = op
+    if action == DELETE:
+        return tombstone_request(sql_id, doc)
+    return upsert_request(doc)
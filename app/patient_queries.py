@@ -0,0 +1,223 @@
+#===========================================================================
+#Query helpers for listing patients.
+
+#This module provides:
+# parse_listing_args(): reads filters, sort and page size from a request
+# apply_filters(): server-side filters (age range, gender, smoking status,
+#   stroke label, risk band)
+# fetch_page(): keyset ("seek") pagination on (sort column, id)
+
+#Keyset pagination never uses OFFSET: each page continues from the last
+#row of the previous one with an indexed range condition, so page N costs
+#the same as page 1. The cursor is an opaque url-safe token holding the
+#sort value and id of that last row.
+#===========================================================================
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from .models import Patient
+
+# sort key -> (column, nullable). Each one is backed by an (column, id)
+# index declared on the Patient model.
+SORT_COLUMNS = {
+    "id": (Patient.id, False),
+    "created_at": (Patient.created_at, False),
+    "age": (Patient.age, True),
+    "risk": (Patient.risk_probability, True),
+}
+
+STROKE_FILTERS = ("0", "1", "unknown")
+RISK_BANDS = ("low", "medium", "high")
+
+# sort key -> the range filters on its column. An index serves a range
+# condition and an order only on the same column, so under one of these
+# filters the page is sorted by that column. Equality filters have a
+# (filter column, sort column, id) index for every sort.
+RANGE_FILTERS = {
+    "age": ("age_min", "age_max"),
+    "risk": ("risk",),
+}
+
+
+# ---------------------------
+# Request parsing
+# ---------------------------
+def parse_listing_args(args, default_page_size, max_page_size):
+    """
+    Clean the query-string arguments of the list view.
+    Unknown or invalid filter values are ignored rather than rejected.
+    Under an age or risk range filter the sort is on that column
+    (see RANGE_FILTERS).
+    """
+    filters = {
+        "age_min": _to_float(args.get("age_min")),
+        "age_max": _to_float(args.get("age_max")),
+        "gender": args.get("gender") or None,
+        "smoking_status": args.get("smoking_status") or None,
+        "stroke": args.get("stroke") if args.get("stroke") in STROKE_FILTERS else None,
+        "risk": args.get("risk") if args.get("risk") in RISK_BANDS else None,
+    }
+
+    sort = args.get("sort") if args.get("sort") in SORT_COLUMNS else "id"
+    ranged = [key for key in RANGE_FILTERS if _range_filtered(filters, key)]
+    if ranged and sort not in ranged:
+        sort = ranged[0]
+    descending = args.get("dir") == "desc"
+
+    page_size = _to_int(args.get("page_size")) or default_page_size
+    page_size = max(1, min(page_size, max_page_size))
+
+    return filters, sort, descending, page_size
+
+
+def _range_filtered(filters, sort):
+    return any(filters.get(name) is not None for name in RANGE_FILTERS.get(sort, ()))
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+# ---------------------------
+# Filters
+# ---------------------------
+def apply_filters(query, filters, risk_thresholds=(0.2, 0.5)):
+    """
+    Apply the cleaned filters to a Patient query.
+    risk_thresholds are the (low/medium, medium/high) cut-offs on the
+    stored risk_probability.
+    """
+    if filters.get("age_min") is not None:
+        query = query.filter(Patient.age >= filters["age_min"])
+    if filters.get("age_max") is not None:
+        query = query.filter(Patient.age <= filters["age_max"])
+    if filters.get("gender"):
+        query = query.filter(Patient.gender == filters["gender"])
+    if filters.get("smoking_status"):
+        query = query.filter(Patient.smoking_status == filters["smoking_status"])
+
+    stroke = filters.get("stroke")
+    if stroke == "unknown":
+        query = query.filter(Patient.stroke.is_(None))
+    elif stroke in ("0", "1"):
+        query = query.filter(Patient.stroke == (stroke == "1"))
+
+    low, high = risk_thresholds
+    risk = filters.get("risk")
+    if risk == "low":
+        query = query.filter(Patient.risk_probability < low)
+    elif risk == "medium":
+        query = query.filter(Patient.risk_probability >= low, Patient.risk_probability < high)
+    elif risk == "high":
+        query = query.filter(Patient.risk_probability >= high)
+
+    return query
+
+
+# ---------------------------
+# Keyset pagination
+# ---------------------------
+def fetch_page(query, sort="id", descending=False, cursor=None, limit=50, filters=None):
+    """
+    Return (rows, next_cursor) for one page ordered by (sort, id).
+
+    Nullable sort columns are read as two segments, NULLs first when
+    ascending and last when descending (SQLite's ordering). Each segment
+    is its own index range scan, so no page ever scans from the start.
+    A range filter on the sort column (filters, as applied to query)
+    already excludes the NULLs, so only the values are read.
+    """
+    column, nullable = SORT_COLUMNS[sort]
+    if filters and _range_filtered(filters, sort):
+        nullable = False
+    if not nullable:
+        segments = ["value"]
+    elif descending:
+        segments = ["value", "null"]
+    else:
+        segments = ["null", "value"]
+
+    start = 0
+    if cursor is not None:
+        if cursor[0] is None and "null" not in segments:
+            return [], None
+        start = segments.index("null" if cursor[0] is None else "value")
+
+    rows = []
+    for i in range(start, len(segments)):
+        segment = segments[i]
+        q = query
+        if segment == "null":
+            q = q.filter(column.is_(None))
+            order = [Patient.id.desc() if descending else Patient.id.asc()]
+        else:
+            if nullable:
+                q = q.filter(column.isnot(None))
+            order = [column.desc(), Patient.id.desc()] if descending else [column.asc(), Patient.id.asc()]
+            if sort == "id":
+                order = order[1:]
+
+        if i == start and cursor is not None:
+            q = q.filter(_after(segment, sort, column, cursor, descending))
+
+        rows.extend(q.order_by(*order).limit(limit + 1 - len(rows)).all())
+        if len(rows) > limit:
+            break
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(sort, rows[-1])
+    return rows, None
+
+
+def _after(segment, sort, column, cursor, descending):
+    value, last_id = cursor
+    if segment == "null" or sort == "id":
+        return Patient.id < last_id if descending else Patient.id > last_id
+    # Row-value comparison: SQLite turns this into an index range
+    if descending:
+        return tuple_(column, Patient.id) < tuple_(value, last_id)
+    return tuple_(column, Patient.id) > tuple_(value, last_id)
+
+
+def encode_cursor(sort, patient):
+    column, _ = SORT_COLUMNS[sort]
+    value = getattr(patient, column.key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, patient.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, sort):
+    """
+    Decode a cursor from encode_cursor(). Raises ValueError if the
+    token is malformed.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, last_id = json.loads(raw)
+        last_id = int(last_id)
+        if value is not None:
+            if sort == "created_at":
+                value = datetime.fromisoformat(value)
+            else:
+                value = float(value)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    return value, last_id
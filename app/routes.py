@@ -7,6 +7,8 @@
 # CRUD operations for Patient records
 # Views that use the trained ML model to display stroke-risk predictions
 #=========================================================================
+import hmac
+
 from flask import (
     Blueprint,
     render_template,
@@ -14,6 +16,12 @@ from flask import (
     url_for,
     flash,
     request,
+    current_app,
+    jsonify,
+    abort,
+    make_response,
+    Response,
+    stream_with_context,
 )
 from flask_login import (
     login_user,
@@ -22,15 +30,60 @@ from flask_login import (
     current_user,
 )
 
-from .models import User, Patient
+from .models import User, Patient, user_cache_stats
 from .forms import LoginForm, PatientForm
-from . import db
-from .ml import predict_for_patient
-from .mongo_db import get_patients_collection
+from . import db, mirror
+from .ml import (
+    current_model,
+    invalidate_prediction,
+    model_status,
+    predict_for_patient,
+    prediction_cache_stats,
+    reload_model,
+    score_patient,
+    stored_prediction,
+)
+from . import stats
+from .http_cache import add_validators, make_etag, not_modified
+from .metrics import record_prediction_cache_size, render_metrics
+from .mongo_db import LIVE_FILTER, check_mongo_health, get_patients_collection
+from .exports import csv_chunks, export_columns, iter_export_rows, ndjson_chunks
+from .patient_queries import (
+    apply_filters,
+    decode_cursor,
+    fetch_page,
+    parse_listing_args,
+)
 
 main_bp = Blueprint("main", __name__)
 
 
+def _model_or_none():
+    """The active model, or None if it cannot be loaded."""
+    try:
+        return current_model()
+    except Exception:
+        current_app.logger.exception("Model unavailable")
+        return None
+
+
+def _row_identity(patient):
+    # SQLite reuses the id of a deleted max-id row, and the new row
+    # starts again at version 1: created_at tells the two rows apart
+    return patient.id, patient.created_at, patient.version
+
+
+def _score_before_commit(patient):
+    """
+    Store the model's risk score on the patient row.
+    A failing model must never block saving the record.
+    """
+    try:
+        score_patient(patient)
+    except Exception:
+        current_app.logger.exception("Could not score patient %s", patient.id)
+
+
 # ---------------------------
 # Root -> redirect to login
 # ---------------------------
@@ -46,6 +99,98 @@ def index():
     return redirect(url_for("main.login"))
 
 
+# ---------------------------
+# Health check
+# ---------------------------
+@main_bp.route("/health")
+def health():
+    """
+    Liveness/readiness endpoint for load balancers. Unauthenticated,
+    so it only says whether MongoDB is reachable; the details are on
+    /admin/status. MongoDB is pinged at most every
+    MONGO_HEALTH_CHECK_INTERVAL seconds.
+    """
+    mongo = check_mongo_health()
+    status = "ok" if mongo["ok"] else "degraded"
+    return jsonify(
+        status=status,
+        mongo={"ok": mongo["ok"]},
+    ), (200 if mongo["ok"] else 503)
+
+
+@main_bp.route("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint (text exposition format) for this
+    worker process. Requires METRICS_TOKEN, except in debug and
+    testing where it may be left unset.
+    """
+    if not current_app.config["METRICS_ENABLED"]:
+        abort(404)
+    token = current_app.config["METRICS_TOKEN"]
+    if not token:
+        if not (current_app.debug or current_app.testing):
+            abort(404)
+    elif not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()
+    ):
+        abort(401)
+    record_prediction_cache_size(prediction_cache_stats()["size"])
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# ---------------------------
+# Admin: diagnostics, model version and reload
+# ---------------------------
+def _require_admin():
+    if current_user.username not in current_app.config["ADMIN_USERNAMES"]:
+        abort(403)
+
+
+@main_bp.route("/admin/status")
+@login_required
+def admin_status():
+    """
+    Diagnostics for this worker process: the Mongo health check and
+    mirror queue, the active model and the user and prediction cache
+    hit rates.
+    """
+    _require_admin()
+    mongo = check_mongo_health()
+    return jsonify(
+        mongo={"ok": mongo["ok"], "error": mongo["error"]},
+        mongo_mirror=mirror.stats(),
+        model=model_status(),
+        user_cache=user_cache_stats(),
+        prediction_cache=prediction_cache_stats(),
+    )
+
+
+@main_bp.route("/admin/model")
+@login_required
+def model_info():
+    _require_admin()
+    return jsonify(model_status())
+
+
+@main_bp.route("/admin/model/reload", methods=["POST"])
+@login_required
+def model_reload():
+    """
+    Load the model file now and swap it in, without a restart.
+    Only this worker process is reloaded; the others pick the new file
+    up within MODEL_RELOAD_INTERVAL seconds. If the new model fails to
+    load or validate, the old one stays active and 500 is returned.
+    """
+    _require_admin()
+    try:
+        reload_model()
+    except Exception as e:
+        current_app.logger.exception("Model reload failed")
+        return jsonify({**model_status(), "error": str(e)}), 500
+    return jsonify(model_status())
+
+
 # ---------------------------
 # Login / Logout
 # ---------------------------
@@ -92,17 +237,18 @@ def logout():
 @login_required
 def dashboard():
     """
-    Simple dashboard showing counts of total patients and
-    those with stroke label = 1.
-    Uses only the SQL (SQLite) database.
+    Dashboard showing counts of total patients, those with
+    stroke label = 1, and breakdowns by cohort.
+    Reads the materialized patient_stats table (see stats.py),
+    so it does not scan the patients table.
     """
-    total_patients = Patient.query.count()
-    stroke_patients = Patient.query.filter_by(stroke=1).count()
+    summary = stats.dashboard_stats()
 
     return render_template(
         "dashboard.html",
-        total_patients=total_patients,
-        stroke_patients=stroke_patients,
+        total_patients=summary["total"],
+        stroke_patients=summary["strokes"],
+        breakdowns=summary["breakdowns"],
     )
 
 
@@ -113,10 +259,93 @@ def dashboard():
 @login_required
 def patients_list():
     """
-    List all patients from the SQL database.
+    List patients from the SQL database one page at a time,
+    with the risk score stored on each row when it was last written.
+    Uses keyset pagination (?after=<cursor>) plus optional filters
+    and sorting, see patient_queries.py.
     """
-    patients = Patient.query.order_by(Patient.id.asc()).all()
-    return render_template("patients_list.html", patients=patients)
+    filters, sort, descending, page_size = parse_listing_args(
+        request.args,
+        current_app.config["PATIENTS_PAGE_SIZE"],
+        current_app.config["PATIENTS_MAX_PAGE_SIZE"],
+    )
+    try:
+        cursor = decode_cursor(request.args.get("after"), sort)
+    except ValueError:
+        abort(400)
+
+    query = apply_filters(
+        Patient.query, filters, current_app.config["RISK_BAND_THRESHOLDS"]
+    )
+    patients, next_cursor = fetch_page(query, sort, descending, cursor, page_size, filters)
+
+    # Rows (and so the ETag) change with any insert, update or delete
+    # on this page; there is no single Last-Modified date for that
+    loaded = _model_or_none()
+    etag = make_etag(
+        [_row_identity(p) for p in patients],
+        next_cursor,
+        loaded.version if loaded else None,
+    )
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    # Keep filters/sort in the pagination links
+    list_args = {k: v for k, v in request.args.items() if k != "after" and v}
+    next_url = None
+    if next_cursor:
+        next_url = url_for("main.patients_list", after=next_cursor, **list_args)
+
+    response = make_response(render_template(
+        "patients_list.html",
+        patients=patients,
+        filters=filters,
+        sort=sort,
+        descending=descending,
+        page_size=page_size,
+        list_args=list_args,
+        next_url=next_url,
+        is_first_page=cursor is None,
+        model_version=loaded.version if loaded else None,
+    ))
+    return add_validators(response, etag)
+
+
+# ---------------------------
+# Export Patients (streaming)
+# ---------------------------
+@main_bp.route("/patients/export.<fmt>")
+@login_required
+def export_patients(fmt):
+    """
+    Stream all patients matching the list-view filters as CSV or
+    NDJSON. Add ?include_predictions=1 for the stored risk scores.
+    """
+    if fmt not in ("csv", "ndjson"):
+        abort(404)
+
+    filters, _, _, _ = parse_listing_args(
+        request.args,
+        current_app.config["PATIENTS_PAGE_SIZE"],
+        current_app.config["PATIENTS_MAX_PAGE_SIZE"],
+    )
+    query = apply_filters(
+        Patient.query, filters, current_app.config["RISK_BAND_THRESHOLDS"]
+    )
+    columns = export_columns(request.args.get("include_predictions") == "1")
+    rows = iter_export_rows(query, columns, current_app.config["EXPORT_BATCH_SIZE"])
+
+    if fmt == "csv":
+        body, mimetype = csv_chunks(rows, columns), "text/csv"
+    else:
+        body, mimetype = ndjson_chunks(rows), "application/x-ndjson"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=patients.{fmt}"},
+    )
 
 
 # ---------------------------
@@ -131,45 +360,15 @@ def create_patient():
     form = PatientForm()
 
     if form.validate_on_submit():
-        patient = Patient(
-            gender=form.gender.data,
-            age=form.age.data,
-            hypertension=int(form.hypertension.data),
-            heart_disease=int(form.heart_disease.data),
-            ever_married=form.ever_married.data,
-            work_type=form.work_type.data,
-            residence_type=form.residence_type.data,
-            avg_glucose_level=form.avg_glucose_level.data,
-            bmi=form.bmi.data,
-            smoking_status=form.smoking_status.data,
-        )
-
-        # Stroke: string -> int or None
-        if form.stroke.data in (None, "", "None"):
-            patient.stroke = None
-        else:
-            patient.stroke = int(form.stroke.data)
+        patient = Patient(**form.patient_values())
 
+        _score_before_commit(patient)
         db.session.add(patient)
+        stats.record_created(patient)
         db.session.commit()
 
-        # Mirror to MongoDB
-        coll = get_patients_collection()
-        if coll is not None:
-            coll.insert_one({
-                "sql_id": patient.id,
-                "gender": patient.gender,
-                "age": patient.age,
-                "hypertension": patient.hypertension,
-                "heart_disease": patient.heart_disease,
-                "ever_married": patient.ever_married,
-                "work_type": patient.work_type,
-                "residence_type": patient.residence_type,
-                "avg_glucose_level": patient.avg_glucose_level,
-                "bmi": patient.bmi,
-                "smoking_status": patient.smoking_status,
-                "stroke": patient.stroke,
-            })
+        # Mirror to MongoDB (write-behind, see mongo_mirror.py)
+        mirror.upsert(patient)
 
         flash("Patient created successfully.", "success")
         return redirect(url_for("main.patients_list"))
@@ -187,20 +386,32 @@ def patient_detail(patient_id):
     """
     patient = Patient.query.get_or_404(patient_id)
 
+    # Answer a revalidation before any prediction or rendering work
+    loaded = _model_or_none()
+    etag = make_etag(_row_identity(patient), loaded.version if loaded else None)
+    last_modified = patient.updated_at or patient.created_at
+    if loaded is not None:
+        last_modified = max(last_modified, loaded.modified_at)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
     prediction = None
     try:
-        prediction = predict_for_patient(patient)
-        # prediction can be a dict like:
-        # {"probability": 0.87, "label": 1}
+        # Use the stored score when it came from the current model,
+        # otherwise fall back to a live (cached) prediction
+        if loaded is not None:
+            prediction = stored_prediction(patient, loaded) or predict_for_patient(patient, loaded)
     except Exception:
         # If ML fails for some reason, we just skip prediction
         prediction = None
 
-    return render_template(
+    response = make_response(render_template(
         "patient_detail.html",
         patient=patient,
         prediction=prediction,
-    )
+    ))
+    return add_validators(response, etag, last_modified)
 
 
 # ---------------------------
@@ -223,46 +434,23 @@ def edit_patient(patient_id):
             form.stroke.data = str(patient.stroke)
 
     if form.validate_on_submit():
-        # Copy simple fields over
-        patient.gender = form.gender.data
-        patient.age = form.age.data
-        patient.hypertension = int(form.hypertension.data)
-        patient.heart_disease = int(form.heart_disease.data)
-        patient.ever_married = form.ever_married.data
-        patient.work_type = form.work_type.data
-        patient.residence_type = form.residence_type.data
-        patient.avg_glucose_level = form.avg_glucose_level.data
-        patient.bmi = form.bmi.data
-        patient.smoking_status = form.smoking_status.data
-
-        # Stroke: string -> int or None
-        if form.stroke.data in (None, "", "None"):
-            patient.stroke = None
-        else:
-            patient.stroke = int(form.stroke.data)
-
+        # Re-read the row inside the write transaction, so a concurrent
+        # edit cannot change the old values the stats delta removes
+        stats.lock_for_write(db.session)
+        db.session.refresh(patient)
+        old_values = stats.snapshot(patient)
+
+        # Copy the validated fields over (stroke "" -> None)
+        for name, value in form.patient_values().items():
+            setattr(patient, name, value)
+
+        invalidate_prediction(patient.id)
+        _score_before_commit(patient)
+        stats.record_updated(old_values, patient)
         db.session.commit()
 
-        # Sync changes to MongoDB
-        coll = get_patients_collection()
-        if coll is not None:
-            coll.update_one(
-                {"sql_id": patient.id},
-                {"$set": {
-                    "gender": patient.gender,
-                    "age": patient.age,
-                    "hypertension": patient.hypertension,
-                    "heart_disease": patient.heart_disease,
-                    "ever_married": patient.ever_married,
-                    "work_type": patient.work_type,
-                    "residence_type": patient.residence_type,
-                    "avg_glucose_level": patient.avg_glucose_level,
-                    "bmi": patient.bmi,
-                    "smoking_status": patient.smoking_status,
-                    "stroke": patient.stroke,
-                }},
-                upsert=True,
-            )
+        # Sync changes to MongoDB (write-behind, see mongo_mirror.py)
+        mirror.upsert(patient)
 
         flash("Patient updated successfully.", "success")
         return redirect(url_for("main.patient_detail", patient_id=patient.id))
@@ -277,17 +465,20 @@ def delete_patient(patient_id):
     """
     Delete a patient from SQLite and from MongoDB.
     """
+    stats.lock_for_write(db.session)
     patient = Patient.query.get_or_404(patient_id)
 
     # Delete from SQLite
+    stats.record_deleted(stats.snapshot(patient))
     db.session.delete(patient)
     db.session.commit()
+    invalidate_prediction(patient_id)
 
-    # Delete from MongoDB
-    coll = get_patients_collection()
-    coll.delete_one({"sql_id": patient_id})
+    # Delete from MongoDB (write-behind, see mongo_mirror.py)
+    mirror.delete(patient)
 
-   
+    flash("Patient deleted successfully.", "success")
+    return redirect(url_for("main.patients_list"))
 
 
 # ---------------------------
@@ -301,6 +492,26 @@ def mongo_patients():
     MongoDB is required, so any connection problem should raise an error.
     """
     coll = get_patients_collection()
-    patients = list(coll.find().sort("sql_id", 1))
 
-    return render_template("mongo_patients.html", patients=patients)
+    # One tiny aggregate instead of fetching every document: count plus
+    # sums of ids and row versions change on most mirrored writes, and
+    # the newest updated_at on the rest (e.g. a deleted row replaced by
+    # a new one with the same id and version)
+    summary = next(coll.aggregate([
+        {"$match": LIVE_FILTER},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "ids": {"$sum": "$sql_id"},
+            "versions": {"$sum": "$version"},
+            "updated_at": {"$max": "$updated_at"},
+        }},
+    ]), None)
+    etag = make_etag({k: v for k, v in (summary or {}).items() if k != "_id"})
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    patients = list(coll.find(LIVE_FILTER).sort("sql_id", 1))
+    response = make_response(render_template("mongo_patients.html", patients=patients))
+    return add_validators(response, etag)
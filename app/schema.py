@@ -0,0 +1,86 @@
+#===========================================================================
+#Schema and index management for the SQLite and MongoDB patient stores.
+
+#db.create_all() only creates missing tables: it never adds columns or
+#indexes to a table that already exists. The functions here bring an
+#existing database up to the current models, idempotently, and create
+#the MongoDB indexes. They are run by scripts/manage_schema.py and
+#"flask init-db" (cli.py), never on a request.
+#===========================================================================
+from pymongo import ASCENDING
+from sqlalchemy import inspect, text
+
+from . import db
+
+# Tombstones of deleted patients (see mongo_db.tombstone_document) only
+# need to outlive the mirror operations that could still arrive late
+MONGO_TOMBSTONE_TTL_SECONDS = 7 * 24 * 3600
+
+# name -> (keys, options) for the Mongo patients collection
+MONGO_PATIENT_INDEXES = {
+    "sql_id_unique": ([("sql_id", ASCENDING)], {"unique": True}),
+    # Only tombstones have deleted_at, so only they expire
+    "tombstone_ttl": ([("deleted_at", ASCENDING)], {"expireAfterSeconds": MONGO_TOMBSTONE_TTL_SECONDS}),
+}
+
+
+def ensure_sql_schema():
+    """
+    Create missing tables, add missing columns and create missing
+    indexes on every bind. Returns a list of the changes made.
+    """
+    changes = []
+    db.create_all()
+
+    for bind_key, engine in db.engines.items():
+        inspector = inspect(engine)
+        for table in db.metadatas[bind_key].sorted_tables:
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+
+            with engine.begin() as conn:
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    # SQLite can only ADD COLUMN nullable columns without defaults
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+                    ))
+                    changes.append(f"added column {table.name}.{column.name}")
+
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=engine, checkfirst=True)
+                    changes.append(f"created index {index.name}")
+    return changes
+
+
+def ensure_mongo_indexes(collection):
+    """
+    Create the Mongo patients indexes (create_index is a no-op when the
+    index already exists). Returns the list of index names.
+    """
+    names = []
+    for name, (keys, options) in MONGO_PATIENT_INDEXES.items():
+        names.append(collection.create_index(keys, name=name, **options))
+    return names
+
+
+def remove_duplicate_sql_ids(collection):
+    """
+    Delete all but the newest document for each sql_id. Needed before
+    the unique index can be built on a collection filled by the old
+    insert_one mirroring. Returns the number of documents removed.
+    """
+    removed = 0
+    pipeline = [
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": "$sql_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    for group in collection.aggregate(pipeline, allowDiskUse=True):
+        result = collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+    return removed
+
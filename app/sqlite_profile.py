@@ -0,0 +1,55 @@
+#===========================================================================
+#SQLite performance profile for the auth.db and patients.db engines.
+
+#SQLite's defaults (rollback journal, small page cache, no busy timeout)
+#make readers and writers block each other under several gunicorn
+#workers. The pragmas from Config.SQLITE_PRAGMAS are applied to every
+#new DBAPI connection through an engine "connect" event:
+
+# journal_mode=WAL     readers no longer block on the writer
+# synchronous=NORMAL   safe with WAL, fsync only at checkpoints
+# cache_size           page cache per connection (negative = KiB)
+# mmap_size            memory-mapped reads
+# busy_timeout         wait for a lock instead of failing at once
+# temp_store=MEMORY    temp tables and sorts in RAM
+
+#SQLITE_BIND_PRAGMAS overrides single values per bind key
+#(None for auth.db, "patients" for patients.db).
+#===========================================================================
+from sqlalchemy import event
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def pragmas_for_bind(config, bind_key):
+    pragmas = dict(config.get("SQLITE_PRAGMAS") or {})
+    pragmas.update((config.get("SQLITE_BIND_PRAGMAS") or {}).get(bind_key, {}))
+    return pragmas
+
+
+def init_sqlite_profile(app, db):
+    """
+    Register the pragma listener on every SQLite engine of the app.
+    Must run inside an app context (db.engines needs one).
+    """
+    if not app.config.get("SQLITE_PROFILE_ENABLED", True):
+        return
+
+    for bind_key, engine in db.engines.items():
+        if engine.dialect.name != "sqlite":
+            continue
+        pragmas = pragmas_for_bind(app.config, bind_key)
+        if not pragmas:
+            continue
+
+        def on_connect(dbapi_connection, connection_record, pragmas=pragmas):
+            apply_pragmas(dbapi_connection, pragmas)
+
+        event.listen(engine, "connect", on_connect)
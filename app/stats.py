@@ -0,0 +1,267 @@
+#===========================================================================
+#Incrementally maintained patient statistics for the dashboard.
+
+#The patient_stats table holds one row per (dimension, bucket), e.g.
+#("gender", "Female") or ("age_band", "60-79"), with the number of
+#patients and of patients labelled with a stroke. ("all", "all") holds
+#the totals.
+
+#Writers (CRUD routes, the CSV importer) apply +1/-1 deltas in the same
+#transaction as the patient change, so the dashboard reads a few dozen
+#rows whatever the size of the patients table. recompute_stats()
+#rebuilds everything from scratch, for verification and repair, and
+#ensure_stats() does so when the table is still empty (created on a
+#database that already had patients).
+
+#An edit or delete removes the row's old values, so they must be read
+#inside the write transaction: pysqlite only opens a transaction at
+#the first INSERT/UPDATE/DELETE, and two concurrent edits could both
+#subtract the same old values. Writers call lock_for_write() (BEGIN
+#IMMEDIATE) before reading the rows they are about to change.
+#===========================================================================
+from collections import defaultdict
+
+from sqlalchemy import func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import Patient, PatientStat
+
+# Dimensions broken down on the dashboard, in display order
+DIMENSIONS = (
+    "age_band",
+    "gender",
+    "smoking_status",
+    "work_type",
+    "hypertension",
+    "heart_disease",
+)
+FLAG_DIMENSIONS = ("hypertension", "heart_disease")
+
+# (lower bound inclusive, upper bound exclusive, label)
+AGE_BANDS = (
+    (0, 18, "0-17"),
+    (18, 40, "18-39"),
+    (40, 60, "40-59"),
+    (60, 80, "60-79"),
+    (80, None, "80+"),
+)
+
+UNKNOWN = "Unknown"
+
+# Patient columns the statistics depend on
+STAT_FIELDS = (
+    "age",
+    "gender",
+    "smoking_status",
+    "work_type",
+    "hypertension",
+    "heart_disease",
+    "stroke",
+)
+
+
+def age_band(age):
+    if age is None:
+        return UNKNOWN
+    for low, high, label in AGE_BANDS:
+        if age >= low and (high is None or age < high):
+            return label
+    return UNKNOWN
+
+
+def _bucket(dimension, value):
+    if dimension == "age_band":
+        return age_band(value)
+    if value is None or value == "":
+        return UNKNOWN
+    if dimension in FLAG_DIMENSIONS:
+        return "Yes" if value else "No"
+    return str(value)
+
+
+def snapshot(patient):
+    """
+    The fields that statistics depend on, taken from a Patient or a
+    plain dict of column values. Use it to remember a row's old values
+    before an edit or delete.
+    """
+    if isinstance(patient, dict):
+        return {name: patient.get(name) for name in STAT_FIELDS}
+    return {name: getattr(patient, name) for name in STAT_FIELDS}
+
+
+def _add(deltas, values, sign):
+    stroke = 1 if values.get("stroke") else 0
+    keys = [("all", "all")]
+    for dimension in DIMENSIONS:
+        source = "age" if dimension == "age_band" else dimension
+        keys.append((dimension, _bucket(dimension, values.get(source))))
+    for key in keys:
+        deltas[key][0] += sign
+        deltas[key][1] += sign * stroke
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0])
+
+
+def add_patient(deltas, values):
+    _add(deltas, values, +1)
+
+
+def remove_patient(deltas, values):
+    _add(deltas, values, -1)
+
+
+def lock_for_write(executor):
+    """
+    Start the patients.db write transaction now (BEGIN IMMEDIATE), so
+    rows read from here on cannot change before the commit. executor
+    is db.session or a Core connection that has not written yet.
+    """
+    if executor is db.session:
+        connection = db.session.connection(bind_arguments={"mapper": Patient})
+    else:
+        connection = executor
+    if connection.dialect.name != "sqlite":
+        return
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def apply_deltas(executor, deltas):
+    """
+    Upsert the accumulated deltas. executor is db.session or a Core
+    connection, so the change commits with the caller's transaction.
+    """
+    params = [
+        {"dimension": dim, "bucket": bucket, "total": total, "strokes": strokes}
+        for (dim, bucket), (total, strokes) in deltas.items()
+        if total or strokes
+    ]
+    if not params:
+        return
+    table = PatientStat.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.dimension, table.c.bucket],
+        set_={
+            "total": table.c.total + stmt.excluded.total,
+            "strokes": table.c.strokes + stmt.excluded.strokes,
+        },
+    )
+    executor.execute(stmt, params)
+
+
+# ---------------------------
+# Helpers for single-row writes (routes)
+# ---------------------------
+def record_created(patient):
+    deltas = new_deltas()
+    add_patient(deltas, snapshot(patient))
+    apply_deltas(db.session, deltas)
+
+
+def record_updated(old_values, patient):
+    deltas = new_deltas()
+    remove_patient(deltas, old_values)
+    add_patient(deltas, snapshot(patient))
+    apply_deltas(db.session, deltas)
+
+
+def record_deleted(old_values):
+    deltas = new_deltas()
+    remove_patient(deltas, old_values)
+    apply_deltas(db.session, deltas)
+
+
+# ---------------------------
+# Reading and full recompute
+# ---------------------------
+def dashboard_stats():
+    """
+    Return {"total": n, "strokes": n, "breakdowns": {dimension: [rows]}}
+    from the materialized table. Each row is (bucket, total, strokes).
+    """
+    totals = (0, 0)
+    breakdowns = {dimension: [] for dimension in DIMENSIONS}
+    for stat in PatientStat.query.filter(PatientStat.total > 0).all():
+        if stat.dimension == "all":
+            totals = (stat.total, stat.strokes)
+        elif stat.dimension in breakdowns:
+            breakdowns[stat.dimension].append((stat.bucket, stat.total, stat.strokes))
+
+    band_order = {label: i for i, (_, _, label) in enumerate(AGE_BANDS)}
+    for dimension, rows in breakdowns.items():
+        if dimension == "age_band":
+            rows.sort(key=lambda r: band_order.get(r[0], len(band_order)))
+        else:
+            rows.sort(key=lambda r: (-r[1], r[0]))
+
+    return {"total": totals[0], "strokes": totals[1], "breakdowns": breakdowns}
+
+
+def compute_stats():
+    """
+    Compute every (dimension, bucket) -> [total, strokes] with GROUP BY
+    queries over the patients table.
+    """
+    stroke_sum = func.sum(case((Patient.stroke.is_(True), 1), else_=0))
+    deltas = new_deltas()
+
+    total, strokes = db.session.query(func.count(Patient.id), stroke_sum).one()
+    if total:
+        deltas[("all", "all")] = [total, strokes or 0]
+
+    for dimension in DIMENSIONS:
+        column = Patient.age if dimension == "age_band" else getattr(Patient, dimension)
+        rows = db.session.query(column, func.count(Patient.id), stroke_sum).group_by(column)
+        for value, count, stroke_count in rows:
+            entry = deltas[(dimension, _bucket(dimension, value))]
+            entry[0] += count
+            entry[1] += stroke_count or 0
+    return deltas
+
+
+def recompute_stats(write=True):
+    """
+    Rebuild patient_stats from scratch. Returns the list of
+    (dimension, bucket, stored, expected) mismatches found before
+    rewriting; with write=False the table is left untouched.
+    """
+    if write:
+        # No writer may apply deltas between the count and the rewrite
+        lock_for_write(db.session)
+    expected = compute_stats()
+    stored = {
+        (s.dimension, s.bucket): [s.total, s.strokes]
+        for s in PatientStat.query.all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, [0, 0])
+        have = stored.get(key, [0, 0])
+        if want != have:
+            mismatches.append((key[0], key[1], tuple(have), tuple(want)))
+
+    if write:
+        PatientStat.query.delete()
+        apply_deltas(db.session, expected)
+        db.session.commit()
+    return mismatches
+
+
+def ensure_stats():
+    """
+    Fill patient_stats from the patients table if it has no rows yet,
+    e.g. right after init-db created it on an existing database.
+    Returns True if it was filled.
+    """
+    lock_for_write(db.session)
+    if PatientStat.query.first() is not None or Patient.query.first() is None:
+        db.session.rollback()
+        return False
+    recompute_stats()
+    return True
@@ -0,0 +1,86 @@
+"""
+Synthetic patients in the stroke dataset's CSV format, for benchmarks.
+
+Rows are generated lazily from a seeded RNG, so a 1M-row file is
+written without holding it in memory and the same (size, seed) always
+gives the same data. Category frequencies and the stroke rate roughly
+follow the Kaggle stroke dataset (about 5% positives).
+"""
+import csv
+import math
+import random
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+CSV_COLUMNS = [
+    "id",
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "Residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+]
+
+GENDERS = (("Female", 0.586), ("Male", 0.413), ("Other", 0.001))
+WORK_TYPES = (
+    ("Private", 0.57),
+    ("Self-employed", 0.16),
+    ("children", 0.135),
+    ("Govt_job", 0.13),
+    ("Never_worked", 0.005),
+)
+SMOKING = (
+    ("never smoked", 0.37),
+    ("Unknown", 0.30),
+    ("formerly smoked", 0.17),
+    ("smokes", 0.16),
+)
+
+
+def _pick(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def generate_patients(n, seed=0):
+    """Yield n CSV row dicts (string values, as csv.DictReader gives them)."""
+    rng = random.Random(seed)
+    for i in range(1, n + 1):
+        age = round(rng.uniform(0.1, 82), 1)
+        child = age < 16
+        hypertension = int(rng.random() < (0.02 + 0.25 * age / 82))
+        heart_disease = int(rng.random() < (0.01 + 0.12 * age / 82))
+        glucose = round(min(271.7, max(55.1, rng.lognormvariate(4.6, 0.3))), 2)
+        bmi = "N/A" if rng.random() < 0.04 else round(min(97.6, max(10.3, rng.gauss(28.9, 7.8))), 1)
+
+        z = -7.5 + 0.075 * age + 0.5 * hypertension + 0.4 * heart_disease + 0.004 * glucose
+        stroke = int(rng.random() < 1 / (1 + math.exp(-z)))
+
+        yield {
+            "id": i,
+            "gender": _pick(rng, GENDERS),
+            "age": age,
+            "hypertension": hypertension,
+            "heart_disease": heart_disease,
+            "ever_married": "No" if child or rng.random() < 0.2 else "Yes",
+            "work_type": "children" if child else _pick(rng, WORK_TYPES),
+            "Residence_type": rng.choice(("Urban", "Rural")),
+            "avg_glucose_level": glucose,
+            "bmi": bmi,
+            "smoking_status": "Unknown" if child else _pick(rng, SMOKING),
+            "stroke": stroke,
+        }
+
+
+def write_csv(path, n, seed=0):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(generate_patients(n, seed))
+    return path
@@ -0,0 +1,114 @@
+"""
+Cold-start budget: the time a fresh interpreter spends importing
+app.routes and everything create_app() imports (including the model
+warm-up), summed from ``python -X importtime``.
+
+Each measurement runs in a new subprocess (so nothing is cached in
+sys.modules) and the median of --repeat runs is compared with the
+budget. The run also fails if a heavy module that must stay lazy
+(pandas, sklearn, joblib) was imported: with the compact model artifact
+they are never needed to start a worker or serve a prediction.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 800 --top 15
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Median milliseconds, with headroom over the ~650 ms measured when it
+# was set (about 900 ms before pandas was made lazy). Raise it
+# deliberately, not to make a regression pass.
+IMPORT_BUDGET_MS = 900
+LAZY_MODULES = ("pandas", "sklearn", "joblib")
+
+STARTUP_CODE = (
+    "import json, sys\n"
+    "import app.routes\n"
+    "from app import create_app\n"
+    "create_app()\n"
+    f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))\n"
+)
+
+
+def parse_importtime(stderr):
+    """
+    Return {module: (self_us, cumulative_us)} and the total in us from
+    -X importtime output ("import time: self | cumulative | name").
+    """
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        self_us = int(self_us)
+        modules[name.strip()] = (self_us, int(cumulative_us))
+        total += self_us
+    return modules, total
+
+
+def measure_once():
+    """Import time (ms), slowest modules and lazy modules loaded, in a fresh process."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    modules, total_us = parse_importtime(result.stderr)
+    loaded_lazy = json.loads(result.stdout.strip().splitlines()[-1])
+    return total_us / 1000, modules, loaded_lazy
+
+
+def measure(repeat=5):
+    runs = [measure_once() for _ in range(repeat)]
+    median_ms = statistics.median(run[0] for run in runs)
+    # Slowest modules from the run closest to the median
+    _, modules, loaded_lazy = min(runs, key=lambda run: abs(run[0] - median_ms))
+    return {
+        "median_ms": median_ms,
+        "runs_ms": [run[0] for run in runs],
+        "modules": modules,
+        "loaded_lazy_modules": sorted({m for run in runs for m in run[2]}),
+    }
+
+
+def top_level_cost(modules, limit):
+    """Top-level packages ranked by their cumulative import time."""
+    roots = {}
+    for name, (_, cumulative) in modules.items():
+        root = name.split(".")[0]
+        roots[root] = max(roots.get(root, 0), cumulative)
+    return sorted(roots.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the app's import-time budget.")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help=f"Maximum median import time (default {IMPORT_BUDGET_MS}).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Packages to list.")
+    args = parser.parse_args()
+
+    result = measure(args.repeat)
+    print(f"import app.routes + create_app(): median {result['median_ms']:.0f} ms "
+          f"(runs: {', '.join(f'{ms:.0f}' for ms in result['runs_ms'])}; budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in top_level_cost(result["modules"], args.top):
+        print(f"  {name:<24} {cumulative / 1000:8.1f} ms")
+
+    failed = False
+    if result["loaded_lazy_modules"]:
+        print(f"FAIL: imported at startup: {', '.join(result['loaded_lazy_modules'])}")
+        failed = True
+    if result["median_ms"] > args.budget_ms:
+        print(f"FAIL: over budget by {result['median_ms'] - args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
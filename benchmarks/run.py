@@ -0,0 +1,399 @@
+"""
+Benchmarks for the hot paths: single and batch prediction, the patient
+list and dashboard pages, the CSV importer and model training.
+
+Each run generates a synthetic dataset (see datagen.py), works in a
+temporary directory with throwaway SQLite files, and writes its numbers
+to a JSON file. With --baseline the run is compared metric by metric
+against a stored result, and regressions beyond --tolerance are
+reported (and fail the run with --fail-on-regression).
+
+    python benchmarks/run.py --size 1k
+    python benchmarks/run.py --size 100k --only predict_single,batch_scoring
+    python benchmarks/run.py --size 1k --baseline benchmarks/baseline.json
+    python benchmarks/run.py --size 1k --output benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+from datagen import SIZES, generate_patients, write_csv
+
+# Prediction benchmarks use at most this many patients: building a
+# million ORM objects would measure Python allocation, not the model
+MAX_PREDICT_PATIENTS = 100_000
+PREDICT_BATCH_SIZE = 1000
+PAGE_REPEAT = 20
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def latency_metrics(samples, prefix=""):
+    """p50/p95/mean of a list of durations in seconds, in ms."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        f"{prefix}p50_ms": metric(statistics.median(ordered) * 1000, "ms", "lower"),
+        f"{prefix}p95_ms": metric(p95 * 1000, "ms", "lower"),
+        f"{prefix}mean_ms": metric(statistics.fmean(ordered) * 1000, "ms", "lower"),
+    }
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+class Context:
+    """Shared state of one run: data files, the app and a logged-in client."""
+
+    def __init__(self, size, workdir):
+        self.size = size
+        self.n = SIZES[size]
+        self.workdir = Path(workdir)
+        self._csv = None
+        self._app = None
+        self._client = None
+        self.imported = False
+
+    @property
+    def csv_path(self):
+        if self._csv is None:
+            self._csv = write_csv(self.workdir / f"patients_{self.size}.csv", self.n)
+        return self._csv
+
+    @property
+    def app(self):
+        if self._app is None:
+            from app import create_app
+
+            self._app = create_app({
+                "TESTING": True,
+                "WTF_CSRF_ENABLED": False,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(self.workdir / "auth.db"),
+                "SQLALCHEMY_BINDS": {"patients": "sqlite:///" + str(self.workdir / "patients.db")},
+                "MONGO_MIRROR_SPILL_PATH": str(self.workdir / "mongo_mirror_spill.jsonl"),
+                "MONGO_MIRROR_ASYNC": False,
+                "MODEL_RELOAD_INTERVAL": 0,
+            })
+            from app.cli import init_db, seed_admin
+
+            with self._app.app_context():
+                init_db()
+                seed_admin()
+        return self._app
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.app.test_client()
+            self._client.post("/login", data={"username": "admin", "password": "admin123"})
+        return self._client
+
+    def ensure_imported(self):
+        if not self.imported:
+            run_import(self)
+
+    def patients(self, limit):
+        """Unsaved Patient objects with complete features."""
+        from app.models import Patient
+        from scripts.import_patients import parse_row
+
+        patients = []
+        for row in generate_patients(self.n, seed=1):
+            values = parse_row({k: str(v) for k, v in row.items()})
+            values.pop("id")
+            if values["bmi"] is not None:
+                patients.append(Patient(**values))
+            if len(patients) >= limit:
+                break
+        return patients
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+@benchmark("predict_single")
+def bench_predict_single(ctx):
+    """predict_for_patient latency on a cache miss and on a cache hit."""
+    from app import ml
+
+    patients = ctx.patients(min(ctx.n, 2000))
+    with ctx.app.app_context():
+        ml.warm_up_model()
+        ml.configure_prediction_cache(len(patients))
+        ml._prediction_cache.clear()
+        miss = []
+        for patient in patients:
+            started = time.perf_counter()
+            ml.predict_for_patient(patient)
+            miss.append(time.perf_counter() - started)
+        hit = []
+        for patient in patients:
+            started = time.perf_counter()
+            ml.predict_for_patient(patient)
+            hit.append(time.perf_counter() - started)
+        ml.configure_prediction_cache(ctx.app.config["PREDICTION_CACHE_SIZE"])
+    return {**latency_metrics(miss, "miss_"), **latency_metrics(hit, "hit_")}
+
+
+@benchmark("batch_scoring")
+def bench_batch_scoring(ctx):
+    """predict_for_patients throughput in batches, cache cleared per batch."""
+    from app import ml
+
+    patients = ctx.patients(min(ctx.n, MAX_PREDICT_PATIENTS))
+    with ctx.app.app_context():
+        ml.warm_up_model()
+        elapsed = 0.0
+        for start in range(0, len(patients), PREDICT_BATCH_SIZE):
+            batch = patients[start:start + PREDICT_BATCH_SIZE]
+            ml._prediction_cache.clear()
+            started = time.perf_counter()
+            ml.predict_for_patients(batch)
+            elapsed += time.perf_counter() - started
+    return {
+        "rows_per_sec": metric(len(patients) / elapsed, "rows/s", "higher"),
+        "patients": metric(len(patients), "rows", None),
+    }
+
+
+def run_import(ctx):
+    from scripts.import_patients import import_patients
+
+    csv_path, app = ctx.csv_path, ctx.app  # not part of the timing
+    started = time.perf_counter()
+    with quiet():
+        import_patients(csv_path, restart=True, app=app)
+    elapsed = time.perf_counter() - started
+    ctx.imported = True
+    return elapsed
+
+
+@benchmark("import")
+def bench_import(ctx):
+    """scripts/import_patients.py into an empty patients.db."""
+    ctx.csv_path  # generating the CSV is not part of the import
+    elapsed = run_import(ctx)
+    return {
+        "rows_per_sec": metric(ctx.n / elapsed, "rows/s", "higher"),
+        "seconds": metric(elapsed, "s", "lower"),
+    }
+
+
+@benchmark("patients_list")
+def bench_patients_list(ctx):
+    """GET /patients: first page, a page deep in the table, sorted, filtered, revalidated."""
+    from app.models import Patient
+    from app.patient_queries import encode_cursor
+
+    ctx.ensure_imported()
+    client = ctx.client
+    with ctx.app.app_context():
+        middle = Patient.query.filter(Patient.id >= ctx.n // 2).order_by(Patient.id).first()
+        deep_cursor = encode_cursor("id", middle)
+
+    urls = {
+        "first_page_": "/patients",
+        "deep_page_": f"/patients?after={deep_cursor}",
+        "sorted_age_desc_": "/patients?sort=age&dir=desc",
+        "filtered_": "/patients?gender=Female&smoking_status=smokes&age_min=60",
+    }
+    results = {}
+    for prefix, url in urls.items():
+        assert client.get(url).status_code == 200, url
+        samples = timed(lambda: client.get(url), PAGE_REPEAT)
+        results.update(latency_metrics(samples, prefix))
+
+    # Conditional GET: the browser revalidates with the page's ETag
+    etag, _ = client.get("/patients").get_etag()
+    headers = {"If-None-Match": f'W/"{etag}"'}
+    assert client.get("/patients", headers=headers).status_code == 304
+    samples = timed(lambda: client.get("/patients", headers=headers), PAGE_REPEAT)
+    results.update(latency_metrics(samples, "first_page_304_"))
+    return results
+
+
+@benchmark("dashboard")
+def bench_dashboard(ctx):
+    """GET /dashboard (materialized statistics)."""
+    ctx.ensure_imported()
+    client = ctx.client
+    assert client.get("/dashboard").status_code == 200
+    return latency_metrics(timed(lambda: client.get("/dashboard"), PAGE_REPEAT))
+
+
+@benchmark("train")
+def bench_train(ctx):
+    """scripts/train_model.py on the generated CSV (no dataset cache)."""
+    from scripts.train_model import TrainConfig, train_and_save
+
+    cfg = TrainConfig(
+        input_csv=ctx.csv_path,
+        output_model=ctx.workdir / "model" / "stroke_model.joblib",
+        cache_dir=None,
+    )
+    started = time.perf_counter()
+    with quiet():
+        train_and_save(cfg)
+    return {"seconds": metric(time.perf_counter() - started, "s", "lower")}
+
+
+@benchmark("import_time")
+def bench_import_time(ctx):
+    """Cold-start import time (see import_time.py)."""
+    import import_time
+
+    result = import_time.measure(repeat=3)
+    return {"median_ms": metric(result["median_ms"], "ms", "lower")}
+
+
+# ---------------------------
+# Results and comparison
+# ---------------------------
+def run_metadata(size):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "size": size,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return (rows, regressions). A metric regresses when it is worse than
+    the baseline by more than tolerance (0.2 = 20%).
+    """
+    rows, regressions = [], []
+    for name, metrics in results["benchmarks"].items():
+        base_metrics = baseline.get("benchmarks", {}).get(name, {})
+        for key, current in metrics.items():
+            base = base_metrics.get(key)
+            if base is None or current["better"] is None or not base["value"]:
+                continue
+            change = (current["value"] - base["value"]) / base["value"]
+            worse = change if current["better"] == "lower" else -change
+            status = "REGRESSION" if worse > tolerance else ("improved" if worse < -tolerance else "ok")
+            row = (f"{name}.{key}", base["value"], current["value"], change, status)
+            rows.append(row)
+            if status == "REGRESSION":
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_results(results):
+    for name, metrics in results["benchmarks"].items():
+        print(f"{name}")
+        for key, m in metrics.items():
+            print(f"  {key:<26} {m['value']:>14,.3f} {m['unit']}")
+
+
+def print_comparison(rows, baseline_meta):
+    print(f"\nCompared with baseline {baseline_meta.get('commit')} "
+          f"({baseline_meta.get('timestamp')}, size {baseline_meta.get('size')}):")
+    for metric_name, base, current, change, status in rows:
+        print(f"  {metric_name:<42} {base:>12,.3f} -> {current:>12,.3f}  {change:+7.1%}  {status}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument("--size", choices=list(SIZES), default="1k",
+                        help="Number of synthetic patients.")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run "
+                        f"(default all: {', '.join(BENCHMARKS)}).")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<size>-<time>.json).")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression (default 0.2).")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if any metric regressed.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = {"meta": run_metadata(args.size), "benchmarks": {}}
+    with tempfile.TemporaryDirectory(prefix="stroke_bench_") as workdir:
+        ctx = Context(args.size, workdir)
+        for name in names:
+            print(f"Running {name} ({args.size})...", flush=True)
+            results["benchmarks"][name] = BENCHMARKS[name](ctx)
+        if ctx._app is not None:
+            from app import db
+
+            with ctx.app.app_context():
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+
+    print_results(results)
+
+    output = Path(args.output) if args.output else (
+        BENCH_DIR / "results" / f"{args.size}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults saved to {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("meta", {}).get("size") != args.size:
+            print("Warning: the baseline was recorded with a different dataset size.")
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print_comparison(rows, baseline.get("meta", {}))
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}.")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Mixed read/write throughput on patients.db with and without the
+SQLite engine profile (Config.SQLITE_PRAGMAS).
+
+Several worker processes (like gunicorn workers) share one database
+file. Each one loops for --seconds doing keyset page reads, point reads
+and single-row write transactions (insert or update) in the --write-ratio
+proportion. The script reports operations per second and lock errors
+for each mode.
+
+    python benchmarks/sqlite_profile.py --workers 4 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event, exc, insert, select, update
+
+from app.config import Config
+from app.models import Patient
+from app.sqlite_profile import apply_pragmas, pragmas_for_bind
+
+SEED_ROWS = 20000
+
+
+def make_engine(path, profile):
+    # timeout=0: lock waits come only from busy_timeout, so the
+    # default mode shows SQLite's real behaviour
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 0})
+    if profile:
+        pragmas = pragmas_for_bind(vars(Config), "patients")
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            apply_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def seed(path, profile):
+    engine = make_engine(path, profile)
+    Patient.__table__.create(engine)
+    rows = [
+        {"gender": random.choice(["Male", "Female"]), "age": random.randint(1, 90),
+         "avg_glucose_level": random.uniform(60, 250), "smoking_status": "Unknown",
+         "hypertension": False, "heart_disease": False, "stroke": False}
+        for _ in range(SEED_ROWS)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Patient.__table__), rows)
+    engine.dispose()
+
+
+def worker(args):
+    path, profile, seconds, write_ratio, seed_value = args
+    rng = random.Random(seed_value)
+    engine = make_engine(path, profile)
+    table = Patient.__table__
+    ops = errors = 0
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                with engine.begin() as conn:
+                    if rng.random() < 0.5:
+                        conn.execute(insert(table).values(
+                            gender="Female", age=rng.randint(1, 90),
+                            smoking_status="Unknown", stroke=False,
+                        ))
+                    else:
+                        conn.execute(update(table)
+                                     .where(table.c.id == rng.randint(1, SEED_ROWS))
+                                     .values(age=rng.randint(1, 90)))
+            else:
+                with engine.connect() as conn:
+                    if rng.random() < 0.5:
+                        conn.execute(select(table).where(
+                            table.c.id > rng.randint(1, SEED_ROWS)
+                        ).order_by(table.c.id).limit(50)).all()
+                    else:
+                        conn.execute(select(table).where(
+                            table.c.id == rng.randint(1, SEED_ROWS))).first()
+            ops += 1
+        except exc.OperationalError:
+            # "database is locked"
+            errors += 1
+
+    engine.dispose()
+    return ops, errors
+
+
+def run(profile, workers, seconds, write_ratio):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "patients.db")
+        seed(path, profile)
+        jobs = [(path, profile, seconds, write_ratio, i) for i in range(workers)]
+        with Pool(workers) as pool:
+            results = pool.map(worker, jobs)
+    ops = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return {"ops": ops, "ops_per_sec": ops / seconds, "lock_errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for name, profile in (("default", False), ("profile", True)):
+        results[name] = run(profile, args.workers, args.seconds, args.write_ratio)
+        r = results[name]
+        print(f"{name:>8}: {r['ops_per_sec']:10,.0f} ops/s  "
+              f"({r['ops']} ops, {r['lock_errors']} lock errors)")
+
+    speedup = results["profile"]["ops_per_sec"] / max(results["default"]["ops_per_sec"], 1e-9)
+    print(f"Profile speed-up: {speedup:.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#===========================================================================
+#Gunicorn settings for running the app in production:
+
+#    gunicorn -c gunicorn.conf.py run:app
+
+#preload_app imports run.py (and so create_app) once in the master
+#process. The model is loaded and warmed up there (MODEL_PRELOAD), and
+#the workers forked afterwards share those memory pages copy-on-write
+#instead of each loading their own copy.
+#===========================================================================
+import gc
+import logging
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+# Show the app's INFO logs, e.g. the model load time and memory at startup
+logging.getLogger("app").setLevel(logging.INFO)
+
+
+def when_ready(server):
+    # Everything loaded so far (model, sklearn, Flask) lives for the
+    # whole process: freeze it out of the garbage collector so gc passes
+    # in the workers do not touch (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened by create_app() in the master must not be used
+    # by several processes: drop them from the pools (without closing
+    # them, which the master still owns) so each worker opens its own
+    from app import db
+
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,73 @@
+import os
+import sys
+import argparse
+
+# Make sure the project root (stroke-risk-app) is on sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import or_
+
+from app import create_app, db
+from app.ml import get_model_version, score_patients
+from app.models import Patient
+from app.schema import ensure_sql_schema
+
+
+def stale_filter(version):
+    """Rows never scored, or scored by a different model version."""
+    if version is None:
+        return Patient.scored_at.is_(None)
+    return or_(
+        Patient.scored_model_version.is_(None),
+        Patient.scored_model_version != version,
+    )
+
+
+def backfill(batch_size=1000):
+    app = create_app()
+    with app.app_context():
+        # Databases created before the risk columns existed
+        for change in ensure_sql_schema():
+            print(f"Schema: {change}")
+
+        version = get_model_version()
+        print(f"Current model version: {version}")
+
+        total = scored = 0
+        last_id = 0
+        while True:
+            # Keyset on id: each batch is an index range scan, and
+            # rows already rescored are no longer stale anyway
+            batch = (
+                Patient.query.filter(stale_filter(version), Patient.id > last_id)
+                .order_by(Patient.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+
+            scored += score_patients(batch)
+            total += len(batch)
+            last_id = batch[-1].id
+            db.session.commit()
+            print(f"Rescored {total} stale patients...")
+
+        print(f"Backfill done: {total} stale rows, {scored} scored, "
+              f"{total - scored} could not be scored (missing features).")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Rescore patients whose stored prediction is from an older model."
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    backfill(batch_size=args.batch_size)
@@ -0,0 +1,37 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+
+# Make sure the project root (stroke-risk-app) is on sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import joblib
+
+from scripts.train_model import export_compact
+
+
+def export(model_path):
+    """Write the compact artifact for an existing joblib bundle."""
+    bundle = joblib.load(model_path)
+    if isinstance(bundle, dict) and "pipeline" in bundle:
+        pipeline, version = bundle["pipeline"], bundle.get("version")
+    else:
+        pipeline, version = bundle, None
+    export_compact(pipeline, Path(model_path), version)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export the compact (JSON + .npy) artifact of a trained model bundle."
+    )
+    parser.add_argument("--model", default=os.path.join(PROJECT_ROOT, "models", "stroke_model.joblib"))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    export(args.model)
@@ -1,6 +1,13 @@
 import os
 import sys
 import csv
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 # Make sure the project root (stroke-risk-app) is on sys.path
@@ -9,79 +16,415 @@ PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-from app import create_app, db
-from app.models import Patient
+from pymongo import errors
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import create_app, db, stats
+from app.models import ImportCheckpoint, Patient
+from app.mongo_db import document_from_values, get_patients_collection, upsert_request
+from app.schema import ensure_mongo_indexes, ensure_sql_schema
 
 
 
 DATA_PATH = Path("data/patients.csv")
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_MONGO_WORKERS = 4
+DEFAULT_MONGO_BATCH_SIZE = 1000
+
+# Columns overwritten when a CSV id already exists. created_at is kept,
+# and the stored prediction is cleared so the backfill rescores the row.
+UPSERT_COLUMNS = [
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+    "risk_probability",
+    "risk_label",
+    "scored_model_version",
+    "scored_at",
+]
+
+
+def parse_row(row):
+    """
+    Convert one CSV row into column values for the patients table.
+    Expecting CSV columns that match the stroke dataset, e.g.:
+    id, gender, age, hypertension, heart_disease, ever_married,
+    work_type, Residence_type, avg_glucose_level, bmi,
+    smoking_status, stroke
+    """
+    bmi_raw = row.get("bmi")
+    stroke_raw = row.get("stroke")
+
+    values = {
+        "gender": row.get("gender"),
+        "age": int(float(row.get("age", 0))),
+        "hypertension": int(row.get("hypertension", 0)),
+        "heart_disease": int(row.get("heart_disease", 0)),
+        "ever_married": row.get("ever_married"),
+        "work_type": row.get("work_type"),
+        "residence_type": row.get("Residence_type") or row.get("residence_type"),
+        "avg_glucose_level": float(row.get("avg_glucose_level", 0) or 0),
+        "bmi": float(bmi_raw) if bmi_raw not in (None, "", "N/A") else None,
+        "smoking_status": row.get("smoking_status", "Unknown"),
+        "stroke": None if stroke_raw in (None, "", "None") else int(stroke_raw),
+        "risk_probability": None,
+        "risk_label": None,
+        "scored_model_version": None,
+        "scored_at": None,
+    }
+
+    id_raw = row.get("id")
+    if id_raw not in (None, ""):
+        values["id"] = int(id_raw)
+    return values
+
+
+# ---------------------------
+# Checkpointing
+# ---------------------------
+# The number of CSV rows processed is stored in the import_checkpoints
+# table, in the same transaction as each chunk: a rerun on the same
+# (unchanged) CSV skips exactly the committed rows, so rows without an
+# id are never inserted twice.
+# With --mongo, the row also keeps the updated_at of the oldest chunk
+# MongoDB has not confirmed yet. A rerun first sends every row changed
+# since then to MongoDB again (the upserts are version-conditional, so
+# repeating one is harmless).
+
+def _source_fingerprint(csv_path):
+    stat = csv_path.stat()
+    return {"source": str(csv_path.resolve()), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(conn, csv_path):
+    """(rows_done, mongo_pending_since) stored for this CSV, or (0, None)."""
+    fingerprint = _source_fingerprint(csv_path)
+    table = ImportCheckpoint.__table__
+    row = conn.execute(
+        select(table).where(table.c.source == fingerprint["source"])
+    ).mappings().first()
+    if row is None:
+        return 0, None
+    if (row["size"], row["mtime"]) != (fingerprint["size"], fingerprint["mtime"]):
+        print(f"Ignoring checkpoint for {csv_path}: CSV has changed.")
+        # Rows from the previous file may still be missing in MongoDB
+        return 0, row["mongo_pending_since"]
+    return row["rows_done"], row["mongo_pending_since"]
+
+
+def save_checkpoint(conn, csv_path, rows_done, mongo_pending_since=None):
+    values = {
+        **_source_fingerprint(csv_path),
+        "rows_done": rows_done,
+        "mongo_pending_since": mongo_pending_since,
+        "updated_at": datetime.utcnow(),
+    }
+    stmt = sqlite_insert(ImportCheckpoint.__table__).values(values)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["source"],
+        set_={name: stmt.excluded[name] for name in values if name != "source"},
+    ))
+
+
+def clear_checkpoint(conn, csv_path):
+    table = ImportCheckpoint.__table__
+    conn.execute(table.delete().where(table.c.source == str(csv_path.resolve())))
+
+
+# ---------------------------
+# Bulk insert
+# ---------------------------
+def write_chunk(conn, rows, want_ids=False, now=None):
+    """
+    Insert one chunk with executemany. Rows carrying a CSV id are
+    upserted on the primary key; rows without one are plain inserts.
+    With want_ids, the ids, row versions and creation times SQL ended
+    up with are read back (RETURNING) and set on the row dicts, so the
+    rows can be mirrored to MongoDB exactly as stored.
+    Dashboard statistics are updated in the same transaction.
+    Returns (inserted, updated): the rows that are new, and the CSV ids
+    that replaced an existing row.
+    """
+    # A repeated id within one chunk: the last row wins, as in the upsert
+    with_id = list({r["id"]: r for r in rows if "id" in r}.values())
+    without_id = [r for r in rows if "id" not in r]
+
+    table = Patient.__table__
+    now = now or datetime.utcnow()
+    deltas = stats.new_deltas()
+    updated = 0
+    for row in with_id + without_id:
+        # Values for a new row; an upsert keeps created_at and bumps version
+        row.update(created_at=now, updated_at=now, version=1)
+        stats.add_patient(deltas, row)
+
+    if with_id:
+        # Rows being replaced stop counting with their old values, read
+        # inside the write transaction
+        stats.lock_for_write(conn)
+        stat_columns = [table.c[name] for name in stats.STAT_FIELDS]
+        existing = conn.execute(
+            select(*stat_columns).where(table.c.id.in_([r["id"] for r in with_id]))
+        )
+        for old in existing.mappings():
+            stats.remove_patient(deltas, dict(old))
+            updated += 1
 
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={
+                **{name: stmt.excluded[name] for name in UPSERT_COLUMNS},
+                # Column onupdate defaults do not apply to ON CONFLICT
+                "version": func.coalesce(table.c.version, 0) + 1,
+                "updated_at": now,
+            },
+        )
+        if want_ids:
+            stmt = stmt.returning(
+                table.c.version, table.c.created_at, sort_by_parameter_order=True
+            )
+            for row, stored in zip(with_id, conn.execute(stmt, with_id)):
+                row["version"], row["created_at"] = stored
+        else:
+            conn.execute(stmt, with_id)
+    if without_id and want_ids:
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        for row, new_id in zip(without_id, conn.execute(stmt, without_id).scalars()):
+            row["id"] = new_id
+    elif without_id:
+        conn.execute(insert(table), without_id)
 
-def import_patients():
-    app = create_app()
+    stats.apply_deltas(conn, deltas)
+    return len(with_id) + len(without_id) - updated, updated
+
+
+# ---------------------------
+# MongoDB mirror (parallel)
+# ---------------------------
+class MongoBulkWriter:
+    """
+    Upserts documents keyed on sql_id with several writer threads.
+    Each batch is one bulk_write(ordered=False); the number of batches
+    in flight is bounded so memory stays flat on very large files.
+    """
+
+    def __init__(self, collection, workers, batch_size):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mongo-import")
+        self.in_flight = threading.BoundedSemaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def submit(self, docs):
+        """Queue docs for writing; returns the futures of their batches."""
+        futures = []
+        for i in range(0, len(docs), self.batch_size):
+            self.in_flight.acquire()
+            future = self.executor.submit(self._write, docs[i:i + self.batch_size])
+            future.add_done_callback(lambda _: self.in_flight.release())
+            futures.append(future)
+        return futures
+
+    def _write(self, docs):
+        """Write one batch; returns the number of documents that failed."""
+        try:
+            # Same version-conditional upsert as the app's mirror, so a
+            # re-import never overwrites a newer edit made meanwhile
+            requests = [upsert_request(doc) for doc in docs]
+            self.collection.bulk_write(requests, ordered=False)
+            failed = 0
+        except errors.BulkWriteError as e:
+            failed = len(e.details.get("writeErrors", []))
+        except Exception as e:
+            # Anything else (not only PyMongoError) would vanish in the future
+            print(f"Mongo batch of {len(docs)} failed: {e!r}")
+            failed = len(docs)
+        with self.lock:
+            self.written += len(docs) - failed
+            self.failed += failed
+        return failed
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - self.started
+        print(f"MongoDB: {self.written} documents upserted in {elapsed:.2f}s "
+              f"({self.written / elapsed if elapsed else 0:,.0f} docs/s), "
+              f"{self.failed} failed")
+
+
+def iter_chunks(reader, chunk_size):
+    while True:
+        chunk = list(islice(reader, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resend_to_mongo(conn, writer, since, batch_size):
+    """Submit every row changed since the given time; returns the futures."""
+    table = Patient.__table__
+    result = conn.execute(
+        select(table).where(table.c.updated_at >= since).order_by(table.c.id)
+    ).mappings()
+    futures = []
+    while True:
+        batch = result.fetchmany(batch_size)
+        if not batch:
+            return futures
+        futures += writer.submit([document_from_values(r["id"], r) for r in batch])
+
+
+def import_patients(csv_path=DATA_PATH, chunk_size=DEFAULT_CHUNK_SIZE,
+                    restart=False, mongo=False,
+                    mongo_workers=DEFAULT_MONGO_WORKERS,
+                    mongo_batch_size=DEFAULT_MONGO_BATCH_SIZE, app=None):
+    app = app or create_app()
     with app.app_context():
-        if not DATA_PATH.exists():
-            print(f"CSV file not found at {DATA_PATH}")
+        if not csv_path.exists():
+            print(f"CSV file not found at {csv_path}")
             return
 
-        print(f"Loading data from {DATA_PATH}")
+        print(f"Loading data from {csv_path}")
 
-        # (Re)create tables if they don't exist
-        db.create_all()
+        # Create missing tables, and add the columns a database from
+        # before the risk/version columns lacks
+        for change in ensure_sql_schema():
+            print(f"Schema: {change}")
+        # The chunks apply deltas to the dashboard statistics
+        if stats.ensure_stats():
+            print("Schema: computed patient_stats from the patients table")
+        engine = db.engines["patients"]
 
-        count = 0
-        with DATA_PATH.open(newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
+        with engine.connect() as conn:
+            rows_done, mongo_since = load_checkpoint(conn, csv_path)
+        if restart:
+            rows_done = 0
+        if rows_done:
+            print(f"Resuming after {rows_done} rows")
+
+        # (updated_at of a chunk, futures of its Mongo batches) for the
+        # chunks MongoDB has not confirmed yet, oldest first
+        pending = deque()
 
-            for row in reader:
-                # Expecting CSV columns that match the stroke dataset, e.g.:
-                # gender, age, hypertension, heart_disease, ever_married,
-                # work_type, Residence_type, avg_glucose_level, bmi,
-                # smoking_status, stroke
+        writer = None
+        if mongo:
+            collection = get_patients_collection()
+            # Upserts on sql_id are collection scans without its index
+            ensure_mongo_indexes(collection)
+            writer = MongoBulkWriter(collection, mongo_workers, mongo_batch_size)
+            if mongo_since is not None:
+                print(f"Sending rows changed since {mongo_since} to MongoDB again")
+                with engine.connect() as conn:
+                    pending.append((mongo_since, resend_to_mongo(conn, writer, mongo_since, chunk_size)))
+        elif mongo_since is not None:
+            print("MongoDB is missing rows from an earlier --mongo import; rerun with --mongo.")
+
+        def oldest_unconfirmed(default):
+            # A chunk with a failed Mongo batch is never confirmed, so
+            # the checkpoint keeps it for the next run
+            while pending and all(f.done() and f.result() == 0 for f in pending[0][1]):
+                pending.popleft()
+            return pending[0][0] if pending else default
+
+        inserted = updated = skipped = 0
+        started = time.perf_counter()
+
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for _ in islice(reader, rows_done):
+                pass
 
-                gender = row.get("gender")
-                age = int(float(row.get("age", 0)))
+            for chunk in iter_chunks(reader, chunk_size):
+                rows = []
+                for line_no, raw in enumerate(chunk, start=rows_done + 2):
+                    try:
+                        rows.append(parse_row(raw))
+                    except (TypeError, ValueError) as e:
+                        skipped += 1
+                        print(f"Skipping CSV line {line_no}: {e}")
 
-                hypertension = int(row.get("hypertension", 0))
-                heart_disease = int(row.get("heart_disease", 0))
+                # One transaction per chunk, checkpoint included
+                now = datetime.utcnow()
+                with engine.begin() as conn:
+                    chunk_inserted, chunk_updated = write_chunk(conn, rows, want_ids=mongo, now=now)
+                    if writer is not None:
+                        # This chunk is not in MongoDB yet
+                        mongo_since = oldest_unconfirmed(now)
+                    save_checkpoint(conn, csv_path, rows_done + len(chunk), mongo_since)
 
-                ever_married = row.get("ever_married")
-                work_type = row.get("work_type")
-                residence_type = row.get("Residence_type") or row.get("residence_type")
+                rows_done += len(chunk)
+                inserted += chunk_inserted
+                updated += chunk_updated
 
-                avg_glucose_level = float(row.get("avg_glucose_level", 0) or 0)
+                if writer is not None:
+                    # SQL moves on to the next chunk while Mongo writes this one
+                    docs = [document_from_values(r["id"], r) for r in rows]
+                    pending.append((now, writer.submit(docs)))
 
-                bmi_raw = row.get("bmi")
-                bmi = float(bmi_raw) if bmi_raw not in (None, "", "N/A") else None
+                elapsed = time.perf_counter() - started
+                written = inserted + updated
+                print(f"  {rows_done} rows processed "
+                      f"({written / elapsed if elapsed else 0:,.0f} rows/s)")
 
-                smoking_status = row.get("smoking_status", "Unknown")
+        if writer is not None:
+            writer.close()
+            mongo_since = oldest_unconfirmed(None)
 
-                stroke_raw = row.get("stroke")
-                if stroke_raw in (None, "", "None"):
-                    stroke = None
-                else:
-                    stroke = int(stroke_raw)
+        with engine.begin() as conn:
+            if mongo_since is None:
+                clear_checkpoint(conn, csv_path)
+            else:
+                # Every row is in SQL; keep what MongoDB still needs
+                save_checkpoint(conn, csv_path, rows_done, mongo_since)
+        if writer is not None and mongo_since is not None:
+            print(f"MongoDB is missing rows changed since {mongo_since}; "
+                  "rerun with --mongo to send them again.")
 
-                patient = Patient(
-                    gender=gender,
-                    age=age,
-                    hypertension=hypertension,
-                    heart_disease=heart_disease,
-                    ever_married=ever_married,
-                    work_type=work_type,
-                    residence_type=residence_type,
-                    avg_glucose_level=avg_glucose_level,
-                    bmi=bmi,
-                    smoking_status=smoking_status,
-                    stroke=stroke,
-                )
+        elapsed = time.perf_counter() - started
+        written = inserted + updated
+        print(f"Imported {inserted} new and updated {updated} existing patients from {csv_path} "
+              f"in {elapsed:.2f}s ({written / elapsed if elapsed else 0:,.0f} rows/s), "
+              f"skipped {skipped} invalid rows")
+        print("Run scripts/backfill_risk_scores.py to store their risk scores.")
 
-                db.session.add(patient)
-                count += 1
 
-            db.session.commit()
-            print(f"Imported {count} patients from {DATA_PATH}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk import patients from a CSV file.")
+    parser.add_argument("--csv", type=str, default=str(DATA_PATH),
+                        help="Path to stroke dataset CSV (default: data/patients.csv)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows parsed and inserted per transaction.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore any existing checkpoint and start from the first row.")
+    parser.add_argument("--mongo", action="store_true",
+                        help="Also upsert every row into the MongoDB patients collection.")
+    parser.add_argument("--mongo-workers", type=int, default=DEFAULT_MONGO_WORKERS,
+                        help="Concurrent MongoDB writer threads.")
+    parser.add_argument("--mongo-batch-size", type=int, default=DEFAULT_MONGO_BATCH_SIZE,
+                        help="Documents per MongoDB bulk_write.")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    import_patients()
+    args = parse_args()
+    import_patients(
+        csv_path=Path(args.csv),
+        chunk_size=args.chunk_size,
+        restart=args.restart,
+        mongo=args.mongo,
+        mongo_workers=args.mongo_workers,
+        mongo_batch_size=args.mongo_batch_size,
+    )
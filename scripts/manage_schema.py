@@ -0,0 +1,57 @@
+import os
+import sys
+import argparse
+
+# Make sure the project root (stroke-risk-app) is on sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from pymongo import errors
+
+from app import create_app
+from app.cli import init_db
+from app.mongo_db import get_patients_collection
+from app.schema import ensure_mongo_indexes, remove_duplicate_sql_ids
+
+
+def main(sql=True, mongo=True, dedupe_mongo=False):
+    app = create_app()
+    with app.app_context():
+        if sql:
+            changes = init_db()
+            for change in changes:
+                print(f"SQLite: {change}")
+            if not changes:
+                print("SQLite: schema and indexes are up to date.")
+
+        if mongo:
+            collection = get_patients_collection()
+            if dedupe_mongo:
+                removed = remove_duplicate_sql_ids(collection)
+                print(f"MongoDB: removed {removed} duplicate sql_id documents.")
+            try:
+                names = ensure_mongo_indexes(collection)
+            except errors.DuplicateKeyError as e:
+                print(f"MongoDB: cannot build unique sql_id index, duplicates exist ({e}). "
+                      "Rerun with --dedupe-mongo.")
+                return 1
+            print(f"MongoDB: indexes present: {', '.join(names)}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create missing tables, columns and indexes (SQLite and MongoDB)."
+    )
+    parser.add_argument("--sql-only", action="store_true", help="Skip MongoDB.")
+    parser.add_argument("--mongo-only", action="store_true", help="Skip SQLite.")
+    parser.add_argument("--dedupe-mongo", action="store_true",
+                        help="Remove duplicate sql_id documents before indexing.")
+    args = parser.parse_args()
+    sys.exit(main(
+        sql=not args.mongo_only,
+        mongo=not args.sql_only,
+        dedupe_mongo=args.dedupe_mongo,
+    ))
@@ -0,0 +1,41 @@
+import os
+import sys
+import argparse
+
+# Make sure the project root (stroke-risk-app) is on sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app, db
+from app.stats import recompute_stats
+
+
+def main(verify_only=False):
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        mismatches = recompute_stats(write=not verify_only)
+
+        for dimension, bucket, stored, expected in mismatches:
+            print(f"{dimension}={bucket}: stored (total, strokes)={stored}, "
+                  f"recomputed={expected}")
+
+        if not mismatches:
+            print("Dashboard statistics match the patients table.")
+        elif verify_only:
+            print(f"{len(mismatches)} mismatching rows (nothing written).")
+        else:
+            print(f"{len(mismatches)} mismatching rows rewritten.")
+        return 1 if mismatches and verify_only else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the materialized dashboard statistics from the patients table."
+    )
+    parser.add_argument("--verify", action="store_true",
+                        help="Only compare stored statistics with a full recompute.")
+    args = parser.parse_args()
+    sys.exit(main(verify_only=args.verify))
@@ -1,21 +1,46 @@
 import argparse
+import csv
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterator, Optional
 
 import joblib
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
-from sklearn.linear_model import LogisticRegression
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.metrics import accuracy_score, roc_auc_score, classification_report
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 
+# Make sure the project root (stroke-risk-app) is on sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app.ml import CompiledScorer
+
 
 @dataclass
 class TrainConfig:
-    input_csv: Path
+    input_csv: Optional[Path]
     output_model: Path
     test_size: float = 0.2
     random_state: int = 42
@@ -23,7 +48,53 @@ class TrainConfig:
     C: float = 1.0
     max_iter: int = 1000
     solver: str = "lbfgs"
+    class_weight: Optional[str] = "balanced"
+    l1_ratio: Optional[float] = None
     version: str = "logreg_v1"
+    # Hyperparameter search (--search grid|random)
+    search: Optional[str] = None
+    n_iter: int = 20
+    cv_folds: int = 5
+    jobs: int = 1
+    search_results: Optional[Path] = None
+    # Streaming training (--streaming), from a CSV or patients.db
+    streaming: bool = False
+    input_db: Optional[Path] = None
+    chunk_size: int = 50000
+    epochs: int = 5
+    alpha: float = 1e-4
+    sample_size: int = 100000
+    # Cleaned dataset cache (None disables it)
+    cache_dir: Optional[Path] = None
+
+
+FEATURE_COLS = [
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+]
+TARGET_COL = "stroke"
+NUMERIC_FEATURES = [
+    "age",
+    "hypertension",
+    "heart_disease",
+    "avg_glucose_level",
+    "bmi",
+]
+CATEGORICAL_FEATURES = [
+    "gender",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "smoking_status",
+]
 
 
 def load_data(path: Path) -> pd.DataFrame:
@@ -39,110 +110,380 @@ def load_data(path: Path) -> pd.DataFrame:
     return df
 
 
-def build_pipeline(df: pd.DataFrame, cfg: TrainConfig):
-    required_cols = [
-        "gender",
-        "age",
-        "hypertension",
-        "heart_disease",
-        "ever_married",
-        "work_type",
-        "residence_type",
-        "avg_glucose_level",
-        "bmi",
-        "smoking_status",
-        "stroke",
-    ]
-
-    for col in required_cols:
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Check the columns, drop rows without a target and coerce types.
+    Works on the whole dataset or on one chunk of it.
+    """
+    if "Residence_type" in df.columns and "residence_type" not in df.columns:
+        df = df.rename(columns={"Residence_type": "residence_type"})
+
+    for col in FEATURE_COLS + [TARGET_COL]:
         if col not in df.columns:
             raise ValueError(f"Missing required column in CSV: {col}")
 
     # Drop rows with missing target
-    df = df.dropna(subset=["stroke"])
+    df = df.dropna(subset=[TARGET_COL])
 
     # Basic type conversions
-    df["stroke"] = df["stroke"].astype(int)
+    df[TARGET_COL] = df[TARGET_COL].astype(int)
     df["hypertension"] = df["hypertension"].astype(int)
     df["heart_disease"] = df["heart_disease"].astype(int)
     df["age"] = df["age"].astype(float)
     df["avg_glucose_level"] = df["avg_glucose_level"].astype(float)
     df["bmi"] = pd.to_numeric(df["bmi"], errors="coerce")
     df.loc[df["bmi"] <= 0, "bmi"] = np.nan
+    return df
 
-    feature_cols = [
-        "gender",
-        "age",
-        "hypertension",
-        "heart_disease",
-        "ever_married",
-        "work_type",
-        "residence_type",
-        "avg_glucose_level",
-        "bmi",
-        "smoking_status",
-    ]
-    target_col = "stroke"
-
-    X = df[feature_cols].copy()
-    y = df[target_col].copy()
 
-    # Handle missing BMI with median imputation
-    if "bmi" in X.columns:
-        X["bmi"] = X["bmi"].fillna(X["bmi"].median())
-
-    numeric_features = [
-        "age",
-        "hypertension",
-        "heart_disease",
-        "avg_glucose_level",
-        "bmi",
-    ]
-    categorical_features = [
-        "gender",
-        "ever_married",
-        "work_type",
-        "residence_type",
-        "smoking_status",
-    ]
-
-    preprocessor = ColumnTransformer(
+def make_preprocessor(categories="auto") -> ColumnTransformer:
+    # Numeric block first: the app's CompiledScorer relies on this order
+    return ColumnTransformer(
         transformers=[
-            ("num", "passthrough", numeric_features),
-            ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_features),
+            ("num", "passthrough", NUMERIC_FEATURES),
+            ("cat", OneHotEncoder(categories=categories, handle_unknown="ignore"), CATEGORICAL_FEATURES),
         ]
     )
 
+
+def training_meta() -> dict:
+    return {
+        "feature_cols": FEATURE_COLS,
+        "target_col": TARGET_COL,
+        "numeric_features": NUMERIC_FEATURES,
+        "categorical_features": CATEGORICAL_FEATURES,
+    }
+
+
+def build_pipeline(cfg: TrainConfig):
     clf = LogisticRegression(
-        penalty=cfg.penalty,
-        C=cfg.C,
-        solver=cfg.solver,
-        max_iter=cfg.max_iter,
-        class_weight="balanced",
         n_jobs=-1,
+        **classifier_params(cfg),
     )
 
     pipeline = Pipeline(
         steps=[
-            ("preprocess", preprocessor),
+            ("preprocess", make_preprocessor()),
             ("clf", clf),
         ]
     )
 
-    meta = {
-        "feature_cols": feature_cols,
-        "target_col": target_col,
-        "numeric_features": numeric_features,
-        "categorical_features": categorical_features,
+    return pipeline, training_meta()
+
+
+def classifier_params(cfg: TrainConfig) -> dict:
+    params = {
+        "penalty": cfg.penalty,
+        "C": cfg.C,
+        "solver": cfg.solver,
+        "max_iter": cfg.max_iter,
+        "class_weight": cfg.class_weight,
     }
+    if cfg.penalty == "elasticnet":
+        params["l1_ratio"] = cfg.l1_ratio if cfg.l1_ratio is not None else 0.5
+    return params
 
-    return pipeline, X, y, meta
 
+# ---------------------------
+# Cached cleaned dataset
+# ---------------------------
+# Parsing the CSV, renaming columns, coercing types and imputing BMI is
+# repeated identically by every training or search run. The cleaned
+# features and target are cached as one .npy file per column under
+# --cache-dir/<key>/ (text columns as integer category codes, with the
+# categories in manifest.json), and later runs memory-map them instead
+# of reading the CSV.
+# The key is the SHA-256 of the source file's content plus the cleaning
+# code (CLEANING_VERSION and the source of the functions that clean),
+# so editing either the data or the cleaning steps misses the cache.
+
+CLEANING_VERSION = 1
+DEFAULT_CACHE_DIR = Path(PROJECT_ROOT) / "instance" / "train_cache"
+
+
+def prepare_features(df: pd.DataFrame):
+    """Cleaned (X, y) for batch training."""
+    df = clean_frame(df)
+
+    X = df[FEATURE_COLS].copy()
+    y = df[TARGET_COL].copy()
+
+    # Handle missing BMI with median imputation
+    X["bmi"] = X["bmi"].fillna(X["bmi"].median())
+    return X, y
+
+
+def dataset_cache_key(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"cleaning-v{CLEANING_VERSION}".encode())
+    for func in (load_data, clean_frame, prepare_features):
+        digest.update(inspect.getsource(func).encode())
+    return digest.hexdigest()[:32]
+
+
+def save_dataset_cache(entry_dir: Path, X: pd.DataFrame, y: pd.Series, source: Path) -> None:
+    # Written to a temporary directory and renamed, so a crashed run
+    # never leaves a half-written entry behind
+    entry_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=entry_dir.name + ".", dir=entry_dir.parent))
+    columns = []
+    for name, series in list(X.items()) + [(TARGET_COL, y)]:
+        column = {"name": name}
+        if pd.api.types.is_numeric_dtype(series):
+            values = series.to_numpy()
+        else:
+            # Missing values get code -1
+            codes, categories = pd.factorize(series, sort=True)
+            values = codes.astype(np.int32)
+            column["categories"] = [str(c) for c in categories]
+        np.save(tmp_dir / f"{name}.npy", values, allow_pickle=False)
+        columns.append(column)
+    manifest = {
+        "source": str(source),
+        "cleaning_version": CLEANING_VERSION,
+        "rows": len(y),
+        "columns": columns,
+    }
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another run cached the same key first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_dataset_cache(entry_dir: Path):
+    """(X, y) from a cache entry, or None if there is no usable entry."""
+    manifest_path = entry_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    data = {}
+    for column in manifest["columns"]:
+        values = np.load(entry_dir / f"{column['name']}.npy", mmap_mode="r", allow_pickle=False)
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, categories=column["categories"])
+        data[column["name"]] = values
+    y = pd.Series(data.pop(TARGET_COL), name=TARGET_COL)
+    return pd.DataFrame(data, columns=FEATURE_COLS), y
+
+
+def load_dataset(cfg: TrainConfig):
+    """Cleaned (X, y) for batch training, from the cache when possible."""
+    if not cfg.input_csv.exists():
+        raise FileNotFoundError(f"CSV not found: {cfg.input_csv}")
+    if cfg.cache_dir is None:
+        print(f"Loading data from {cfg.input_csv}")
+        return prepare_features(load_data(cfg.input_csv))
+
+    started = time.perf_counter()
+    entry_dir = cfg.cache_dir / dataset_cache_key(cfg.input_csv)
+    cached = load_dataset_cache(entry_dir)
+    if cached is not None:
+        print(f"Loaded cleaned data for {cfg.input_csv} from cache {entry_dir} "
+              f"in {time.perf_counter() - started:.2f}s")
+        return cached
 
-def train_and_save(cfg: TrainConfig) -> None:
     print(f"Loading data from {cfg.input_csv}")
-    df = load_data(cfg.input_csv)
-    pipeline, X, y, meta = build_pipeline(df, cfg)
+    X, y = prepare_features(load_data(cfg.input_csv))
+    save_dataset_cache(entry_dir, X, y, cfg.input_csv)
+    print(f"Cleaned data cached to {entry_dir} ({time.perf_counter() - started:.2f}s)")
+    return X, y
+
+
+# ---------------------------
+# Hyperparameter search
+# ---------------------------
+# Every configuration is scored with stratified k-fold CV on the
+# training split. The preprocessing (one-hot encoding) is fitted once
+# per fold, not once per configuration: the encoded fold matrices are
+# saved as .npy files that the worker processes memory-map, so a
+# (configuration, fold) task only fits the LogisticRegression.
+# Tasks are spread over a process pool (--jobs).
+
+# Penalties and the solvers that support them
+PENALTY_SOLVERS = [
+    ("l2", "lbfgs"),
+    ("l2", "liblinear"),
+    ("l1", "liblinear"),
+    ("l1", "saga"),
+    ("elasticnet", "saga"),
+]
+GRID_C = [0.01, 0.1, 1.0, 10.0, 100.0]
+CLASS_WEIGHTS = [None, "balanced"]
+
+RESULT_COLUMNS = [
+    "rank",
+    "config",
+    "C",
+    "penalty",
+    "solver",
+    "class_weight",
+    "l1_ratio",
+    "mean_roc_auc",
+    "std_roc_auc",
+    "mean_fit_seconds",
+    "total_fit_seconds",
+    "error",
+]
+
+
+def search_space(mode: str, n_iter: int, random_state: int) -> list:
+    """List of parameter dicts: the full grid, or n_iter random draws."""
+    if mode == "grid":
+        return [
+            {
+                "C": C,
+                "penalty": penalty,
+                "solver": solver,
+                "class_weight": class_weight,
+                "l1_ratio": 0.5 if penalty == "elasticnet" else None,
+            }
+            for C in GRID_C
+            for penalty, solver in PENALTY_SOLVERS
+            for class_weight in CLASS_WEIGHTS
+        ]
+
+    rng = np.random.default_rng(random_state)
+    space = []
+    for _ in range(n_iter):
+        penalty, solver = PENALTY_SOLVERS[rng.integers(len(PENALTY_SOLVERS))]
+        space.append({
+            "C": float(10 ** rng.uniform(-3, 2)),
+            "penalty": penalty,
+            "solver": solver,
+            "class_weight": CLASS_WEIGHTS[rng.integers(len(CLASS_WEIGHTS))],
+            "l1_ratio": float(rng.uniform(0.1, 0.9)) if penalty == "elasticnet" else None,
+        })
+    return space
+
+
+def prepare_folds(preprocessor, X, y, n_folds, random_state, fold_dir) -> None:
+    """Fit the preprocessing on each training fold and save the encoded arrays."""
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    for i, (train_idx, val_idx) in enumerate(folds.split(X, y)):
+        step = clone(preprocessor)
+        X_train = step.fit_transform(X.iloc[train_idx])
+        X_val = step.transform(X.iloc[val_idx])
+        arrays = {
+            "X_train": X_train,
+            "y_train": y.iloc[train_idx].to_numpy(),
+            "X_val": X_val,
+            "y_val": y.iloc[val_idx].to_numpy(),
+        }
+        for name, array in arrays.items():
+            if sparse.issparse(array):
+                array = array.toarray()
+            np.save(Path(fold_dir) / f"fold{i}_{name}.npy", np.asarray(array, dtype=float))
+
+
+@lru_cache(maxsize=None)
+def _load_fold(fold_dir: str, fold: int):
+    # Cached per worker process; memory-mapped, so shared via the page cache
+    return tuple(
+        np.load(Path(fold_dir) / f"fold{fold}_{name}.npy", mmap_mode="r")
+        for name in ("X_train", "y_train", "X_val", "y_val")
+    )
+
+
+def _evaluate_fold(task) -> dict:
+    """Fit one configuration on one fold. Runs in a worker process."""
+    config_id, params, fold_dir, fold, max_iter = task
+    X_train, y_train, X_val, y_val = _load_fold(fold_dir, fold)
+    cfg_params = {k: v for k, v in params.items() if v is not None or k == "class_weight"}
+    if params["penalty"] != "elasticnet":
+        cfg_params.pop("l1_ratio", None)
+
+    result = {"config": config_id, "fold": fold, "auc": float("nan"), "fit_seconds": 0.0, "error": ""}
+    started = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ConvergenceWarning)
+            clf = LogisticRegression(max_iter=max_iter, **cfg_params)
+            clf.fit(X_train, y_train)
+        result["fit_seconds"] = time.perf_counter() - started
+        result["auc"] = roc_auc_score(y_val, clf.predict_proba(X_val)[:, 1])
+    except (ValueError, FloatingPointError) as e:
+        result["fit_seconds"] = time.perf_counter() - started
+        result["error"] = str(e)
+    return result
+
+
+def run_search(cfg: TrainConfig, preprocessor, X, y) -> list:
+    """
+    Cross-validate every configuration of the search space and return
+    one result row per configuration, best mean ROC-AUC first.
+    """
+    space = search_space(cfg.search, cfg.n_iter, cfg.random_state)
+    print(f"Searching {len(space)} configurations with {cfg.cv_folds}-fold CV "
+          f"on {cfg.jobs} process(es)...")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="stroke_cv_") as fold_dir:
+        prepare_folds(preprocessor, X, y, cfg.cv_folds, cfg.random_state, fold_dir)
+        tasks = [
+            (config_id, params, fold_dir, fold, cfg.max_iter)
+            for config_id, params in enumerate(space)
+            for fold in range(cfg.cv_folds)
+        ]
+        if cfg.jobs > 1:
+            with ProcessPoolExecutor(max_workers=cfg.jobs) as pool:
+                fold_results = list(pool.map(_evaluate_fold, tasks, chunksize=4))
+        else:
+            fold_results = [_evaluate_fold(task) for task in tasks]
+    print(f"Search finished in {time.perf_counter() - started:.1f}s")
+
+    rows = []
+    for config_id, params in enumerate(space):
+        results = [r for r in fold_results if r["config"] == config_id]
+        aucs = np.array([r["auc"] for r in results], dtype=float)
+        fit_times = [r["fit_seconds"] for r in results]
+        errors = sorted({r["error"] for r in results if r["error"]})
+        failed = bool(errors) or np.isnan(aucs).any()
+        rows.append({
+            "config": config_id,
+            **params,
+            "mean_roc_auc": float("nan") if failed else float(aucs.mean()),
+            "std_roc_auc": float("nan") if failed else float(aucs.std()),
+            "mean_fit_seconds": float(np.mean(fit_times)),
+            "total_fit_seconds": float(np.sum(fit_times)),
+            "error": "; ".join(errors),
+        })
+
+    rows.sort(key=lambda r: (np.isnan(r["mean_roc_auc"]), -np.nan_to_num(r["mean_roc_auc"])))
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+    return rows
+
+
+def write_search_results(rows: list, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({name: row.get(name) for name in RESULT_COLUMNS})
+
+
+def print_search_results(rows: list, top: int = 5) -> None:
+    print(f"{'rank':>4}  {'C':>9}  {'penalty':<10} {'solver':<9} {'class_weight':<12} "
+          f"{'roc_auc':>14}  {'fit s':>7}")
+    for row in rows[:top]:
+        print(f"{row['rank']:>4}  {row['C']:>9.4g}  {row['penalty']:<10} {row['solver']:<9} "
+              f"{str(row['class_weight']):<12} {row['mean_roc_auc']:>7.4f}±{row['std_roc_auc']:.4f}  "
+              f"{row['mean_fit_seconds']:>7.3f}")
+
+
+def train_and_save(cfg: TrainConfig) -> None:
+    if cfg.streaming:
+        train_streaming(cfg)
+        return
+
+    X, y = load_dataset(cfg)
+    pipeline, meta = build_pipeline(cfg)
 
     n_samples = len(y)
     n_classes = y.nunique()
@@ -164,6 +505,26 @@ def train_and_save(cfg: TrainConfig) -> None:
             stratify=y,
         )
 
+    if cfg.search:
+        if n_classes < 2 or y_train.value_counts().min() < cfg.cv_folds:
+            print(f"Not enough samples per class for {cfg.cv_folds}-fold CV; skipping the search.")
+        else:
+            rows = run_search(cfg, pipeline.named_steps["preprocess"], X_train, y_train)
+            results_path = cfg.search_results or cfg.output_model.with_name(
+                cfg.output_model.stem + "_search.csv"
+            )
+            write_search_results(rows, results_path)
+            print_search_results(rows)
+            print(f"Search results saved to {results_path}")
+
+            best = rows[0]
+            if np.isnan(best["mean_roc_auc"]):
+                raise RuntimeError("Every configuration failed; see the search results.")
+            cfg.C, cfg.penalty, cfg.solver = best["C"], best["penalty"], best["solver"]
+            cfg.class_weight, cfg.l1_ratio = best["class_weight"], best["l1_ratio"]
+            pipeline.set_params(**{f"clf__{k}": v for k, v in classifier_params(cfg).items()})
+            print(f"Best configuration: {classifier_params(cfg)}")
+
     print("Training Logistic Regression model...")
     pipeline.fit(X_train, y_train)
 
@@ -189,7 +550,10 @@ def train_and_save(cfg: TrainConfig) -> None:
     print("Classification report:")
     print(classification_report(y_test, y_pred))
 
-    # Save the model bundle
+    save_bundle(pipeline, cfg, meta)
+
+
+def save_bundle(pipeline, cfg: TrainConfig, meta: dict) -> None:
     cfg.output_model.parent.mkdir(parents=True, exist_ok=True)
     bundle = {
         "pipeline": pipeline,
@@ -198,6 +562,223 @@ def train_and_save(cfg: TrainConfig) -> None:
     }
     joblib.dump(bundle, cfg.output_model)
     print(f"Model saved to {cfg.output_model}")
+    export_compact(pipeline, cfg.output_model, cfg.version)
+
+
+# ---------------------------
+# Streaming (out-of-core) training
+# ---------------------------
+# For datasets larger than memory. The source (CSV or patients.db) is
+# only ever read chunk by chunk:
+#  pass 1:  category vocabulary, class counts, numeric mean/std and a
+#           bounded random sample of BMI values for the median
+#  epochs:  SGDClassifier(loss="log_loss").partial_fit on each chunk
+#  last:    evaluation on the held-out rows (every 1/test_size-th row)
+# Numeric features are standardized while training, which SGD needs to
+# converge, and the scaling is folded back into the coefficients at the
+# end. The saved pipeline therefore has the same passthrough + one-hot
+# shape as the batch model, and app/ml.py loads and compiles it as is.
+
+def iter_source_chunks(cfg: TrainConfig) -> Iterator[pd.DataFrame]:
+    """Cleaned chunks of the training source, always in the same order."""
+    if cfg.input_db is not None:
+        if not cfg.input_db.exists():
+            raise FileNotFoundError(f"Database not found: {cfg.input_db}")
+        columns = ", ".join(FEATURE_COLS + [TARGET_COL])
+        query = f"SELECT {columns} FROM patients WHERE stroke IS NOT NULL ORDER BY id"
+        conn = sqlite3.connect(f"file:{cfg.input_db}?mode=ro", uri=True)
+        try:
+            chunks = pd.read_sql_query(query, conn, chunksize=cfg.chunk_size)
+            for chunk in chunks:
+                yield clean_frame(chunk)
+        finally:
+            conn.close()
+    else:
+        if not cfg.input_csv.exists():
+            raise FileNotFoundError(f"CSV not found: {cfg.input_csv}")
+        for chunk in pd.read_csv(cfg.input_csv, chunksize=cfg.chunk_size):
+            yield clean_frame(chunk)
+
+
+def iter_split_chunks(cfg: TrainConfig, bmi_fill=None):
+    """
+    Yield (X, y, is_test) per chunk. A row is held out when its position
+    in the cleaned stream is a multiple of 1/test_size, which gives the
+    same split on every pass without storing it.
+    """
+    holdout_every = round(1 / cfg.test_size) if cfg.test_size > 0 else 0
+    position = 0
+    for chunk in iter_source_chunks(cfg):
+        X = chunk[FEATURE_COLS]
+        if bmi_fill is not None:
+            X = X.assign(bmi=X["bmi"].fillna(bmi_fill))
+        positions = np.arange(position, position + len(chunk))
+        position += len(chunk)
+        if holdout_every:
+            is_test = positions % holdout_every == 0
+        else:
+            is_test = np.zeros(len(chunk), dtype=bool)
+        yield X, chunk[TARGET_COL].to_numpy(), is_test
+
+
+class StreamStats:
+    """Pass-1 statistics of the training rows, in bounded memory."""
+
+    def __init__(self, sample_size: int, random_state: int):
+        self.categories = {name: set() for name in CATEGORICAL_FEATURES}
+        self.class_counts = np.zeros(2, dtype=np.int64)
+        self.count = np.zeros(len(NUMERIC_FEATURES))
+        self.sum = np.zeros(len(NUMERIC_FEATURES))
+        self.sumsq = np.zeros(len(NUMERIC_FEATURES))
+        # Bottom-k sample: keep the BMI values with the smallest random keys
+        self.sample_size = sample_size
+        self.bmi_sample = np.empty(0)
+        self.bmi_keys = np.empty(0)
+        self.rng = np.random.default_rng(random_state)
+
+    def update(self, X: pd.DataFrame, y: np.ndarray) -> None:
+        for name in CATEGORICAL_FEATURES:
+            self.categories[name].update(X[name].dropna().astype(str).unique())
+        self.class_counts += np.bincount(y, minlength=2)[:2]
+
+        values = X[NUMERIC_FEATURES].to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        self.count += present.sum(axis=0)
+        self.sum += np.where(present, values, 0.0).sum(axis=0)
+        self.sumsq += np.where(present, values ** 2, 0.0).sum(axis=0)
+
+        bmi = X["bmi"].dropna().to_numpy(dtype=float)
+        self.bmi_sample = np.concatenate([self.bmi_sample, bmi])
+        self.bmi_keys = np.concatenate([self.bmi_keys, self.rng.random(len(bmi))])
+        if len(self.bmi_keys) > self.sample_size:
+            keep = np.argpartition(self.bmi_keys, self.sample_size)[: self.sample_size]
+            self.bmi_sample, self.bmi_keys = self.bmi_sample[keep], self.bmi_keys[keep]
+
+    def bmi_median(self) -> float:
+        return float(np.median(self.bmi_sample))
+
+    def scaling(self, bmi_fill: float):
+        """Mean and std of the numeric features, with missing BMI filled."""
+        n = self.class_counts.sum()
+        missing = n - self.count
+        bmi = NUMERIC_FEATURES.index("bmi")
+        total, total_sq = self.sum.copy(), self.sumsq.copy()
+        total[bmi] += missing[bmi] * bmi_fill
+        total_sq[bmi] += missing[bmi] * bmi_fill ** 2
+        mean = total / n
+        std = np.sqrt(np.maximum(total_sq / n - mean ** 2, 0.0))
+        return mean, np.where(std > 0, std, 1.0)
+
+    def class_weights(self, balanced: bool) -> np.ndarray:
+        # Same weights as class_weight="balanced": n / (2 * count)
+        if not balanced:
+            return np.ones(2)
+        return self.class_counts.sum() / (2.0 * np.maximum(self.class_counts, 1))
+
+
+def _dense(matrix) -> np.ndarray:
+    if sparse.issparse(matrix):
+        matrix = matrix.toarray()
+    return np.asarray(matrix, dtype=float)
+
+
+def train_streaming(cfg: TrainConfig) -> None:
+    source = cfg.input_db or cfg.input_csv
+    print(f"Streaming training data from {source} in chunks of {cfg.chunk_size} rows")
+
+    # ---- Pass 1: vocabulary and statistics ----
+    stats = StreamStats(cfg.sample_size, cfg.random_state)
+    n_test = 0
+    for X, y, is_test in iter_split_chunks(cfg):
+        stats.update(X[~is_test], y[~is_test])
+        n_test += int(is_test.sum())
+    n_train = int(stats.class_counts.sum())
+    print(f"Training rows: {n_train} (strokes: {stats.class_counts[1]}), held out: {n_test}")
+    if n_train == 0 or (stats.class_counts == 0).any():
+        raise ValueError("Streaming training needs both classes in the training rows.")
+
+    bmi_fill = stats.bmi_median()
+    mean, std = stats.scaling(bmi_fill)
+    weights = stats.class_weights(cfg.class_weight == "balanced")
+    categories = [sorted(stats.categories[name]) for name in CATEGORICAL_FEATURES]
+    preprocessor = None
+    n_numeric = len(NUMERIC_FEATURES)
+
+    clf = SGDClassifier(
+        loss="log_loss",
+        penalty=cfg.penalty if cfg.penalty in ("l1", "l2", "elasticnet") else None,
+        alpha=cfg.alpha,
+        l1_ratio=cfg.l1_ratio if cfg.l1_ratio is not None else 0.15,
+        # Averaged SGD: much less sensitive to the last chunks seen
+        average=True,
+        random_state=cfg.random_state,
+    )
+    rng = np.random.default_rng(cfg.random_state)
+
+    # ---- Passes 2..: incremental fitting ----
+    for epoch in range(1, cfg.epochs + 1):
+        started = time.perf_counter()
+        for X, y, is_test in iter_split_chunks(cfg, bmi_fill):
+            X, y = X[~is_test], y[~is_test]
+            complete = X[NUMERIC_FEATURES].notna().all(axis=1).to_numpy()
+            X, y = X[complete], y[complete]
+            if len(y) == 0:
+                continue
+            if preprocessor is None:
+                # Categories are fixed, so fitting on one chunk is enough
+                preprocessor = make_preprocessor(categories).fit(X)
+            Xt = _dense(preprocessor.transform(X))
+            Xt[:, :n_numeric] = (Xt[:, :n_numeric] - mean) / std
+            order = rng.permutation(len(y))
+            clf.partial_fit(Xt[order], y[order], classes=np.array([0, 1]), sample_weight=weights[y[order]])
+        print(f"Epoch {epoch}/{cfg.epochs} done in {time.perf_counter() - started:.1f}s")
+    if preprocessor is None:
+        raise ValueError("Streaming training found no complete training rows.")
+
+    # Fold the standardization into the coefficients: w/std on the raw
+    # values, and the mean shift into the intercept
+    coef = clf.coef_[0].copy()
+    coef_numeric = coef[:n_numeric] / std
+    intercept = clf.intercept_[0] - float(np.sum(coef_numeric * mean))
+    coef[:n_numeric] = coef_numeric
+    clf.coef_ = coef.reshape(1, -1)
+    clf.intercept_ = np.array([intercept])
+
+    pipeline = Pipeline(steps=[("preprocess", preprocessor), ("clf", clf)])
+
+    # ---- Last pass: evaluation on the held-out rows ----
+    if n_test:
+        print("Evaluating model on held-out rows...")
+        y_true, y_proba = [], []
+        for X, y, is_test in iter_split_chunks(cfg, bmi_fill):
+            X, y = X[is_test], y[is_test]
+            complete = X[NUMERIC_FEATURES].notna().all(axis=1).to_numpy()
+            if complete.any():
+                y_proba.append(pipeline.predict_proba(X[complete])[:, 1].astype(np.float32))
+                y_true.append(y[complete].astype(np.int8))
+        if not y_true:
+            # Small file or many missing values: nothing to score
+            print("No evaluation rows: every held-out row has missing numeric values.")
+        else:
+            y_true, y_proba = np.concatenate(y_true), np.concatenate(y_proba)
+            print(f"Accuracy: {accuracy_score(y_true, (y_proba > 0.5).astype(int)):.4f}")
+            if len(np.unique(y_true)) == 2:
+                print(f"ROC-AUC: {roc_auc_score(y_true, y_proba):.4f}")
+
+    meta = training_meta()
+    meta.update({"trainer": "sgd_streaming", "bmi_fill": bmi_fill, "n_train": n_train})
+    save_bundle(pipeline, cfg, meta)
+
+
+def export_compact(pipeline, output_model: Path, version: str) -> None:
+    # Compact artifact (JSON header + .npy weights) loaded by the app
+    # without sklearn; written after the bundle, whose sha256 it records
+    scorer = CompiledScorer.from_pipeline(pipeline)
+    if scorer is None:
+        print("Pipeline cannot be compiled; only the joblib bundle was written.")
+        return
+    header_path, weights_path = scorer.save(output_model, version)
+    print(f"Compact artifact saved to {header_path} and {weights_path}")
 
 
 def parse_args() -> TrainConfig:
@@ -205,9 +786,13 @@ def parse_args() -> TrainConfig:
     parser.add_argument(
         "--input-csv",
         type=str,
-        required=True,
         help="Path to stroke dataset CSV (e.g. data/patients.csv)",
     )
+    parser.add_argument(
+        "--input-db",
+        type=str,
+        help="Train from the patients table of a SQLite database (with --streaming).",
+    )
     parser.add_argument(
         "--output-model",
         type=str,
@@ -218,7 +803,7 @@ def parse_args() -> TrainConfig:
         "--version",
         type=str,
         default="logreg_v1",
-        help="Model version tag to store in the bundle.",
+        help="Model version tag to store in the bundle; the app appends a digest of the weights.",
     )
     parser.add_argument("--C", type=float, default=1.0)
     parser.add_argument(
@@ -228,15 +813,69 @@ def parse_args() -> TrainConfig:
         choices=["l1", "l2", "elasticnet", "none"],
     )
     parser.add_argument("--solver", type=str, default="lbfgs")
+    parser.add_argument(
+        "--class-weight",
+        type=str,
+        default="balanced",
+        choices=["balanced", "none"],
+    )
+    parser.add_argument(
+        "--search",
+        choices=["grid", "random"],
+        help="Pick C, penalty, solver and class weight by cross-validated ROC-AUC.",
+    )
+    parser.add_argument("--n-iter", type=int, default=20, help="Configurations tried by --search random.")
+    parser.add_argument("--cv-folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for --search.")
+    parser.add_argument(
+        "--search-results",
+        type=str,
+        help="CSV of per-configuration results (default: next to the model).",
+    )
+
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Out-of-core training with SGDClassifier over chunks of the input.",
+    )
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per chunk with --streaming.")
+    parser.add_argument("--epochs", type=int, default=5, help="Passes over the data with --streaming.")
+    parser.add_argument("--alpha", type=float, default=1e-4, help="SGD regularization strength.")
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=str(DEFAULT_CACHE_DIR),
+        help="Where cleaned datasets are cached between runs.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always re-parse and clean the CSV.")
 
     args = parser.parse_args()
+    if bool(args.input_csv) == bool(args.input_db):
+        parser.error("give exactly one of --input-csv or --input-db")
+    if args.input_db and not args.streaming:
+        parser.error("--input-db requires --streaming")
+    if args.streaming and args.search:
+        parser.error("--search is not available with --streaming")
     return TrainConfig(
-        input_csv=Path(args.input_csv),
+        input_csv=Path(args.input_csv) if args.input_csv else None,
         output_model=Path(args.output_model),
         version=args.version,
         C=args.C,
         penalty=args.penalty,
         solver=args.solver,
+        class_weight=None if args.class_weight == "none" else args.class_weight,
+        search=args.search,
+        n_iter=args.n_iter,
+        cv_folds=args.cv_folds,
+        jobs=max(1, args.jobs),
+        search_results=Path(args.search_results) if args.search_results else None,
+        streaming=args.streaming,
+        input_db=Path(args.input_db) if args.input_db else None,
+        chunk_size=args.chunk_size,
+        epochs=args.epochs,
+        alpha=args.alpha,
+        cache_dir=None if args.no_cache else Path(args.cache_dir),
     )
 
 
@@ -5,7 +5,33 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app import create_app, db
+from app.cli import init_db, seed_admin
+import app.mongo_mirror as mongo_mirror_module
 import pytest
+from pymongo import errors
+
+
+class StandInCollection:
+    """
+    Local stand-in for the Mongo patients collection.
+    Records bulk_write calls; can be told to fail like a down server.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.down = False
+
+    def bulk_write(self, requests, ordered=True):
+        if self.down:
+            raise errors.ServerSelectionTimeoutError("mongo is down")
+        self.calls.append((requests, ordered))
+
+
+@pytest.fixture
+def mongo_collection(monkeypatch):
+    coll = StandInCollection()
+    monkeypatch.setattr(mongo_mirror_module, "get_patients_collection", lambda: coll)
+    return coll
 
 @pytest.fixture
 def app():
@@ -27,3 +53,35 @@ def client(app):
     Flask test client for sending requests.
     """
     return app.test_client()
+
+
+@pytest.fixture
+def db_app(tmp_path, mongo_collection):
+    """
+    App instance backed by throwaway SQLite files, for tests that
+    read or write patient records. Mongo mirroring is synchronous
+    and goes to the stand-in collection.
+    """
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp_path / "auth.db"),
+        "SQLALCHEMY_BINDS": {"patients": "sqlite:///" + str(tmp_path / "patients.db")},
+        "MONGO_MIRROR_SPILL_PATH": str(tmp_path / "mongo_mirror_spill.jsonl"),
+        "MONGO_MIRROR_ASYNC": False,
+    })
+    with app.app_context():
+        init_db()
+        seed_admin()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def logged_in_client(db_app):
+    client = db_app.test_client()
+    client.post("/login", data={"username": "admin", "password": "admin123"})
+    return client
@@ -0,0 +1,99 @@
+from app import db
+from app.models import Patient
+from app.stats import recompute_stats
+
+
+def _patient(**overrides):
+    item = {
+        "gender": "Female",
+        "age": 67,
+        "hypertension": 0,
+        "heart_disease": 1,
+        "ever_married": "Yes",
+        "work_type": "Private",
+        "residence_type": "Urban",
+        "avg_glucose_level": 228.69,
+        "bmi": 36.6,
+        "smoking_status": "formerly smoked",
+        "stroke": 1,
+    }
+    item.update(overrides)
+    return item
+
+
+def test_bulk_create_reports_per_item_errors_and_mirrors_once(db_app, logged_in_client, mongo_collection):
+    response = logged_in_client.post("/api/v1/patients/bulk", json=[
+        _patient(),
+        _patient(age=-5, colour="blue"),
+        _patient(gender="Male", bmi=None, stroke=None),
+    ])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body["written"], body["failed"]) == (2, 1)
+    ok, bad, ok2 = body["results"]
+    assert set(bad["errors"]) == {"age", "colour"} and "id" not in bad
+    assert ok["id"] and ok2["id"] and ok["id"] != ok2["id"]
+
+    with db_app.app_context():
+        patients = Patient.query.order_by(Patient.id).all()
+        assert [p.id for p in patients] == [ok["id"], ok2["id"]]
+        assert patients[1].gender == "Male" and patients[1].bmi is None
+        # Dashboard statistics were updated in the same transaction
+        assert recompute_stats(write=False) == []
+
+    assert len(mongo_collection.calls) == 1
+    requests, _ = mongo_collection.calls[0]
+    assert len(requests) == 2
+
+
+def test_atomic_batch_writes_nothing_on_error(db_app, logged_in_client, mongo_collection):
+    response = logged_in_client.post(
+        "/api/v1/patients/bulk?atomic=1", json=[_patient(), _patient(gender="Robot")]
+    )
+    assert response.status_code == 422
+    assert response.get_json()["written"] == 0
+    with db_app.app_context():
+        assert Patient.query.count() == 0
+    assert mongo_collection.calls == []
+
+
+def test_bulk_update_and_delete(db_app, logged_in_client, mongo_collection):
+    created = logged_in_client.post("/api/v1/patients/bulk", json=[_patient(), _patient()])
+    first, second = (r["id"] for r in created.get_json()["results"])
+
+    response = logged_in_client.put("/api/v1/patients/bulk", json=[
+        _patient(id=first, age=70, stroke=0),
+        _patient(id=999),
+    ])
+    assert response.status_code == 207
+    assert response.get_json()["results"][1]["errors"] == {"id": ["No patient with this id."]}
+    with db_app.app_context():
+        patient = db.session.get(Patient, first)
+        assert (patient.age, patient.stroke, patient.version) == (70, False, 2)
+        assert recompute_stats(write=False) == []
+
+    response = logged_in_client.delete("/api/v1/patients/bulk", json={"ids": [second, second]})
+    assert response.status_code == 207
+    with db_app.app_context():
+        assert [p.id for p in Patient.query.all()] == [first]
+        assert recompute_stats(write=False) == []
+    assert len(mongo_collection.calls) == 3
+
+
+def test_api_requires_auth_and_json(db_app, logged_in_client):
+    db_app.config["API_TOKENS"] = ("secret-token",)
+    anonymous = db_app.test_client()
+    assert anonymous.post("/api/v1/patients/bulk", json=[]).status_code == 401
+    assert anonymous.post(
+        "/api/v1/patients/bulk", json=[], headers={"Authorization": "Bearer wrong"}
+    ).status_code == 401
+    assert anonymous.post(
+        "/api/v1/patients/bulk", json=[], headers={"Authorization": "Bearer é"}
+    ).status_code == 401
+    assert anonymous.post(
+        "/api/v1/patients/bulk", json=[_patient()],
+        headers={"Authorization": "Bearer secret-token"},
+    ).status_code == 200
+
+    assert logged_in_client.post("/api/v1/patients/bulk", data={"age": "5"}).status_code == 415
+    assert logged_in_client.post("/api/v1/patients/bulk", json={"nope": 1}).status_code == 400
@@ -17,3 +17,44 @@ def test_protected_route_redirects_when_not_logged_in(client):
     assert response.status_code in (301, 302)
     # Location header should point to login route
     assert "/login" in (response.headers.get("Location") or "")
+
+
+def _auth_queries(db_app):
+    from sqlalchemy import event
+    from app import db
+
+    statements = []
+    with db_app.app_context():
+        engine = db.engines[None]
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_user_loader_cache_skips_auth_db_until_user_changes(db_app, logged_in_client):
+    from app import db
+    from app.models import User, user_cache_stats
+
+    logged_in_client.get("/dashboard")  # first load fills the cache
+    statements = _auth_queries(db_app)
+    logged_in_client.get("/dashboard")
+    logged_in_client.get("/dashboard")
+    assert not any("FROM users" in s for s in statements)
+    assert user_cache_stats()["hits"] >= 2
+
+    # A password change evicts the cached copy; the next request reloads it
+    with db_app.app_context():
+        user = User.query.filter_by(username="admin").first()
+        user.set_password("changed")
+        db.session.commit()
+    statements.clear()
+    assert logged_in_client.get("/dashboard").status_code == 200
+    assert any("FROM users" in s for s in statements)
+
+    # A deleted user is logged out instead of being served from the cache
+    with db_app.app_context():
+        db.session.delete(User.query.filter_by(username="admin").first())
+        db.session.commit()
+    response = logged_in_client.get("/dashboard")
+    assert response.status_code == 302
+    assert "/login" in response.headers["Location"]
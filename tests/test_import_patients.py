@@ -0,0 +1,141 @@
+import csv
+
+import pytest
+
+from sqlalchemy import text
+
+import scripts.import_patients as importer
+from app import db
+from app.models import Patient
+
+FIELDS = ["id", "gender", "age", "hypertension", "heart_disease", "ever_married", "work_type",
+          "Residence_type", "avg_glucose_level", "bmi", "smoking_status", "stroke"]
+
+
+def _write_csv(path, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for i, row in enumerate(rows, start=1):
+            writer.writerow({
+                "gender": "Female", "age": 50, "hypertension": 0, "heart_disease": 0,
+                "ever_married": "Yes", "work_type": "Private", "Residence_type": "Urban",
+                "avg_glucose_level": 90.5, "bmi": 24.0, "smoking_status": "never smoked",
+                "stroke": 0, **row,
+            })
+
+
+class UpsertingCollection:
+    """Stand-in collection that applies $set upserts keyed on sql_id."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, keys, name=None, **options):
+        return name
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            # upsert_request: [{"$replaceWith": {"$cond": [newer, {"$literal": doc}, ...]}}]
+            doc = request._doc[0]["$replaceWith"]["$cond"][1]["$literal"]
+            self.docs[doc["sql_id"]] = doc
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    collection = UpsertingCollection()
+    monkeypatch.setattr(importer, "get_patients_collection", lambda: collection)
+    return collection
+
+
+def test_reimport_mirrors_the_sql_row_versions(db_app, tmp_path, mongo, capsys):
+    csv_path = tmp_path / "patients.csv"
+    _write_csv(csv_path, [{"id": 1}, {"id": 2}, {"id": ""}, {"id": 2}])
+    for _ in range(2):
+        importer.import_patients(csv_path, restart=True, mongo=True, app=db_app)
+    out = capsys.readouterr().out
+    assert "Imported 3 new and updated 0 existing patients" in out
+    # The rerun replaces ids 1 and 2, and row 3 has no id: it is new again
+    assert "Imported 1 new and updated 2 existing patients" in out
+
+    with db_app.app_context():
+        stored = {p.id: p for p in db.session.query(Patient)}
+    docs = mongo.docs
+    assert stored[1].version == 2 and stored[4].version == 1
+    assert set(docs) == set(stored)
+    for sql_id, patient in stored.items():
+        assert docs[sql_id]["version"] == patient.version
+        assert docs[sql_id]["updated_at"] is not None
+
+
+def test_resumed_import_does_not_insert_committed_rows_again(db_app, tmp_path, monkeypatch):
+    from app.stats import recompute_stats
+
+    csv_path = tmp_path / "patients.csv"
+    _write_csv(csv_path, [{"id": ""} for _ in range(10)])
+
+    write_chunk, calls = importer.write_chunk, []
+
+    def crash_on_third_chunk(conn, rows, **kwargs):
+        calls.append(len(rows))
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return write_chunk(conn, rows, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(importer, "write_chunk", crash_on_third_chunk)
+        with pytest.raises(KeyboardInterrupt):
+            importer.import_patients(csv_path, chunk_size=3, app=db_app)
+
+    with db_app.app_context():
+        assert db.session.query(Patient).count() == 6
+    importer.import_patients(csv_path, chunk_size=3, app=db_app)
+
+    with db_app.app_context():
+        assert db.session.query(Patient).count() == 10
+        assert recompute_stats(write=False) == []
+        # A finished import leaves no checkpoint behind
+        assert db.session.query(importer.ImportCheckpoint).count() == 0
+
+
+def test_failed_mongo_batches_are_counted_and_sent_again(db_app, tmp_path, mongo, monkeypatch, capsys):
+    csv_path = tmp_path / "patients.csv"
+    _write_csv(csv_path, [{"id": ""} for _ in range(4)])
+
+    # Not a PyMongoError: used to disappear inside the writer's future
+    with monkeypatch.context() as m:
+        m.setattr(mongo, "bulk_write", lambda requests, ordered=True: 1 / 0)
+        importer.import_patients(csv_path, chunk_size=2, mongo=True, app=db_app)
+    out = capsys.readouterr().out
+    assert "MongoDB: 0 documents upserted" in out and "4 failed" in out
+
+    with db_app.app_context():
+        checkpoint = db.session.query(importer.ImportCheckpoint).one()
+        assert checkpoint.mongo_pending_since is not None
+
+    # The rerun skips the CSV (already in SQL) and re-sends the rows
+    importer.import_patients(csv_path, chunk_size=2, mongo=True, app=db_app)
+    with db_app.app_context():
+        assert db.session.query(Patient).count() == 4
+        assert db.session.query(importer.ImportCheckpoint).count() == 0
+    assert sorted(mongo.docs) == [1, 2, 3, 4]
+
+
+def test_import_upgrades_an_old_patients_table(db_app, tmp_path):
+    with db_app.app_context():
+        with db.engines["patients"].begin() as conn:
+            conn.execute(text("DROP TABLE patients"))
+            conn.execute(text(
+                "CREATE TABLE patients (id INTEGER PRIMARY KEY, gender VARCHAR(20), "
+                "age FLOAT, hypertension BOOLEAN, heart_disease BOOLEAN, "
+                "ever_married VARCHAR(10), work_type VARCHAR(50), "
+                "residence_type VARCHAR(20), avg_glucose_level FLOAT, bmi FLOAT, "
+                "smoking_status VARCHAR(50), stroke BOOLEAN, created_at DATETIME NOT NULL)"
+            ))
+
+    csv_path = tmp_path / "patients.csv"
+    _write_csv(csv_path, [{"id": 1}, {"id": ""}])
+    importer.import_patients(csv_path, app=db_app)
+
+    with db_app.app_context():
+        assert [p.version for p in db.session.query(Patient).order_by(Patient.id)] == [1, 1]
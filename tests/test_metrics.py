@@ -0,0 +1,89 @@
+import logging
+import re
+from types import SimpleNamespace
+
+from app import metrics
+
+
+def _sample(text, name, **labels):
+    """Value of one sample line in Prometheus text output."""
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = "^" + re.escape(name + ("{" + label_text + "}" if labels else "")) + r" (\S+)"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("demo_seconds", "Demo.", ("kind",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, kind='a"b')
+    text = "\n".join(hist.render())
+
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{kind="a\\"b",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{kind="a\\"b",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{kind="a\\"b",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{kind="a\\"b"} 4' in text
+    assert hist.total(kind='a"b') == 4.05
+
+
+def test_requests_sql_and_predictions_are_exposed(db_app, logged_in_client):
+    before = metrics.REQUEST_SQL_STATEMENTS.total(endpoint="main.patients_list")
+    before_count = metrics.REQUEST_SQL_STATEMENTS.count(endpoint="main.patients_list")
+    predictions = metrics.PREDICTION_ROWS.value(kind="batch")
+    assert logged_in_client.get("/patients").status_code == 200
+    # Saving a patient scores it with the model
+    logged_in_client.post("/patients/new", data={
+        "gender": "Male", "age": "60", "hypertension": "0", "heart_disease": "0",
+        "ever_married": "Yes", "work_type": "Private", "residence_type": "Urban",
+        "avg_glucose_level": "100", "bmi": "25", "smoking_status": "smokes", "stroke": "0",
+    })
+    assert metrics.PREDICTION_ROWS.value(kind="batch") == predictions + 1
+
+    # Listing a page runs at least one SQL statement, counted per request
+    assert metrics.REQUEST_SQL_STATEMENTS.count(endpoint="main.patients_list") == before_count + 1
+    assert metrics.REQUEST_SQL_STATEMENTS.total(endpoint="main.patients_list") > before
+
+    text = logged_in_client.get("/metrics").get_data(as_text=True)
+    assert _sample(text, "http_request_duration_seconds_count",
+                   endpoint="main.patients_list", method="GET", status="200") >= 1
+    assert _sample(text, "db_statement_duration_seconds_count", bind="patients") > 0
+    assert _sample(text, "model_load_seconds_count", format="compact", outcome="ok") >= 1
+    assert _sample(text, "prediction_duration_seconds_count", kind="batch") >= 1
+    # Scoring the new patient looked it up in the prediction cache
+    assert _sample(text, "prediction_cache_lookups_total", result="miss") >= 1
+    assert _sample(text, "prediction_cache_entries") >= 1
+    assert "hits" in logged_in_client.get("/admin/status").get_json()["prediction_cache"]
+
+
+def test_metrics_token_and_slow_request_log(db_app, caplog):
+    client = db_app.test_client()
+    db_app.config.update(METRICS_TOKEN="s3cret", SLOW_REQUEST_THRESHOLD=1e-9)
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer é"}).status_code == 401
+    with caplog.at_level(logging.WARNING):
+        response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert any("Slow request: GET /metrics" in r.getMessage() for r in caplog.records)
+
+
+def test_metrics_are_not_public_without_a_token(db_app):
+    client = db_app.test_client()
+    db_app.config.update(TESTING=False, METRICS_TOKEN=None)
+    assert client.get("/metrics").status_code == 404
+
+    db_app.config["METRICS_TOKEN"] = "s3cret"
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+
+
+def test_mongo_command_listener_records_latency():
+    listener = metrics.MongoCommandListener()
+    before = metrics.MONGO_COMMAND_SECONDS.count(command="bulkWrite", outcome="error")
+    listener.failed(SimpleNamespace(command_name="bulkWrite", duration_micros=1500))
+    listener.succeeded(SimpleNamespace(command_name="ping", duration_micros=200))
+
+    assert metrics.MONGO_COMMAND_SECONDS.count(command="bulkWrite", outcome="error") == before + 1
+    assert metrics.MONGO_COMMAND_SECONDS.count(command="ping", outcome="ok") >= 1
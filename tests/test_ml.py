@@ -0,0 +1,212 @@
+import pytest
+
+pytest.importorskip("sklearn")
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import joblib
+import pandas as pd
+
+from app import ml
+from app.models import Patient
+
+
+def _patients():
+    return [
+        Patient(gender="Male", age=67, hypertension=0, heart_disease=1,
+                ever_married="Yes", work_type="Private", residence_type="Urban",
+                avg_glucose_level=228.69, bmi=36.6, smoking_status="formerly smoked"),
+        Patient(gender="Female", age=49, hypertension=1, heart_disease=0,
+                ever_married="No", work_type="Self-employed", residence_type="Rural",
+                avg_glucose_level=171.23, bmi=34.4, smoking_status="smokes"),
+        Patient(gender="Female", age=8, hypertension=0, heart_disease=0,
+                ever_married="No", work_type="children", residence_type="Urban",
+                avg_glucose_level=95.0, bmi=18.2, smoking_status="Unknown"),
+        # Category never seen in training: ignored by both paths
+        Patient(gender="Other", age=35, hypertension=0, heart_disease=0,
+                ever_married="Yes", work_type="Never_worked", residence_type="Rural",
+                avg_glucose_level=80.5, bmi=24.0, smoking_status="never smoked"),
+    ]
+
+
+def test_compiled_scorer_matches_sklearn_pipeline():
+    """
+    The compiled scorer (loaded from the compact artifact when it is
+    shipped) must give the same probabilities as
+    pipeline.predict_proba for the shipped model.
+    """
+    bundle = joblib.load(ml.DEFAULT_MODEL_PATH)
+    pipeline = bundle["pipeline"]
+    scorer = ml.current_model().scorer
+    assert scorer is not None
+
+    patients = _patients()
+    rows = [ml.patient_features(p) for p in patients]
+    expected = pipeline.predict_proba(pd.DataFrame(rows, columns=ml.FEATURE_COLS))[:, 1]
+
+    batch = scorer.predict_proba_many(rows)
+    single = [scorer.predict_proba(row) for row in rows]
+
+    assert batch == pytest.approx(expected, rel=1e-9, abs=1e-12)
+    assert single == pytest.approx(list(expected), rel=1e-9, abs=1e-12)
+
+
+def test_predict_for_patients_matches_single_predictions():
+    patients = _patients()
+    batch = ml.predict_for_patients(patients)
+
+    assert len(batch) == len(patients)
+    for patient, (proba, label) in zip(patients, batch):
+        single_proba, single_label = ml.predict_for_patient(patient)
+        assert proba == pytest.approx(single_proba)
+        assert label == single_label == int(proba > 0.5)
+
+
+def test_prediction_cache_hits_and_invalidation():
+    cache = ml.PredictionCache(maxsize=2)
+    rows = [ml.patient_features(p) for p in _patients()[:3]]
+    keys = [cache.make_key(row, "v1") for row in rows]
+
+    assert cache.get(keys[0]) is None
+    cache.put(keys[0], (0.1, 0), patient_id=1)
+    assert cache.get(keys[0]) == (0.1, 0)
+
+    # Third entry evicts the least recently used one
+    cache.put(keys[1], (0.2, 0), patient_id=2)
+    cache.put(keys[2], (0.9, 1), patient_id=3)
+    assert cache.get(keys[0]) is None
+    assert cache.stats()["evictions"] == 1
+
+    # Explicit invalidation after an edit/delete
+    cache.invalidate_patient(3)
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["invalidations"] == 1
+
+    # A new model version drops everything
+    assert cache.get(keys[1]) == (0.2, 0)
+    assert cache.get(cache.make_key(rows[1], "v2")) is None
+    assert cache.stats()["size"] == 0
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 4
+
+
+def test_warm_up_loads_model_from_path_relative_to_project(monkeypatch, tmp_path):
+    # Path resolution must not depend on the working directory
+    monkeypatch.chdir(tmp_path)
+    ml.configure_model("models/stroke_model.joblib")
+    assert ml._registry.path == ml.DEFAULT_MODEL_PATH
+
+    info = ml.warm_up_model()
+    assert info["version"] == ml.get_model_version()
+    assert info["load_seconds"] >= 0
+    assert info["compiled"] is (ml.current_model().scorer is not None)
+
+
+def test_compact_artifact_round_trip_and_checksum(tmp_path):
+    scorer = ml.current_model().scorer
+    header_path, weights_path = scorer.save(tmp_path / "model.joblib", "v-test")
+
+    loaded, version = ml.CompiledScorer.load(header_path)
+    assert version == "v-test"
+    rows = [ml.patient_features(p) for p in _patients()]
+    assert loaded.predict_proba_many(rows) == pytest.approx(scorer.predict_proba_many(rows))
+
+    weights_path.write_bytes(weights_path.read_bytes()[:-8] + b"\0" * 8)
+    with pytest.raises(ValueError):
+        ml.CompiledScorer.load(header_path)
+
+
+def test_compact_artifact_is_used_only_for_its_own_bundle(tmp_path):
+    bundle_path = tmp_path / "model.joblib"
+    shutil.copy(ml.DEFAULT_MODEL_PATH, bundle_path)
+    header_path, _ = ml.current_model().scorer.save(bundle_path, "v1")
+    assert ml._model_source(bundle_path, prefer_compact=True) == header_path
+
+    # File dates do not matter, only the bundle's contents
+    os.utime(header_path, (0, 0))
+    assert ml._model_source(bundle_path, prefer_compact=True) == header_path
+
+    bundle_path.write_bytes(bundle_path.read_bytes() + b"retrained")
+    os.utime(bundle_path, (0, 0))
+    assert ml._model_source(bundle_path, prefer_compact=True) == bundle_path
+
+
+def test_compact_artifact_scores_without_sklearn():
+    code = (
+        "import sys\n"
+        "from app import ml\n"
+        "assert ml.current_model().format == 'compact'\n"
+        "ml.warm_up_model()\n"
+        "assert 'sklearn' not in sys.modules\n"
+        "assert 'pandas' not in sys.modules and 'joblib' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ml.BASE_DIR, check=True)
+
+
+def test_registry_hot_reload_swaps_atomically(tmp_path):
+    scorer = ml.current_model().scorer
+    model_path = tmp_path / "model.joblib"
+    scorer.save(model_path, "v1")
+
+    registry = ml.ModelRegistry()
+    registry.configure(model_path.with_suffix(".json"), check_interval=0.01)
+    old = registry.current()
+    assert old.version == f"v1+{scorer.digest()[:12]}"
+
+    # Deploy a new version; the next check reloads it in the background
+    time.sleep(0.02)
+    scorer.save(model_path, "v2")
+    deadline = time.monotonic() + 5
+    while not registry.current().version.startswith("v2+") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    v2 = registry.current().version
+    assert v2 == f"v2+{scorer.digest()[:12]}"
+    assert registry.status()["reloads"] == 1
+    # A request still holding the old model is unaffected
+    assert old.version.startswith("v1+") and old.scorer is not None
+
+    # A broken artifact is rejected and the active model is kept
+    model_path.with_suffix(".npy").write_bytes(b"garbage")
+    with pytest.raises(ValueError):
+        registry.reload()
+    assert registry.current().version == v2
+    assert registry.status()["last_error"]
+
+
+def test_retrain_under_the_same_tag_changes_the_version(tmp_path):
+    scorer = ml.current_model().scorer
+    model_path = tmp_path / "model.joblib"
+    scorer.save(model_path, "v1")
+    registry = ml.ModelRegistry()
+    registry.configure(model_path.with_suffix(".json"))
+    old = registry.current().version
+
+    retrained = ml.CompiledScorer(
+        scorer.numeric_features, scorer.categorical_features, scorer.categories,
+        scorer.coef * 1.01, scorer.intercept,
+    )
+    retrained.save(model_path, "v1")
+    registry.reload()
+    assert registry.current().version.startswith("v1+")
+    assert registry.current().version != old
+
+
+def test_admin_model_endpoints(logged_in_client):
+    info = logged_in_client.get("/admin/model").get_json()
+    assert info["version"] == ml.get_model_version()
+
+    response = logged_in_client.post("/admin/model/reload")
+    assert response.status_code == 200
+    assert response.get_json()["version"] == info["version"]
+    assert logged_in_client.get("/admin/status").get_json()["model"]["loaded"]
+
+    # The load balancer probe is public and shows none of it
+    anonymous = logged_in_client.application.test_client()
+    assert set(anonymous.get("/health").get_json()) == {"status", "mongo"}
+    assert anonymous.get("/admin/status").status_code != 200
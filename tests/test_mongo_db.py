@@ -0,0 +1,63 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from app import mongo_db
+
+
+@pytest.fixture
+def mock_mongo(monkeypatch):
+    created = []
+
+    def factory(*args, **kwargs):
+        client = mongomock.MongoClient(*args, **kwargs)
+        created.append((client, kwargs))
+        return client
+
+    monkeypatch.setattr(mongo_db, "MongoClient", factory)
+    mongo_db.close_mongo_client()
+    yield created
+    mongo_db.close_mongo_client()
+
+
+def test_client_is_shared_and_uses_pool_config(app, mock_mongo):
+    """
+    Every call in the same process should reuse one pooled client
+    built with the pool/timeout settings from Config.
+    """
+    app.config.update(MONGO_MAX_POOL_SIZE=7, MONGO_SERVER_SELECTION_TIMEOUT_MS=123)
+    with app.app_context():
+        first = mongo_db.get_patients_collection()
+        second = mongo_db.get_patients_collection()
+
+    assert len(mock_mongo) == 1
+    assert first.database.client is second.database.client
+    kwargs = mock_mongo[0][1]
+    assert kwargs["maxPoolSize"] == 7
+    assert kwargs["serverSelectionTimeoutMS"] == 123
+    assert kwargs["connect"] is False
+
+
+def test_client_is_rebuilt_after_fork(app, mock_mongo):
+    with app.app_context():
+        mongo_db.get_mongo_client()
+        mongo_db._reset_after_fork()
+        mongo_db.get_mongo_client()
+
+    assert len(mock_mongo) == 2
+
+
+def test_health_check_is_rate_limited(app, mock_mongo, monkeypatch):
+    pings = []
+    app.config.update(MONGO_HEALTH_CHECK_INTERVAL=60)
+    with app.app_context():
+        client = mongo_db.get_mongo_client()
+        monkeypatch.setattr(client.admin, "command", lambda name: pings.append(name))
+        mongo_db._health.update(checked_at=None)
+
+        assert mongo_db.check_mongo_health()["ok"] is True
+        assert mongo_db.check_mongo_health()["ok"] is True
+        assert len(pings) == 1
+
+        mongo_db.check_mongo_health(force=True)
+        assert len(pings) == 2
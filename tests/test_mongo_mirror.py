@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import errors
+
+from app.models import Patient
+from app.mongo_db import patient_document, tombstone_document, tombstone_request, upsert_request
+from app.mongo_mirror import MongoMirror
+
+
+@pytest.fixture
+def collection(mongo_collection):
+    return mongo_collection
+
+
+@pytest.fixture
+def mirror(app, tmp_path):
+    app.config.update(
+        MONGO_MIRROR_BATCH_SIZE=100,
+        MONGO_MIRROR_FLUSH_INTERVAL=0.05,
+        MONGO_MIRROR_MAX_RETRIES=1,
+        MONGO_MIRROR_RETRY_BACKOFF=0,
+        MONGO_MIRROR_SPILL_PATH=str(tmp_path / "spill.jsonl"),
+    )
+    m = MongoMirror(app)
+    yield m
+    m.shutdown()
+
+
+CREATED = datetime(2024, 1, 1)
+
+
+def _patient(pid, age, version=1, created_at=CREATED):
+    return Patient(id=pid, gender="Female", age=age, smoking_status="Unknown",
+                   version=version, created_at=created_at)
+
+
+def test_operations_are_coalesced_into_one_bulk_write(mirror, collection):
+    mirror.upsert(_patient(1, 40))
+    mirror.upsert(_patient(1, 41))
+    mirror.upsert(_patient(2, 50))
+    mirror.delete(_patient(2, 50))
+    mirror.flush(timeout=5)
+
+    assert len(collection.calls) == 1
+    requests, ordered = collection.calls[0]
+    assert ordered is False
+    assert requests[0] == upsert_request(patient_document(_patient(1, 41)))
+    assert requests[1]._filter == {"sql_id": 2}
+    assert _literal(requests[1])["deleted"] is True
+    stats = mirror.stats()
+    assert stats["coalesced"] == 2
+    assert stats["queue_depth"] == 0
+
+
+def test_failed_batches_spill_and_replay_first(mirror, collection):
+    collection.down = True
+    mirror.upsert(_patient(1, 40))
+    mirror.upsert(_patient(2, 50))
+    mirror.flush(timeout=5)
+
+    assert mirror.stats()["spilled_ops"] == 2
+    assert mirror.spill_path.exists()
+
+    # Mongo is back: the spilled ops are replayed with the next batch,
+    # and the newer operation for sql_id 2 wins
+    collection.down = False
+    mirror.delete(_patient(2, 50))
+    mirror.flush(timeout=5)
+
+    requests, _ = collection.calls[-1]
+    assert [r._filter for r in requests] == [{"sql_id": 1}, {"sql_id": 2}]
+    assert _literal(requests[0])["created_at"] == CREATED  # survives the JSON spill
+    assert _literal(requests[1])["deleted"] is True
+    assert not mirror.spill_path.exists()
+
+
+def test_spilled_ops_survive_a_crash_during_replay(mirror, collection, monkeypatch):
+    collection.down = True
+    mirror.upsert(_patient(1, 40))
+    mirror.flush(timeout=5)
+    assert mirror.spill_path.exists()
+
+    # The replay dies half way: the claimed file must stay on disk
+    collection.down = False
+    with monkeypatch.context() as m:
+        m.setattr(collection, "bulk_write", lambda requests, ordered=True: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            mirror._flush([])
+    leftovers = list(mirror.spill_path.parent.glob("spill.jsonl.replaying-*"))
+    assert len(leftovers) == 1
+    assert mirror.stats()["spill_pending"]
+
+    # Its owner is gone (lock released), so the next flush replays it
+    mirror._flush([])
+    requests, _ = collection.calls[-1]
+    assert [r._filter for r in requests] == [{"sql_id": 1}]
+    assert not list(mirror.spill_path.parent.glob("spill.jsonl*replaying*"))
+    assert not mirror.stats()["spill_pending"]
+
+
+# ---------------------------
+# Ordered writes
+# ---------------------------
+def _literal(request):
+    return request._doc[0]["$replaceWith"]["$cond"][1]["$literal"]
+
+
+def _evaluate(expr, doc):
+    """Just enough of MongoDB's expression language for upsert_request."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    values = [_evaluate(arg, doc) for arg in args]
+    if op == "$or":
+        return any(values)
+    if op == "$and":
+        return all(values)
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op in ("$eq", "$ne"):
+        return (values[0] == values[1]) == (op == "$eq")
+    # Missing and null sort before every number and date
+    left, right = ((v is not None, v if v is not None else 0) for v in values)
+    return left < right if op == "$lt" else left <= right
+
+
+def _apply(store, request):
+    sql_id = request._filter["sql_id"]
+    current = store.get(sql_id, {"sql_id": sql_id})
+    condition, doc, _ = request._doc[0]["$replaceWith"]["$cond"]
+    if _evaluate(condition, current):
+        store[sql_id] = doc["$literal"]
+
+
+def test_stale_operations_from_another_worker_do_not_win():
+    store = {}
+    v1, v2 = (patient_document(_patient(1, 40, version=v)) for v in (1, 2))
+    tombstone = tombstone_document(_patient(1, 40, version=2))
+
+    # An older edit arriving late is ignored
+    for doc in (v2, v1):
+        _apply(store, upsert_request(doc))
+    assert store[1]["version"] == 2
+
+    # A delete beats every version of its row: a late upsert does not revive it
+    _apply(store, tombstone_request(1, tombstone))
+    _apply(store, upsert_request(patient_document(_patient(1, 40, version=3))))
+    assert store[1]["deleted"] is True
+
+    # A new row that reused the id is newer than the tombstone
+    reused = patient_document(_patient(1, 20, created_at=CREATED + timedelta(days=1)))
+    _apply(store, upsert_request(reused))
+    assert store[1] == reused
+
+    # Documents mirrored before created_at existed are replaced
+    store[2] = {"sql_id": 2, "age": 1}
+    _apply(store, upsert_request(patient_document(_patient(2, 40, version=None))))
+    assert store[2]["age"] == 40
+
+
+def test_rejected_documents_are_dropped_not_spilled(mirror, collection, monkeypatch):
+    def reject_second(requests, ordered=True):
+        raise errors.BulkWriteError({"writeErrors": [
+            {"index": 1, "code": 121, "errmsg": "Document failed validation"},
+        ]})
+
+    monkeypatch.setattr(collection, "bulk_write", reject_second)
+    mirror.upsert(_patient(1, 40))
+    mirror.upsert(_patient(2, 50))
+    mirror.flush(timeout=5)
+
+    stats = mirror.stats()
+    assert stats["rejected_ops"] == 1
+    assert stats["flushed_ops"] == 1
+    assert stats["spilled_ops"] == 0
+    assert not mirror.spill_path.exists()
+
+
+def test_reinit_drains_through_the_old_app_and_registers_atexit_once(app, mirror, collection, monkeypatch):
+    registered = []
+    monkeypatch.setattr("app.mongo_mirror.atexit.register", registered.append)
+    mirror.flush_interval = 60  # only the shutdown flushes
+
+    mirror.upsert(_patient(1, 40))
+    assert mirror._worker_alive()
+    for _ in range(2):
+        mirror.init_app(app)
+    assert not mirror._worker_alive()
+    requests, _ = collection.calls[-1]
+    assert [r._filter for r in requests] == [{"sql_id": 1}]
+    # Registered by the fixture's MongoMirror(app), not again
+    assert registered == []
+
+    # The next operation starts a new worker
+    mirror.upsert(_patient(2, 50))
+    mirror.flush(timeout=5)
+    assert [r._filter for r in collection.calls[-1][0]] == [{"sql_id": 2}]
@@ -0,0 +1,257 @@
+import json
+import re
+
+from app import db
+from app.models import Patient
+
+
+def _add_patients(app):
+    with app.app_context():
+        for i in range(1, 26):
+            db.session.add(Patient(
+                gender="Male" if i % 2 else "Female",
+                age=float(i % 7 * 10),
+                smoking_status="smokes" if i % 3 == 0 else "never smoked",
+                stroke=(i % 5 == 0),
+                # Every fourth patient has no stored score yet
+                risk_probability=None if i % 4 == 0 else (i % 6) / 6,
+            ))
+        db.session.commit()
+
+
+def _walk(client, query):
+    ids, url = [], "/patients?page_size=4&" + query
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        ids.extend(int(i) for i in re.findall(r'href="/patients/(\d+)"', html))
+        match = re.search(r'<a href="([^"]+)">Next page</a>', html)
+        url = match.group(1).replace("&amp;", "&") if match else None
+    return ids
+
+
+def test_keyset_pages_cover_every_row_in_sort_order(db_app, logged_in_client):
+    """
+    Walking the Next links must return every matching row exactly once,
+    in the same order as a plain ORDER BY (NULLs first ascending,
+    last descending).
+    """
+    _add_patients(db_app)
+    with db_app.app_context():
+        patients = Patient.query.all()
+
+    def expected(key, reverse=False):
+        def sort_key(p):
+            value = key(p)
+            return (value is not None, value if value is not None else 0, p.id)
+        return [p.id for p in sorted(patients, key=sort_key, reverse=reverse)]
+
+    assert _walk(logged_in_client, "sort=id") == expected(lambda p: p.id)
+    assert _walk(logged_in_client, "sort=age&dir=desc") == expected(lambda p: p.age, True)
+    assert _walk(logged_in_client, "sort=risk") == expected(lambda p: p.risk_probability)
+    assert _walk(logged_in_client, "sort=risk&dir=desc") == expected(
+        lambda p: p.risk_probability, True
+    )
+
+
+def test_filters_are_applied_server_side(db_app, logged_in_client):
+    _add_patients(db_app)
+    with db_app.app_context():
+        expected = [
+            p.id for p in Patient.query.order_by(Patient.id).all()
+            if p.gender == "Male" and 20 <= p.age <= 50 and p.stroke
+            and p.risk_probability is not None and p.risk_probability >= 0.5
+        ]
+    assert expected
+
+    ids = _walk(
+        logged_in_client,
+        "gender=Male&age_min=20&age_max=50&stroke=1&risk=high",
+    )
+    assert ids == expected
+
+
+def test_list_marks_scores_from_another_model(db_app, logged_in_client):
+    from datetime import datetime
+
+    from app.ml import get_model_version
+
+    with db_app.app_context():
+        for version in (get_model_version(), "old_model+000000000000"):
+            db.session.add(Patient(gender="Male", age=40.0, risk_probability=0.3,
+                                   scored_model_version=version, scored_at=datetime.utcnow()))
+        db.session.commit()
+
+    html = logged_in_client.get("/patients").get_data(as_text=True)
+    assert html.count("(outdated)") == 1
+    assert "Scored by model old_model+000000000000" in html
+
+
+def test_invalid_cursor_is_rejected(db_app, logged_in_client):
+    assert logged_in_client.get("/patients?after=not-a-cursor").status_code == 400
+
+
+def test_exports_stream_filtered_rows(db_app, logged_in_client):
+    _add_patients(db_app)
+    with db_app.app_context():
+        smokers = [p.id for p in Patient.query.order_by(Patient.id).all()
+                   if p.smoking_status == "smokes"]
+
+    response = logged_in_client.get("/patients/export.csv?smoking_status=smokes")
+    assert response.status_code == 200
+    assert response.is_streamed
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0].startswith("id,gender,age")
+    assert "risk_probability" not in lines[0]
+    assert [int(line.split(",")[0]) for line in lines[1:]] == smokers
+
+    response = logged_in_client.get(
+        "/patients/export.ndjson?smoking_status=smokes&include_predictions=1"
+    )
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["id"] for row in rows] == smokers
+    assert "risk_probability" in rows[0]
+
+
+def _form(**overrides):
+    data = {
+        "gender": "Female", "age": "64", "hypertension": "1", "heart_disease": "0",
+        "ever_married": "Yes", "work_type": "Private", "residence_type": "Urban",
+        "avg_glucose_level": "105.5", "bmi": "27.1", "smoking_status": "smokes",
+        "stroke": "1",
+    }
+    data.update(overrides)
+    return data
+
+
+def test_crud_routes_keep_dashboard_stats_in_sync(db_app, logged_in_client, mongo_collection):
+    from app.stats import recompute_stats
+
+    logged_in_client.post("/patients/new", data=_form())
+    logged_in_client.post("/patients/new", data=_form(gender="Male", age="30", stroke="0"))
+    with db_app.app_context():
+        first = Patient.query.order_by(Patient.id).first()
+        assert first.risk_probability is not None
+        assert first.scored_model_version is not None
+
+    logged_in_client.post(f"/patients/{first.id}/edit", data=_form(age="85", stroke=""))
+    logged_in_client.post("/patients/new", data=_form(work_type="Govt_job"))
+    logged_in_client.post(f"/patients/{first.id}/delete")
+
+    with db_app.app_context():
+        assert Patient.query.count() == 2
+        assert recompute_stats(write=False) == []
+
+    html = logged_in_client.get("/dashboard").get_data(as_text=True)
+    assert "Total patients: 2" in html
+    assert "Patients with stroke: 1" in html
+    assert "Govt_job" in html
+
+    # Every write was mirrored to Mongo
+    assert len(mongo_collection.calls) == 5
+
+
+def test_patient_pages_answer_revalidation_with_304(db_app, logged_in_client, monkeypatch):
+    import app.routes as routes
+
+    logged_in_client.post("/patients/new", data=_form())
+    logged_in_client.get("/patients")  # consume the flash message
+    with db_app.app_context():
+        patient = Patient.query.first()
+        assert patient.version == 1
+    url = f"/patients/{patient.id}"
+
+    first = logged_in_client.get(url)
+    assert first.status_code == 200
+    etag, _ = first.get_etag()
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    # A revalidation is answered before any prediction is made
+    with monkeypatch.context() as patched:
+        patched.setattr(routes, "predict_for_patient", None)
+        patched.setattr(routes, "stored_prediction", None)
+        again = logged_in_client.get(url, headers={"If-None-Match": f'W/"{etag}"'})
+        assert again.status_code == 304
+        assert again.data == b""
+        since = logged_in_client.get(
+            url, headers={"If-Modified-Since": first.headers["Last-Modified"]}
+        )
+        assert since.status_code == 304
+
+    # An edit bumps the row version, so the old ETag no longer matches
+    logged_in_client.post(f"{url}/edit", data=_form(age="70"))
+    logged_in_client.get(url)  # consume the flash message
+    with db_app.app_context():
+        assert db.session.get(Patient, patient.id).version == 2
+    changed = logged_in_client.get(url, headers={"If-None-Match": f'W/"{etag}"'})
+    assert changed.status_code == 200
+    assert changed.get_etag()[0] != etag
+
+    listing = logged_in_client.get("/patients")
+    list_etag, _ = listing.get_etag()
+    assert logged_in_client.get(
+        "/patients", headers={"If-None-Match": f'W/"{list_etag}"'}
+    ).status_code == 304
+    logged_in_client.post("/patients/new", data=_form(age="20"))
+    logged_in_client.get("/dashboard")  # consume the flash message
+    assert logged_in_client.get(
+        "/patients", headers={"If-None-Match": f'W/"{list_etag}"'}
+    ).status_code == 200
+
+
+def test_recreated_row_with_a_reused_id_is_not_answered_with_304(db_app, logged_in_client):
+    logged_in_client.post("/patients/new", data=_form())
+    logged_in_client.get("/patients")  # consume the flash message
+    with db_app.app_context():
+        old_id = Patient.query.one().id
+    url = f"/patients/{old_id}"
+    etag, _ = logged_in_client.get(url).get_etag()
+
+    # SQLite hands the deleted max id to the next row, at version 1 again
+    logged_in_client.post(f"{url}/delete")
+    logged_in_client.post("/patients/new", data=_form(gender="Male", age="30"))
+    logged_in_client.get("/patients")
+    with db_app.app_context():
+        assert Patient.query.one().id == old_id
+
+    response = logged_in_client.get(url, headers={"If-None-Match": f'W/"{etag}"'})
+    assert response.status_code == 200
+    assert "Male" in response.get_data(as_text=True)
+
+
+def test_edit_reads_old_values_inside_the_write_transaction(db_app, logged_in_client, monkeypatch):
+    """
+    Another worker edits the patient after this request loaded it but
+    before it writes: the stats delta must remove the values it replaces,
+    not the stale ones loaded first.
+    """
+    from app import stats
+    from app.forms import PatientForm
+
+    logged_in_client.post("/patients/new", data=_form(age="30", stroke="0"))
+    with db_app.app_context():
+        patient_id = Patient.query.one().id
+        engine = db.engines["patients"]
+
+    def concurrent_edit():
+        with engine.begin() as conn:
+            old = conn.execute(Patient.__table__.select()).mappings().one()
+            conn.execute(Patient.__table__.update().values(age=70, stroke=True))
+            deltas = stats.new_deltas()
+            stats.remove_patient(deltas, stats.snapshot(dict(old)))
+            stats.add_patient(deltas, {**stats.snapshot(dict(old)), "age": 70, "stroke": True})
+            stats.apply_deltas(conn, deltas)
+
+    validate = PatientForm.validate_on_submit
+
+    def validate_then_race(form):
+        concurrent_edit()
+        return validate(form)
+
+    monkeypatch.setattr(PatientForm, "validate_on_submit", validate_then_race)
+    logged_in_client.post(f"/patients/{patient_id}/edit", data=_form(age="50", stroke="0"))
+
+    with db_app.app_context():
+        assert db.session.get(Patient, patient_id).age == 50
+        assert stats.recompute_stats(write=False) == []
@@ -0,0 +1,151 @@
+import re
+
+import pytest
+from sqlalchemy import event, inspect, text
+
+from app import db
+from app.models import Patient
+from app.schema import ensure_mongo_indexes, ensure_sql_schema
+
+
+def test_ensure_sql_schema_upgrades_an_old_patients_table(db_app):
+    """
+    A patients table from before the risk columns and indexes existed
+    is brought up to date, and a second run changes nothing.
+    """
+    with db_app.app_context():
+        engine = db.engines["patients"]
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE patients"))
+            conn.execute(text(
+                "CREATE TABLE patients (id INTEGER PRIMARY KEY, gender VARCHAR(20), "
+                "age FLOAT, hypertension BOOLEAN, heart_disease BOOLEAN, "
+                "ever_married VARCHAR(10), work_type VARCHAR(50), "
+                "residence_type VARCHAR(20), avg_glucose_level FLOAT, bmi FLOAT, "
+                "smoking_status VARCHAR(50), stroke BOOLEAN, created_at DATETIME NOT NULL)"
+            ))
+
+        changes = ensure_sql_schema()
+        assert "added column patients.risk_probability" in changes
+        assert "created index ix_patients_stroke_id" in changes
+        assert "created index ix_patients_gender_age_id" in changes
+
+        inspector = inspect(engine)
+        columns = {c["name"] for c in inspector.get_columns("patients")}
+        indexes = {ix["name"] for ix in inspector.get_indexes("patients")}
+        assert {c.name for c in Patient.__table__.columns} <= columns
+        assert {ix.name for ix in Patient.__table__.indexes} <= indexes
+
+        assert ensure_sql_schema() == []
+
+
+def _plans_for(app, client, urls):
+    """Run the list view and EXPLAIN every query it sends to patients.db."""
+    captured = []
+    with app.app_context():
+        engine = db.engines["patients"]
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM patients" in statement:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        for url in urls:
+            assert client.get(url).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in captured:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            plans.append((statement, " | ".join(row[-1] for row in rows)))
+    return plans
+
+
+# filter query -> its indexed column; sort key -> its column
+EQUALITY_FILTERS = {
+    "gender=Male": "gender",
+    "smoking_status=smokes": "smoking_status",
+    "stroke=1": "stroke",
+    "stroke=unknown": "stroke",
+}
+SORTS = {"id": "id", "age": "age", "risk": "risk_probability", "created_at": "created_at"}
+
+
+def _expected_index(filter_column, sort_column):
+    if filter_column is None:
+        return f"ix_patients_{sort_column}_id" if sort_column != "id" else None
+    if sort_column == "id":
+        return f"ix_patients_{filter_column}_id"
+    return f"ix_patients_{filter_column}_{sort_column}_id"
+
+
+def test_list_view_queries_use_indexes(db_app, logged_in_client):
+    with db_app.app_context():
+        for i in range(30):
+            db.session.add(Patient(gender="Male", age=float(i), stroke=bool(i % 2),
+                                   smoking_status="smokes", risk_probability=i / 30))
+        db.session.commit()
+        db.session.execute(Patient.__table__.update().where(Patient.id % 3 == 0).values(stroke=None))
+        db.session.commit()
+
+    # (query, expected index): every filter with every sort and direction
+    cases = []
+    for sort, sort_column in SORTS.items():
+        for direction in ("asc", "desc"):
+            cases.append((f"sort={sort}&dir={direction}", _expected_index(None, sort_column)))
+            for query, filter_column in EQUALITY_FILTERS.items():
+                cases.append((f"{query}&sort={sort}&dir={direction}",
+                              _expected_index(filter_column, sort_column)))
+            # A range filter sorts on its own column, whatever was asked
+            cases.append((f"age_min=5&age_max=20&sort={sort}&dir={direction}", "ix_patients_age_id"))
+            cases.append((f"risk=high&sort={sort}&dir={direction}", "ix_patients_risk_probability_id"))
+            cases.append((f"gender=Male&risk=low&sort={sort}&dir={direction}",
+                          "ix_patients_gender_risk_probability_id"))
+
+    for query, expected in cases:
+        # The first page, then the second one through its cursor
+        html = logged_in_client.get(f"/patients?page_size=3&{query}").get_data(as_text=True)
+        next_url = re.search(r'<a href="([^"]+)">Next page</a>', html)
+        assert next_url, query
+        next_url = next_url.group(1)
+        urls = [f"/patients?page_size=3&{query}", next_url.replace("&amp;", "&")]
+
+        plans = _plans_for(db_app, logged_in_client, urls)
+        assert plans, query
+        for statement, plan in plans:
+            # Never sort the whole filtered table to find one page
+            assert "TEMP B-TREE" not in plan, (query, statement, plan)
+            if expected:
+                assert re.search(rf"USING INDEX {expected}\b", plan), (query, statement, plan)
+
+
+def test_range_filters_sort_on_their_column():
+    from werkzeug.datastructures import MultiDict
+
+    from app.patient_queries import parse_listing_args
+
+    def sort_for(**args):
+        return parse_listing_args(MultiDict(args), 50, 500)[1]
+
+    assert sort_for(sort="created_at") == "created_at"
+    assert sort_for(sort="created_at", age_min="10") == "age"
+    assert sort_for(risk="high") == "risk"
+    assert sort_for(sort="risk", age_max="40") == "age"
+    assert sort_for(sort="risk", age_max="40", risk="high") == "risk"
+    assert sort_for(sort="age", gender="Male") == "age"
+
+
+def test_mongo_sql_id_index_is_unique_and_idempotent():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.patients
+
+    assert ensure_mongo_indexes(collection) == ["sql_id_unique", "tombstone_ttl"]
+    assert ensure_mongo_indexes(collection) == ["sql_id_unique", "tombstone_ttl"]
+
+    info = collection.index_information()["sql_id_unique"]
+    assert info["key"] == [("sql_id", 1)]
+    assert info["unique"] is True
+    assert collection.index_information()["tombstone_ttl"]["expireAfterSeconds"] > 0